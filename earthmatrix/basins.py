@@ -0,0 +1,170 @@
+"""
+Depression analysis, as returned by EarthMatrix.detect_basins. Borders only
+flag the strata whose points are all minimum, so a depression holding
+several of them, or a pit on a slope, is not seen as a whole. Filling the
+matrix with water that can only leave through its edges tells them apart:
+
+    basin: id of the stratum of the edge point the water of a point leaves
+    the matrix through, so the points of a basin drain together.
+    spill elevation: altitude the water rises to at a point before it spills
+    over towards the edge, the altitude of the point itself outside
+    depressions.
+    fill depth: spill elevation minus altitude, above 0 inside depressions.
+
+They are computed in a single priority-flood from the edges (Barnes et al.,
+2014): points are taken lowest first from a priority queue, and the
+neighbors of a point lower than its spill elevation are flooded at once
+from a plain stack. The queue is a heap, or an array of buckets when the
+altitudes are integers spanning a range no larger than the number of
+points, which makes the whole flood linear.
+"""
+import heapq
+from array import array
+
+from earthmatrix import EarthMatrixException
+
+BUCKET_TYPECODES = 'bBhHiIlLqQ'
+FLOAT_TYPECODES = 'fd'
+FIELDS = ('basins', 'spill_elevations', 'fill_depths')
+
+
+class BasinMap(object):
+    """
+    Basin id, spill elevation and fill depth of every point of a matrix.
+    Columns are flat row-major arrays: basins, spill_elevations and
+    fill_depths. Elevations and depths are given in the units of the
+    altitudes, i.e. scaled by resolution if the matrix quantized them.
+    """
+    def __init__(self, n_rows, n_cols, basins, spill_elevations, fill_depths,
+                 resolution=None):
+        self.n_rows = n_rows
+        self.n_cols = n_cols
+        self.basins = basins
+        self.spill_elevations = spill_elevations
+        self.fill_depths = fill_depths
+        self.resolution = resolution
+
+    def basin_at(self, x, y):
+        return self.basins[self._get_cell(x, y)]
+
+    def spill_elevation_at(self, x, y):
+        return self._scale(self.spill_elevations[self._get_cell(x, y)])
+
+    def fill_depth_at(self, x, y):
+        return self._scale(self.fill_depths[self._get_cell(x, y)])
+
+    def to_matrix(self, field):
+        """
+        :param field: 'basins', 'spill_elevations' or 'fill_depths'.
+        :return: list of lists with the field of every point.
+        """
+        if field not in FIELDS:
+            raise EarthMatrixException(
+                "'field' must be one of {0}".format(', '.join(FIELDS)))
+        values = getattr(self, field)
+        if field != 'basins' and self.resolution is not None:
+            values = [self._scale(value) for value in values]
+        return [list(values[x * self.n_cols:(x + 1) * self.n_cols])
+                for x in range(self.n_rows)]
+
+    def _get_cell(self, x, y):
+        if not (0 <= x < self.n_rows and 0 <= y < self.n_cols):
+            raise IndexError('earth point index out of range')
+        return x * self.n_cols + y
+
+    def _scale(self, value):
+        return value if self.resolution is None else value * self.resolution
+
+
+def priority_flood(altitudes, neighbor_index, seeds, seed_basins):
+    """
+    Flood a matrix from its seeds.
+    :param altitudes: flat array or memoryview of altitudes.
+    :param neighbor_index: tuple (offsets, neighbors) as returned by
+    EarthMatrix._get_neighbor_index.
+    :param seeds: cells the water leaves the matrix through.
+    :param seed_basins: basin id of each seed.
+    :return: tuple (basins, spill elevations, fill depths) of flat arrays.
+    Spill elevations keep the typecode of the altitudes, whose range they
+    never leave, while fill depths, which can span it, are unsigned 64 bit
+    integers or doubles.
+    """
+    offsets, neighbors = neighbor_index
+    typecode = memoryview(altitudes).format
+    levels = array(typecode, altitudes)
+    basins = array('i', [-1]) * len(altitudes)
+    closed = bytearray(len(altitudes))
+    queue = _make_queue(altitudes)
+    for seed, basin in zip(seeds, seed_basins):
+        if not closed[seed]:
+            closed[seed] = 1
+            basins[seed] = basin
+            queue.push(altitudes[seed], seed)
+    pit = []
+    while pit or queue:
+        cell = pit.pop() if pit else queue.pop()
+        level = levels[cell]
+        basin = basins[cell]
+        for neighbor in neighbors[offsets[cell]:offsets[cell + 1]]:
+            if closed[neighbor]:
+                continue
+            closed[neighbor] = 1
+            basins[neighbor] = basin
+            altitude = altitudes[neighbor]
+            if altitude <= level:
+                levels[neighbor] = level
+                pit.append(neighbor)
+            else:
+                queue.push(altitude, neighbor)
+    depths = array('d' if typecode in FLOAT_TYPECODES else 'Q',
+                   [level - altitude
+                    for level, altitude in zip(levels, altitudes)])
+    return basins, levels, depths
+
+
+def _make_queue(altitudes):
+    if memoryview(altitudes).format in BUCKET_TYPECODES and len(altitudes):
+        low, high = min(altitudes), max(altitudes)
+        if high - low <= len(altitudes):
+            return _BucketQueue(low, high)
+    return _HeapQueue()
+
+
+class _HeapQueue(object):
+    def __init__(self):
+        self._heap = []
+
+    def push(self, altitude, cell):
+        heapq.heappush(self._heap, (altitude, cell))
+
+    def pop(self):
+        return heapq.heappop(self._heap)[1]
+
+    def __len__(self):
+        return len(self._heap)
+
+
+class _BucketQueue(object):
+    """
+    Monotone priority queue of cells with integer altitudes in [low, high]:
+    a priority-flood never pushes a cell lower than the last one popped, so
+    the lowest non empty bucket is found by only moving forward.
+    """
+    def __init__(self, low, high):
+        self._low = low
+        self._buckets = [[] for _ in range(high - low + 1)]
+        self._current = 0
+        self._size = 0
+
+    def push(self, altitude, cell):
+        self._buckets[altitude - self._low].append(cell)
+        self._size += 1
+
+    def pop(self):
+        while not self._buckets[self._current]:
+            self._current += 1
+        self._size -= 1
+        return self._buckets[self._current].pop()
+
+    def __len__(self):
+        return self._size
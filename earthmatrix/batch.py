@@ -0,0 +1,61 @@
+"""
+Border detection over many photographs at once. Photographs with the same
+shape are stacked into a 3-dimensional array and processed together in a
+single vectorized pass, since the ndmatrix functions only look for strata
+and minimum points along the last two axes.
+"""
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from earthmatrix import EarthMatrixException
+from ndmatrix import NdEarthMatrix, border_mask, label_strata, minimum_mask
+
+
+def detect_borders_batch(photographs, workers=None, executor=None,
+                         as_array=False):
+    """
+    Determine the borders of several photographs.
+    :param photographs: iterable of lists of lists or 2-dimensional NumPy
+    arrays of altitudes.
+    :param workers: number of worker processes the groups of photographs of
+    different shapes are spread over. They are processed in this process if
+    neither workers nor executor are given.
+    :param executor: concurrent.futures executor to use instead of creating
+    one with workers processes.
+    :param as_array: return NumPy uint8 arrays instead of lists of lists.
+    :return: list with the border matrix of each photograph, in input order.
+    """
+    groups = {}
+    for position, photograph in enumerate(photographs):
+        altitudes = NdEarthMatrix._parse_points(photograph)
+        groups.setdefault(altitudes.shape, []).append((position, altitudes))
+    groups = list(groups.values())
+    stacks = [np.stack([altitudes for _, altitudes in group])
+              for group in groups]
+    if workers is not None and workers < 1:
+        raise EarthMatrixException("'workers' must be a positive number")
+    if executor is None and workers is not None and len(stacks) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            masks = list(executor.map(detect_borders_stack, stacks))
+    elif executor is not None:
+        masks = list(executor.map(detect_borders_stack, stacks))
+    else:
+        masks = [detect_borders_stack(stack) for stack in stacks]
+    results = [None] * sum(len(group) for group in groups)
+    for group, borders in zip(groups, masks):
+        for (position, _), photograph_borders in zip(group, borders):
+            results[position] = (photograph_borders if as_array
+                                 else photograph_borders.tolist())
+    return results
+
+
+def detect_borders_stack(stack):
+    """
+    Determine the borders of a stack of photographs of the same shape.
+    :param stack: 3-dimensional array of altitudes, one photograph per item
+    of its first axis.
+    :return: uint8 array of the same shape containing 1 for borders.
+    """
+    labels, n_strata = label_strata(stack)
+    return border_mask(labels, n_strata, minimum_mask(stack)).view(np.uint8)
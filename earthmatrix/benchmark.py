@@ -0,0 +1,317 @@
+"""
+Benchmarks for EarthMatrix. Run as a script:
+
+    python benchmark.py suite [--sizes 100,10000] [--output results.json]
+    python benchmark.py plateau [--size 4000]
+    python benchmark.py engines [--size 1000]
+    python benchmark.py parallel [--size 4000] [--workers 4]
+    python benchmark.py batch [--size 16] [--count 10000]
+
+The suite times EarthMatrix.__init__, EarthMatrix._compute_strata and
+EarthMatrix.detect_borders (and their NdEarthMatrix counterparts) separately
+for every synthetic terrain in PATTERNS and every size, records the peak
+memory of each run and writes the results as JSON so that runs can be
+compared. The other benchmarks print a line per measure. NumPy is needed to
+generate the terrains.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from earthmatrix import EarthMatrix
+
+DEFAULT_SIZES = (10 ** 2, 10 ** 3, 10 ** 4, 10 ** 5, 10 ** 6)
+MAX_PYTHON_CELLS = 10 ** 6
+
+
+def noise(n_rows, n_cols, seed=0, levels=4):
+    """
+    Random altitudes in [0, levels): many small strata.
+    """
+    generator = np.random.RandomState(seed)
+    return generator.randint(0, levels, size=(n_rows, n_cols))
+
+
+def plateaus(n_rows, n_cols, seed=0, blocks=8):
+    """
+    A blocks x blocks mosaic of random altitudes: few large strata.
+    """
+    generator = np.random.RandomState(seed)
+    altitudes = generator.randint(0, 100, size=(blocks, blocks))
+    rows = np.arange(n_rows) * blocks // max(n_rows, 1)
+    cols = np.arange(n_cols) * blocks // max(n_cols, 1)
+    return altitudes[np.ix_(rows, cols)]
+
+
+def terraces(n_rows, n_cols, seed=0, step=16):
+    """
+    A slope descending in diagonal steps of step points: long thin strata,
+    a single one of them a border.
+    """
+    return np.add.outer(np.arange(n_rows), np.arange(n_cols)) // step
+
+
+def checkerboard(n_rows, n_cols, seed=0):
+    """
+    Alternating altitudes: every point is a stratum, the worst case for the
+    number of strata.
+    """
+    return np.add.outer(np.arange(n_rows), np.arange(n_cols)) % 2
+
+
+def flat(n_rows, n_cols, seed=0):
+    """
+    Same altitude everywhere: a single stratum covering the whole grid.
+    """
+    return np.zeros((n_rows, n_cols), dtype=int)
+
+
+PATTERNS = {
+    'noise': noise,
+    'plateaus': plateaus,
+    'terraces': terraces,
+    'checkerboard': checkerboard,
+    'flat': flat,
+}
+
+
+def square_shape(cells):
+    """
+    Return the (n_rows, n_cols) of the square grid closest to cells points.
+    """
+    side = max(int(round(cells ** 0.5)), 1)
+    return side, side
+
+
+def bench_python(altitudes):
+    """
+    Time the stages of EarthMatrix on a photograph.
+    :return: dict of seconds per stage.
+    """
+    photograph = altitudes.tolist()
+    timings = {}
+    start = time.perf_counter()
+    matrix = EarthMatrix(photograph)
+    timings['init'] = time.perf_counter() - start
+    start = time.perf_counter()
+    matrix._compute_strata()
+    timings['compute_strata'] = time.perf_counter() - start
+    matrix = EarthMatrix(photograph)
+    start = time.perf_counter()
+    matrix.detect_borders()
+    timings['detect_borders'] = time.perf_counter() - start
+    return timings
+
+
+def bench_numpy(altitudes):
+    """
+    Time the stages of NdEarthMatrix on a photograph.
+    :return: dict of seconds per stage.
+    """
+    from ndmatrix import NdEarthMatrix, label_strata
+    timings = {}
+    start = time.perf_counter()
+    matrix = NdEarthMatrix(altitudes)
+    timings['init'] = time.perf_counter() - start
+    start = time.perf_counter()
+    label_strata(matrix._altitudes)
+    timings['compute_strata'] = time.perf_counter() - start
+    matrix = NdEarthMatrix(altitudes)
+    start = time.perf_counter()
+    matrix.detect_borders(as_array=True)
+    timings['detect_borders'] = time.perf_counter() - start
+    return timings
+
+
+ENGINES = {
+    'python': bench_python,
+    'numpy': bench_numpy,
+}
+
+
+def peak_memory(engine, altitudes):
+    """
+    Return the peak memory in bytes allocated while running the stages of
+    an engine on a photograph.
+    """
+    tracemalloc.start()
+    try:
+        engine(altitudes)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run_suite(sizes=DEFAULT_SIZES, patterns=sorted(PATTERNS),
+              engines=sorted(ENGINES), max_python_cells=MAX_PYTHON_CELLS,
+              memory=True, seed=0):
+    """
+    Benchmark every engine on every pattern and size.
+    :return: list of dicts, one per run, with the grid shape, the seconds
+    per stage and the peak memory in bytes (None if not measured).
+    """
+    results = []
+    for cells in sizes:
+        n_rows, n_cols = square_shape(cells)
+        for pattern in patterns:
+            altitudes = PATTERNS[pattern](n_rows, n_cols, seed)
+            for engine in engines:
+                if engine == 'python' and n_rows * n_cols > max_python_cells:
+                    continue
+                result = {
+                    'pattern': pattern, 'engine': engine,
+                    'rows': n_rows, 'cols': n_cols, 'cells': n_rows * n_cols}
+                result.update(ENGINES[engine](altitudes))
+                result['peak_bytes'] = (
+                    peak_memory(ENGINES[engine], altitudes) if memory
+                    else None)
+                results.append(result)
+    return results
+
+
+def environment():
+    """
+    :return: dict describing the machine the benchmarks run on.
+    """
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+
+
+def bench_plateau(size):
+    """
+    Time the stratum labeling of a single-altitude grid. This used to crash
+    with a recursion error for plateaus of more than ~1000 points.
+    """
+    matrix = EarthMatrix(flat(size, size).tolist())
+    start = time.perf_counter()
+    matrix._compute_strata()
+    elapsed = time.perf_counter() - start
+    assert len(matrix._strata) == 1
+    return elapsed
+
+
+def bench_engines(size):
+    """
+    Time detect_borders on a random photograph with EarthMatrix and with the
+    NumPy backed NdEarthMatrix.
+    :return: tuple (python seconds, numpy seconds).
+    """
+    altitudes = noise(size, size)
+    return (bench_python(altitudes)['detect_borders'],
+            bench_numpy(altitudes)['detect_borders'])
+
+
+def bench_parallel(size, max_workers):
+    """
+    Time detect_borders_parallel on a random photograph with 1 to
+    max_workers worker processes.
+    :return: list of tuples (workers, seconds).
+    """
+    from parallel import detect_borders_parallel
+    altitudes = noise(size, size)
+    timings = []
+    for workers in range(1, max_workers + 1):
+        start = time.perf_counter()
+        detect_borders_parallel(altitudes, workers, as_array=True)
+        timings.append((workers, time.perf_counter() - start))
+    return timings
+
+
+def bench_batch(size, count):
+    """
+    Time detect_borders over count random size x size photographs with a
+    loop of EarthMatrix, a loop of NdEarthMatrix and detect_borders_batch.
+    :return: tuple (python seconds, numpy seconds, batch seconds).
+    """
+    from batch import detect_borders_batch
+    from ndmatrix import NdEarthMatrix
+    photographs = [noise(size, size, seed).tolist() for seed in range(count)]
+    timings = []
+    for engine in (EarthMatrix, NdEarthMatrix):
+        start = time.perf_counter()
+        for photograph in photographs:
+            engine(photograph).detect_borders()
+        timings.append(time.perf_counter() - start)
+    start = time.perf_counter()
+    detect_borders_batch(photographs)
+    timings.append(time.perf_counter() - start)
+    return tuple(timings)
+
+
+def _parse_args(argv):
+    parser = argparse.ArgumentParser(description='EarthMatrix benchmarks.')
+    commands = parser.add_subparsers(dest='command')
+    suite = commands.add_parser('suite', help='stage timings and memory')
+    suite.add_argument(
+        '--sizes', default=','.join(str(size) for size in DEFAULT_SIZES),
+        help='comma separated numbers of points')
+    suite.add_argument(
+        '--patterns', default=','.join(sorted(PATTERNS)),
+        help='comma separated terrains among ' + ', '.join(sorted(PATTERNS)))
+    suite.add_argument(
+        '--engines', default=','.join(sorted(ENGINES)),
+        help='comma separated engines among ' + ', '.join(sorted(ENGINES)))
+    suite.add_argument(
+        '--max-python-cells', type=int, default=MAX_PYTHON_CELLS,
+        help='skip the python engine above this number of points')
+    suite.add_argument(
+        '--no-memory', action='store_true',
+        help='do not measure peak memory')
+    suite.add_argument('--output', help='JSON file, stdout if not given')
+    for name, size in (('plateau', 4000), ('engines', 1000),
+                       ('parallel', 4000), ('batch', 16)):
+        command = commands.add_parser(name)
+        command.add_argument('--size', type=int, default=size)
+    commands.choices['parallel'].add_argument(
+        '--workers', type=int, default=os.cpu_count() or 1)
+    commands.choices['batch'].add_argument('--count', type=int, default=10000)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    args = _parse_args(argv or ['suite'])
+    if args.command == 'suite':
+        results = run_suite(
+            [int(size) for size in args.sizes.split(',')],
+            args.patterns.split(','), args.engines.split(','),
+            args.max_python_cells, not args.no_memory)
+        report = json.dumps(
+            {'environment': environment(), 'results': results}, indent=2)
+        if args.output:
+            with open(args.output, 'w') as output:
+                output.write(report + '\n')
+        else:
+            print(report)
+    elif args.command == 'plateau':
+        print('plateau {0}x{0}: _compute_strata {1:.3f}s'.format(
+            args.size, bench_plateau(args.size)))
+    elif args.command == 'engines':
+        python, numpy = bench_engines(args.size)
+        print('noise {0}x{0}: python {1:.3f}s numpy {2:.3f}s ({3:.0f}x)'
+              .format(args.size, python, numpy, python / numpy))
+    elif args.command == 'parallel':
+        timings = bench_parallel(args.size, args.workers)
+        for workers, elapsed in timings:
+            print('noise {0}x{0}: {1} workers {2:.3f}s ({3:.2f}x)'.format(
+                args.size, workers, elapsed, timings[0][1] / elapsed))
+    elif args.command == 'batch':
+        python, numpy, batch = bench_batch(args.size, args.count)
+        print('{0} noise {1}x{1}: python loop {2:.3f}s numpy loop {3:.3f}s '
+              'batch {4:.3f}s'.format(
+                  args.count, args.size, python, numpy, batch))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
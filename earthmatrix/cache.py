@@ -0,0 +1,119 @@
+"""
+Content addressed cache of detect_borders results. Results are keyed by a
+hash of the raw altitude buffer of the matrix together with its item format
+and dimensions, so any two matrices with the same altitudes share an entry
+whatever object they come from.
+"""
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+from earthmatrix import NEIGHBORHOODS, WRAP_MODES
+from gridio import load_borders, save_borders
+
+
+class BorderCache(object):
+    """
+    Bounded LRU cache of border matrices, optionally backed by a directory
+    where every computed result is stored as a packed border mask file.
+    Keeps hits, misses and evictions counters. Cached matrices are returned
+    as they are, so they must not be modified by the caller.
+    """
+    def __init__(self, maxsize=128, directory=None):
+        """
+        :param maxsize: number of results kept in memory.
+        :param directory: directory of the on-disk store, if any.
+        """
+        self.maxsize = maxsize
+        self.directory = directory
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def detect_borders(self, matrix):
+        """
+        Return the borders of an EarthMatrix or NdEarthMatrix, computing them
+        only if no matrix with the same altitudes was seen before.
+        """
+        key = content_key(matrix)
+        with self._lock:
+            borders = self._entries.get(key)
+            if borders is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return borders
+        borders = self._load(key)
+        if borders is None:
+            borders = matrix.detect_borders()
+            self._save(key, borders)
+            with self._lock:
+                self.misses += 1
+        else:
+            with self._lock:
+                self.hits += 1
+        with self._lock:
+            self._entries[key] = borders
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return borders
+
+    def stats(self):
+        """
+        :return: dict with the counters and the number of cached results.
+        """
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'evictions': self.evictions, 'size': len(self._entries)}
+
+    def clear(self):
+        """
+        Forget the results kept in memory. The on-disk store is kept.
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def __contains__(self, matrix):
+        return content_key(matrix) in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.emm')
+
+    def _load(self, key):
+        if self.directory is None or not os.path.exists(self._path(key)):
+            return None
+        return load_borders(self._path(key))
+
+    def _save(self, key, borders):
+        if self.directory is None:
+            return
+        descriptor, path = tempfile.mkstemp(dir=self.directory)
+        os.close(descriptor)
+        save_borders(path, borders)
+        os.replace(path, self._path(key))
+
+
+def content_key(matrix):
+    """
+    Return the hex digest identifying the altitudes of an EarthMatrix or
+    NdEarthMatrix, and the neighborhood of an EarthMatrix if it is not the
+    default 4-connected one.
+    """
+    altitudes = memoryview(matrix._altitudes)
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update('{0}:{1}x{2}:'.format(
+        altitudes.format, matrix._n_rows, matrix._n_cols).encode('ascii'))
+    neighborhood = (getattr(matrix, '_kernel', NEIGHBORHOODS[4]),
+                    getattr(matrix, '_wrap', WRAP_MODES[False]))
+    if neighborhood != (NEIGHBORHOODS[4], WRAP_MODES[False]):
+        digest.update('{0}:{1}:'.format(*neighborhood).encode('ascii'))
+    digest.update(altitudes)
+    return digest.hexdigest()
@@ -3,95 +3,835 @@ Defines the structures EarthMatrix and EarthPoint that model areas of earth
 with a specific altitude. Also defines the algorithm
 EarthMatrix::detect_borders that detects borders inside these areas.
 """
+import time
+from array import array
+
+from strata import StrataTable
+
+NO_STRATUM = -1
+NUMERIC_FORMATS = 'bBhHiIlLqQfd'
+COMPACT_TYPECODES = 'BbHhIiq'
+NEIGHBORHOODS = {
+    4: ((0, -1), (-1, 0), (0, 1), (1, 0)),
+    8: ((0, -1), (-1, -1), (-1, 0), (-1, 1), (0, 1), (1, 1), (1, 0), (1, -1)),
+}
+WRAP_MODES = {
+    False: (False, False),
+    'rows': (True, False),
+    'cols': (False, True),
+    True: (True, True),
+}
 
 
 class EarthMatrix(object):
     """
     Represents an earth area made of earth points with a specific altitude.
+    Points are not stored as EarthPoint objects: altitude, stratum and border
+    flag of every point live in parallel flat arrays indexed by cell, i.e. by
+    x * n_cols + y, and EarthPoint views are built on demand.
     """
-    def __init__(self, points):
+    def __init__(self, points, profiler=None, connectivity=4, wrap=False,
+                 resolution=None):
         """
         :param points: matrix codified as a list of lists containing integers
-        that represent an earth point's altitude.
+        that represent an earth point's altitude. The rows may also be
+        1-dimensional buffers such as array.array objects, and the matrix a
+        2-dimensional buffer such as a NumPy array, which the matrix keeps a
+        view of instead of copying it if it is C-contiguous. The buffer is
+        shared until the first set_altitudes, which copies it so that the
+        caller's buffer is never written.
+        :param profiler: object whose record(stage, seconds, **metrics) method
+        is called after each stage of the construction and of detect_borders,
+        e.g. a profiling.StageProfiler. Nothing is measured if None.
+        :param connectivity: 4 or 8 for the points sharing a side or a side or
+        corner with a point, or a symmetric sequence of (dx, dy) offsets, to
+        define the neighbors used by both strata and minimality.
+        :param wrap: True to join the opposite edges of the matrix as in a
+        torus, 'cols' to only join its first and last columns (e.g. for a
+        global longitude grid) and 'rows' to only join its first and last
+        rows.
+        :param resolution: quantize the altitudes to integer multiples of
+        resolution, e.g. 0.1 for float readings with a 10 cm precision, so
+        that they are stored as small integers. Altitudes are read back as
+        multiples of resolution.
+
+        Altitudes given as lists are stored in the smallest array type
+        holding all of them: 8, 16 and 32 bit integers, unsigned if none is
+        negative and signed otherwise, then 64 bit integers, floats if no
+        precision is lost, doubles otherwise.
+        """
+        self._set_neighborhood(connectivity, wrap)
+        self._profiler = profiler
+        self._resolution = EarthMatrix._parse_resolution(resolution)
+        if profiler is None:
+            altitudes = EarthMatrix._parse_points(points, resolution)
+        else:
+            altitudes = self._parse_points_profiled(points, resolution)
+        self._set_altitudes(altitudes, *EarthMatrix._get_shape(points))
+
+    @classmethod
+    def from_buffer(cls, altitudes, n_rows, n_cols, profiler=None,
+                    connectivity=4, wrap=False):
+        """
+        Build a matrix over a flat buffer of altitudes in row-major order,
+        e.g. a memory-mapped file, without copying it. The buffer is shared
+        until the first set_altitudes, which copies it.
+        :param altitudes: object supporting the buffer protocol whose items
+        are numbers.
+        :param profiler, connectivity, wrap: see __init__.
+        """
+        altitudes = memoryview(altitudes)
+        if altitudes.format not in NUMERIC_FORMATS:
+            raise EarthMatrixException("'points' altitudes must be numbers")
+        if n_rows < 1:
+            raise EarthMatrixException("'points' must be a non empty list")
+        if altitudes.ndim != 1:
+            if not altitudes.c_contiguous:
+                raise EarthMatrixException(
+                    "'points' buffer must be C-contiguous")
+            altitudes = altitudes.cast('B').cast(altitudes.format)
+        if len(altitudes) != n_rows * n_cols:
+            raise EarthMatrixException(
+                "'points' buffer does not match the matrix dimensions")
+        matrix = cls.__new__(cls)
+        matrix._set_neighborhood(connectivity, wrap)
+        matrix._profiler = profiler
+        matrix._resolution = None
+        matrix._set_altitudes(altitudes, n_rows, n_cols)
+        return matrix
+
+    def _set_neighborhood(self, connectivity, wrap):
+        if isinstance(connectivity, int) and connectivity in NEIGHBORHOODS:
+            self._kernel = NEIGHBORHOODS[connectivity]
+        else:
+            self._kernel = EarthMatrix._parse_kernel(connectivity)
+        if not isinstance(wrap, (bool, str)) or wrap not in WRAP_MODES:
+            raise EarthMatrixException(
+                "'wrap' must be False, True, 'rows' or 'cols'")
+        self._wrap = WRAP_MODES[wrap]
+
+    @staticmethod
+    def _parse_kernel(connectivity):
+        """
+        Codify a custom neighborhood as a tuple of (dx, dy) offsets.
+        """
+        try:
+            kernel = tuple((int(dx), int(dy)) for dx, dy in connectivity
+                           if dx == int(dx) and dy == int(dy))
+            if len(kernel) != len(connectivity):
+                raise ValueError
+        except (TypeError, ValueError):
+            raise EarthMatrixException(
+                "'connectivity' must be 4, 8 or a list of (dx, dy) offsets")
+        if not kernel or (0, 0) in kernel:
+            raise EarthMatrixException(
+                "'connectivity' offsets must be non empty and non zero")
+        if any((-dx, -dy) not in kernel for dx, dy in kernel):
+            raise EarthMatrixException(
+                "'connectivity' offsets must be symmetric")
+        return tuple(sorted(set(kernel), key=kernel.index))
+
+    def _set_altitudes(self, altitudes, n_rows, n_cols):
+        self._altitudes = altitudes
+        self._n_rows = n_rows
+        self._n_cols = n_cols
+        self._strata_ids = None
+        self._borders = None
+        self._strata_table = None
+        self._basins = None
+        self._neighbor_offsets = None
+        self._neighbor_cells = None
+        self._strata = array('i')
+        self._free_strata = []
+        self._queried_borders = {}
+
+    @staticmethod
+    def _parse_resolution(resolution):
+        if resolution is None:
+            return None
+        try:
+            if resolution > 0 and resolution != float('inf'):
+                return resolution
+        except TypeError:
+            pass
+        raise EarthMatrixException("'resolution' must be a positive number")
+
+    @staticmethod
+    def _parse_points(points, resolution=None):
+        altitudes = EarthMatrix._codify_points(
+            EarthMatrix._validate_points(points))
+        return EarthMatrix._compact(altitudes, resolution)
+
+    def _parse_points_profiled(self, points, resolution):
+        start = time.perf_counter()
+        EarthMatrix._validate_points(points)
+        validated = time.perf_counter()
+        altitudes = EarthMatrix._compact(
+            EarthMatrix._codify_points(points), resolution)
+        parsed = time.perf_counter()
+        self._profiler.record(
+            'validate_points', validated - start, cells=len(altitudes))
+        self._profiler.record(
+            'parse_points', parsed - validated, cells=len(altitudes))
+        return altitudes
+
+    @staticmethod
+    def _get_shape(points):
+        if type(points) is list:
+            return len(points), len(points[0])
+        return memoryview(points).shape
+
+    @staticmethod
+    def _codify_points(rows):
+        """
+        Codify the altitudes as a flat array in row-major order, using 64 bit
+        integers if possible and doubles otherwise. A 2-dimensional buffer is
+        returned as a flat memoryview over it instead.
         """
-        self._points = EarthMatrix._parse_points(points)
-        self._n_rows = len(self._points)
-        self._n_cols = len(self._points[0])
-        self._strata = []
+        if type(rows) is not list:
+            view = memoryview(rows)
+            if not view.c_contiguous or not view.nbytes:
+                return memoryview(view.tobytes()).cast(view.format)
+            return view.cast('B').cast(view.format)
+        for typecode in ('q', 'd'):
+            altitudes = array(typecode)
+            try:
+                for row in rows:
+                    altitudes.fromlist(
+                        row if type(row) is list else memoryview(row).tolist())
+            except TypeError:
+                continue
+            except OverflowError:
+                raise EarthMatrixException(
+                    "'points' altitudes are out of range")
+            return altitudes
+        raise EarthMatrixException("'points' altitudes must be numbers")
 
     @staticmethod
-    def _parse_points(points):
-        points_parsed = []
-        for x, row in enumerate(EarthMatrix._validate_points(points)):
-            row_aux = []
-            for y, altitude in enumerate(row):
-                row_aux.append(EarthPoint(x, y, altitude))
-            points_parsed.append(row_aux)
-        return points_parsed
+    def _compact(altitudes, resolution=None):
+        """
+        Move altitudes parsed from lists, or quantized with resolution, to
+        the smallest array type that holds them all. Buffers are kept as
+        they are.
+        """
+        if resolution is not None:
+            altitudes = EarthMatrix._quantize(altitudes, resolution)
+        elif not isinstance(altitudes, array):
+            return altitudes
+        if not len(altitudes):
+            return altitudes
+        if altitudes.typecode == 'd':
+            try:
+                compact = array('f', altitudes)
+            except OverflowError:
+                return altitudes
+            return compact if compact == altitudes else altitudes
+        low, high = min(altitudes), max(altitudes)
+        for typecode in COMPACT_TYPECODES:
+            try:
+                array(typecode, [low, high])
+            except OverflowError:
+                continue
+            return array(typecode, altitudes)
+        return altitudes
+
+    @staticmethod
+    def _fits_float(altitude):
+        """
+        Tell whether altitude is stored in a float array without rounding.
+        """
+        try:
+            return array('f', [altitude])[0] == altitude
+        except (TypeError, OverflowError):
+            return False
+
+    @staticmethod
+    def _quantize(altitudes, resolution):
+        try:
+            return array('q', [int(round(altitude / resolution))
+                               for altitude in altitudes])
+        except OverflowError:
+            raise EarthMatrixException("'points' altitudes are out of range")
+        except ValueError:
+            raise EarthMatrixException("'points' altitudes must be numbers")
 
     @staticmethod
     def _validate_points(points):
         if type(points) is not list:
-            raise EarthMatrixException("'points' must be a list of lists")
+            EarthMatrix._validate_buffer(points, 2)
+            if not len(memoryview(points)):
+                raise EarthMatrixException("'points' must be a non empty list")
+            return points
         if not len(points):
             raise EarthMatrixException("'points' must be a non empty list")
-        if type(points[0]) is not list:
-            raise EarthMatrixException("'points' must be a list of lists")
-        dimension = len(points[0])
-        for row in points[1:]:
+        dimension = None
+        for row in points:
             if type(row) is not list:
-                raise EarthMatrixException("'points' must be a list of lists")
-            if len(row) != dimension:
+                EarthMatrix._validate_buffer(row, 1)
+            if dimension is None:
+                dimension = len(row)
+            elif len(row) != dimension:
                 raise EarthMatrixException(
                     "'points' lists must have same length")
         return points
 
-    def detect_borders(self):
+    @staticmethod
+    def _validate_buffer(points, ndim):
+        """
+        Check in constant time that points is a buffer of ndim dimensions
+        whose items are numbers.
+        """
+        try:
+            view = memoryview(points)
+        except TypeError:
+            raise EarthMatrixException("'points' must be a list of lists")
+        if view.ndim != ndim:
+            raise EarthMatrixException("'points' must be a list of lists")
+        if view.format not in NUMERIC_FORMATS:
+            raise EarthMatrixException("'points' altitudes must be numbers")
+
+    def detect_borders(self, form='matrix', window=None):
         """
         Determine whether an earth point in the matrix is a border, i. e., its
         altitude is less than the altitude of the strata it is surrounded by.
+        Strata are only computed on the first call: later calls, and calls
+        after set_altitudes, return the borders already known.
+        :param form: 'matrix', 'runs', 'coordinates' or 'bitset', see masks.
+        :param window: tuple (x0, y0, x1, y1) to only determine the borders
+        of the points with x in [x0, x1) and y in [y0, y1). Unless the borders
+        of the whole matrix are already known, only the strata touching the
+        window are computed, see is_border.
         :return: list of lists representing a matrix containing 1 if the point
-        is a border and 0 otherwise.
+        is a border and 0 otherwise, or the borders in the requested form.
         """
-        self._compute_strata()
-        for group in self._strata:
-            is_border = all(self._is_minimum(point) for point in group)
-            for point in group:
-                point.is_border = is_border
-        return self._get_border_matrix()
+        if window is not None:
+            return self._profile(
+                'border_window', self._get_window_borders, window, form)
+        self._detect()
+        if form == 'matrix':
+            return self._profile('border_matrix', self._get_border_matrix)
+        from masks import from_flags
+        return self._profile(
+            'border_' + form, from_flags, self._borders.tobytes(), form,
+            self._n_rows, self._n_cols)
+
+    def is_border(self, x, y):
+        """
+        Determine whether the point (x, y) is a border. Unless the borders of
+        the whole matrix are already known, only the stratum of the point is
+        computed, so the cost depends on the size of that stratum and not on
+        the size of the matrix. The border flags found are kept for the
+        points of the stratum, so later queries on them are free.
+        """
+        if not self._is_valid_coordinates((x, y)):
+            raise IndexError('earth point index out of range')
+        cell = x * self._n_cols + y
+        if self._borders is not None:
+            return bool(self._borders[cell])
+        return bool(self._query_border(cell))
+
+    def _get_window_borders(self, window, form):
+        try:
+            x0, y0, x1, y1 = window
+            valid = (0 <= x0 < x1 <= self._n_rows and
+                     0 <= y0 < y1 <= self._n_cols)
+        except (TypeError, ValueError):
+            valid = False
+        if not valid:
+            raise EarthMatrixException(
+                "'window' must be a non empty region of the matrix")
+        n_cols = self._n_cols
+        flags = bytearray()
+        for x in range(x0, x1):
+            if self._borders is not None:
+                flags += self._borders[x * n_cols + y0:x * n_cols + y1]
+            else:
+                flags.extend(self._query_border(cell) for cell in
+                             range(x * n_cols + y0, x * n_cols + y1))
+        from masks import from_flags
+        return from_flags(flags, form, x1 - x0, y1 - y0)
+
+    def _query_border(self, cell):
+        """
+        Return the border flag of a cell, flooding its stratum and checking
+        its minimality if no earlier query did. The neighbors of the flooded
+        cells are computed on the fly unless the neighbor index is already
+        built, so that a query never reads the whole matrix.
+        """
+        queried = self._queried_borders
+        if cell in queried:
+            return queried[cell]
+        altitudes = self._altitudes
+        altitude = altitudes[cell]
+        is_minimum = 1
+        cells = [cell]
+        seen = {cell}
+        pending = [cell]
+        while pending:
+            for neighbor in self._get_query_neighbors(pending.pop()):
+                neighbor_altitude = altitudes[neighbor]
+                if neighbor_altitude == altitude:
+                    if neighbor not in seen:
+                        seen.add(neighbor)
+                        cells.append(neighbor)
+                        pending.append(neighbor)
+                elif neighbor_altitude < altitude:
+                    is_minimum = 0
+        for flooded in cells:
+            queried[flooded] = is_minimum
+        return is_minimum
+
+    def _get_query_neighbors(self, cell):
+        if self._neighbor_offsets is not None:
+            return self._get_neighbors(cell)
+        return self._compute_neighbors(*divmod(cell, self._n_cols))
+
+    def get_strata(self):
+        """
+        Summarize the strata of the matrix, detecting its borders first if
+        needed. The table is built on the first call after each detection or
+        change of altitudes.
+        :return: strata.StrataTable with the altitude, number of points,
+        bounding box, border flag and perimeter of every stratum.
+        """
+        self._detect()
+        if self._strata_table is None:
+            self._strata_table = self._profile(
+                'strata_table', self._build_strata_table)
+        return self._strata_table
+
+    def detect_basins(self):
+        """
+        Fill the depressions of the matrix, detecting its borders first if
+        needed, with a priority-flood from its edges that shares the
+        altitudes and neighbors of border detection. Water leaves through
+        the edges that are not wrapped, or through the lowest points if the
+        matrix wraps both ways. The result is kept until set_altitudes.
+        :return: basins.BasinMap with the basin id (the stratum of the edge
+        point the water drains through), spill elevation and fill depth of
+        every point.
+        """
+        self._detect()
+        if self._basins is None:
+            self._profile('basins', self._flood_basins)
+        return self._basins
+
+    def _flood_basins(self):
+        from basins import BasinMap, priority_flood
+        seeds = self._get_outlets()
+        basins, levels, depths = priority_flood(
+            self._altitudes, self._get_neighbor_index(), seeds,
+            [self._strata_ids[cell] for cell in seeds])
+        self._basins = BasinMap(self._n_rows, self._n_cols, basins, levels,
+                                depths, self._resolution)
+
+    def _get_outlets(self):
+        """
+        Return the cells the water of the matrix leaves it through.
+        """
+        n_rows, n_cols = self._n_rows, self._n_cols
+        wrap_rows, wrap_cols = self._wrap
+        outlets = []
+        if not wrap_rows:
+            outlets.extend(range(n_cols))
+            outlets.extend(range((n_rows - 1) * n_cols, n_rows * n_cols))
+        if not wrap_cols:
+            outlets.extend(range(0, n_rows * n_cols, n_cols))
+            outlets.extend(range(n_cols - 1, n_rows * n_cols, n_cols))
+        if not outlets:
+            lowest = min(self._altitudes)
+            outlets = [cell for cell, altitude in enumerate(self._altitudes)
+                       if altitude == lowest]
+        return outlets
+
+    def stratum_at(self, x, y):
+        """
+        Return the id of the stratum the point (x, y) belongs to, detecting
+        the borders of the matrix first if needed.
+        """
+        if not self._is_valid_coordinates((x, y)):
+            raise IndexError('earth point index out of range')
+        self._detect()
+        return self._strata_ids[x * self._n_cols + y]
+
+    def _detect(self):
+        if self._borders is None:
+            is_border = self._profile('compute_strata', self._compute_strata)
+            self._profile('minimality', self._set_borders, is_border)
+            self._queried_borders = {}
+
+    def _build_strata_table(self):
+        """
+        Compute the summary of every stratum in a single pass over the rows of
+        labels.
+        """
+        n_rows, n_cols = self._n_rows, self._n_cols
+        n_strata = len(self._strata)
+        counts = array('q', [0]) * n_strata
+        min_x = array('q', [0]) * n_strata
+        min_y = array('q', [n_cols]) * n_strata
+        max_x = array('q', [0]) * n_strata
+        max_y = array('q', [0]) * n_strata
+        shared = array('q', [0]) * n_strata
+        above = None
+        for x in range(n_rows):
+            row = self._strata_ids[x * n_cols:(x + 1) * n_cols]
+            previous = NO_STRATUM
+            for y, stratum in enumerate(row):
+                if not counts[stratum]:
+                    min_x[stratum] = x
+                counts[stratum] += 1
+                max_x[stratum] = x
+                if y < min_y[stratum]:
+                    min_y[stratum] = y
+                if y > max_y[stratum]:
+                    max_y[stratum] = y
+                if stratum == previous:
+                    shared[stratum] += 1
+                if above is not None and above[y] == stratum:
+                    shared[stratum] += 1
+                previous = stratum
+            above = row
+        seeds = [cell if cell != NO_STRATUM else 0 for cell in self._strata]
+        return StrataTable(
+            array('i', self._strata_ids), n_rows, n_cols,
+            array(self._get_typecode(),
+                  [self._get_altitude(cell) for cell in seeds]),
+            counts, min_x, min_y, max_x, max_y,
+            array('b', [self._borders[cell] for cell in seeds]),
+            array('q', [4 * count - 2 * sides
+                        for count, sides in zip(counts, shared)]))
+
+    def _get_altitude(self, cell):
+        """
+        Return the altitude of a cell, scaled back from its quantized code
+        if the matrix has a resolution.
+        """
+        if self._resolution is None:
+            return self._altitudes[cell]
+        return self._altitudes[cell] * self._resolution
+
+    def _get_typecode(self):
+        """
+        Return the array typecode able to hold any altitude of the matrix.
+        """
+        if self._resolution is not None:
+            return 'd'
+        altitude_format = memoryview(self._altitudes).format
+        if altitude_format in 'fd':
+            return 'd'
+        return 'Q' if altitude_format == 'Q' else 'q'
+
+    def set_altitudes(self, altitudes):
+        """
+        Change the altitude of some earth points. If borders were already
+        detected, only the strata of the changed points and of their neighbors
+        are computed again, so the cost depends on the size of those strata
+        and not on the size of the matrix. Stratum ids of the recomputed
+        strata are reused when possible.
+        :param altitudes: dict mapping (x, y) coordinates to new altitudes.
+        :return: list of (x, y) coordinates of the points whose border flag
+        changed.
+        """
+        cells = {}
+        for coordinates, altitude in altitudes.items():
+            if not self._is_valid_coordinates(coordinates):
+                raise IndexError('earth point index out of range')
+            cells[coordinates[0] * self._n_cols + coordinates[1]] = altitude
+        try:
+            array('d', list(cells.values()))
+        except TypeError:
+            raise EarthMatrixException("'points' altitudes must be numbers")
+        if self._resolution is not None:
+            quantized = EarthMatrix._quantize(
+                list(cells.values()), self._resolution)
+            cells = dict(zip(cells, quantized))
+        self._strata_table = None
+        self._basins = None
+        if self._borders is None:
+            self._queried_borders = {}
+            for cell, altitude in cells.items():
+                self._set_altitude(cell, altitude)
+            return []
+        strata = set()
+        for cell in cells:
+            strata.add(self._strata_ids[cell])
+            strata.update(self._strata_ids[neighbor]
+                          for neighbor in self._get_neighbors(cell))
+        region = []
+        for stratum in strata:
+            region.extend(self._get_stratum_cells(stratum))
+        for cell, altitude in cells.items():
+            self._set_altitude(cell, altitude)
+        for cell in region:
+            self._strata_ids[cell] = NO_STRATUM
+        self._free_strata.extend(sorted(strata, reverse=True))
+        for stratum in strata:
+            self._strata[stratum] = NO_STRATUM
+        is_border = {}
+        for cell in region:
+            if self._strata_ids[cell] == NO_STRATUM:
+                self._init_stratum(cell)
+                is_border[self._strata_ids[cell]] = (
+                    self._transmit_stratum_to_neighbors(cell))
+        changed = []
+        for cell in region:
+            border = is_border[self._strata_ids[cell]]
+            if self._borders[cell] != border:
+                self._borders[cell] = border
+                changed.append(divmod(cell, self._n_cols))
+        return changed
+
+    def _set_altitude(self, cell, altitude):
+        """
+        Store the altitude of a cell, moving the altitudes to the smallest
+        writable array wide enough for it if needed. Altitudes borrowed from
+        a caller's buffer are copied before the first write.
+        """
+        if not isinstance(self._altitudes, array):
+            self._altitudes = array(
+                memoryview(self._altitudes).format, self._altitudes)
+        if (memoryview(self._altitudes).format != 'f' or
+                EarthMatrix._fits_float(altitude)):
+            try:
+                self._altitudes[cell] = altitude
+                return
+            except (TypeError, ValueError, OverflowError):
+                pass
+        for typecode in COMPACT_TYPECODES + 'd':
+            try:
+                altitudes = array(typecode, self._altitudes)
+                altitudes[cell] = altitude
+            except (TypeError, ValueError, OverflowError):
+                continue
+            self._altitudes = altitudes
+            return
+        raise EarthMatrixException("'points' altitudes are out of range")
+
+    def _get_stratum_cells(self, stratum):
+        """
+        Return the cells of a stratum, flooding it from its first cell.
+        """
+        offsets, neighbors = self._get_neighbor_index()
+        seed = self._strata[stratum]
+        cells = [seed]
+        seen = set(cells)
+        pending = [seed]
+        while pending:
+            cell = pending.pop()
+            for neighbor in neighbors[offsets[cell]:offsets[cell + 1]]:
+                if (neighbor not in seen and
+                        self._strata_ids[neighbor] == stratum):
+                    seen.add(neighbor)
+                    cells.append(neighbor)
+                    pending.append(neighbor)
+        return cells
+
+    def _set_borders(self, is_border):
+        """
+        Flag the points of the strata whose points are all minimum.
+        :param is_border: array telling, for each stratum, whether it is a
+        border.
+        """
+        self._borders = array(
+            'b', [is_border[stratum] for stratum in self._strata_ids])
+
+    def _profile(self, stage, function, *args):
+        """
+        Call function and, if there is a profiler, record its wall time along
+        with the metrics of the stage.
+        """
+        if self._profiler is None:
+            return function(*args)
+        start = time.perf_counter()
+        result = function(*args)
+        elapsed = time.perf_counter() - start
+        self._profiler.record(stage, elapsed, **self._get_metrics(stage))
+        return result
+
+    def _get_metrics(self, stage):
+        metrics = {'cells': len(self._altitudes)}
+        if stage == 'compute_strata':
+            sizes = array('i', [0]) * len(self._strata)
+            for stratum in self._strata_ids:
+                sizes[stratum] += 1
+            metrics['strata'] = len(self._strata)
+            metrics['largest_stratum'] = max(sizes) if sizes else 0
+            metrics['neighbor_comparisons'] = len(self._neighbor_cells)
+        elif stage == 'basins':
+            metrics['filled_cells'] = sum(
+                1 for depth in self._basins.fill_depths if depth)
+        elif stage == 'border_window':
+            metrics['queried_cells'] = len(self._queried_borders)
+        elif stage == 'minimality':
+            metrics['strata'] = len(self._strata)
+            metrics['border_strata'] = sum(
+                self._borders[cell] for cell in self._strata
+                if cell != NO_STRATUM)
+        return metrics
 
     def _compute_strata(self):
         """
-        Compute the groups of points with same altitude.
+        Compute the groups of points with same altitude. Each stratum is
+        recorded in _strata by the first cell found of it. Whether all the
+        points of a stratum are minimum is checked in the same sweep.
+        :return: array telling, for each stratum, whether it is a border.
         """
-        for row in self._points:
-            for point in row:
-                if point.stratum is None:
-                    self._init_stratum(point)
-                    self._transmit_stratum_to_neighbors(point)
+        self._strata_ids = array('i', [NO_STRATUM]) * len(self._altitudes)
+        self._strata = array('i')
+        self._free_strata = []
+        is_border = array('b')
+        for cell, stratum in enumerate(self._strata_ids):
+            if stratum == NO_STRATUM:
+                self._init_stratum(cell)
+                is_border.append(self._transmit_stratum_to_neighbors(cell))
+        return is_border
 
-    def _init_stratum(self, point):
-        point.stratum = len(self._strata)
-        self._strata.append([point])
+    def _init_stratum(self, cell):
+        if self._free_strata:
+            stratum = self._free_strata.pop()
+            self._strata[stratum] = cell
+        else:
+            stratum = len(self._strata)
+            self._strata.append(cell)
+        self._strata_ids[cell] = stratum
 
-    def _transmit_stratum_to_neighbors(self, point):
-        for neighbor in self._get_neighbors(point):
-            if point.altitude == neighbor.altitude and neighbor.stratum is None:
-                neighbor.stratum = point.stratum
-                self._strata[point.stratum].append(neighbor)
-                self._transmit_stratum_to_neighbors(neighbor)
+    def _transmit_stratum_to_neighbors(self, cell):
+        """
+        Flood the stratum of a cell to all the connected cells with same
+        altitude. Uses an explicit stack instead of recursion so that large
+        flat regions do not hit the interpreter recursion limit. The neighbors
+        of each flooded cell are read once, both to flood them and to check
+        that none is lower.
+        :return: 1 if all the flooded points are minimum, 0 otherwise.
+        """
+        altitudes = self._altitudes
+        strata_ids = self._strata_ids
+        offsets, neighbors = self._get_neighbor_index()
+        altitude = altitudes[cell]
+        stratum = strata_ids[cell]
+        is_minimum = 1
+        pending = [cell]
+        while pending:
+            cell = pending.pop()
+            for neighbor in neighbors[offsets[cell]:offsets[cell + 1]]:
+                neighbor_altitude = altitudes[neighbor]
+                if neighbor_altitude == altitude:
+                    if strata_ids[neighbor] == NO_STRATUM:
+                        strata_ids[neighbor] = stratum
+                        pending.append(neighbor)
+                elif neighbor_altitude < altitude:
+                    is_minimum = 0
+        return is_minimum
 
-    def _is_minimum(self, point):
+    def _is_minimum(self, cell):
+        altitude = self._altitudes[cell]
         return all(
-            point.altitude <= neighbor.altitude
-            for neighbor in self._get_neighbors(point))
+            altitude <= self._altitudes[neighbor]
+            for neighbor in self._get_neighbors(cell))
+
+    def _get_neighbors(self, cell):
+        offsets, neighbors = self._get_neighbor_index()
+        return neighbors[offsets[cell]:offsets[cell + 1]].tolist()
+
+    def _get_neighbor_index(self):
+        """
+        Return the neighbors of every cell as a tuple (offsets, neighbors) of
+        flat arrays: the neighbors of a cell are
+        neighbors[offsets[cell]:offsets[cell + 1]], in the order of the
+        offsets of the neighborhood. The index is built once per matrix.
+        """
+        if self._neighbor_offsets is None:
+            typecode = 'i' if len(self._altitudes) < 2 ** 31 else 'q'
+            self._neighbor_offsets = array(typecode, [0])
+            self._neighbor_cells = array(typecode)
+            wraps = any(self._wrap)
+            if not wraps and self._kernel == NEIGHBORHOODS[4]:
+                self._build_4_neighbor_index()
+            elif not wraps and self._kernel == NEIGHBORHOODS[8]:
+                self._build_8_neighbor_index()
+            else:
+                self._build_kernel_neighbor_index()
+        return self._neighbor_offsets, self._neighbor_cells
+
+    def _build_4_neighbor_index(self):
+        n_rows, n_cols = self._n_rows, self._n_cols
+        offsets, neighbors = self._neighbor_offsets, self._neighbor_cells
+        for x in range(n_rows):
+            for y in range(n_cols):
+                cell = x * n_cols + y
+                if y > 0:
+                    neighbors.append(cell - 1)
+                if x > 0:
+                    neighbors.append(cell - n_cols)
+                if y < n_cols - 1:
+                    neighbors.append(cell + 1)
+                if x < n_rows - 1:
+                    neighbors.append(cell + n_cols)
+                offsets.append(len(neighbors))
 
-    def _get_neighbors(self, point):
+    def _build_8_neighbor_index(self):
+        n_rows, n_cols = self._n_rows, self._n_cols
+        offsets, neighbors = self._neighbor_offsets, self._neighbor_cells
+        for x in range(n_rows):
+            up = x > 0
+            down = x < n_rows - 1
+            for y in range(n_cols):
+                cell = x * n_cols + y
+                left = y > 0
+                right = y < n_cols - 1
+                if left:
+                    neighbors.append(cell - 1)
+                if up:
+                    if left:
+                        neighbors.append(cell - n_cols - 1)
+                    neighbors.append(cell - n_cols)
+                    if right:
+                        neighbors.append(cell - n_cols + 1)
+                if right:
+                    neighbors.append(cell + 1)
+                if down:
+                    if right:
+                        neighbors.append(cell + n_cols + 1)
+                    neighbors.append(cell + n_cols)
+                    if left:
+                        neighbors.append(cell + n_cols - 1)
+                offsets.append(len(neighbors))
+
+    def _build_kernel_neighbor_index(self):
+        """
+        Build the neighbor index of any neighborhood and wrap mode. Offsets
+        leading to the point itself or to an already listed neighbor, which
+        happens when wrapping small matrices, are skipped.
+        """
+        offsets, neighbors = self._neighbor_offsets, self._neighbor_cells
+        for x in range(self._n_rows):
+            for y in range(self._n_cols):
+                neighbors.extend(self._compute_neighbors(x, y))
+                offsets.append(len(neighbors))
+
+    def _compute_neighbors(self, x, y):
+        """
+        Return the neighbor cells of the point (x, y) in the order of the
+        offsets of the neighborhood, without the neighbor index.
+        """
+        n_rows, n_cols = self._n_rows, self._n_cols
+        wrap_rows, wrap_cols = self._wrap
+        cell = x * n_cols + y
         neighbors = []
-        for coordinates in (point.delta(x, y)
-                            for x, y in ((0, -1), (-1, 0), (0, 1), (1, 0))):
-            if self._is_valid_coordinates(coordinates):
-                neighbors.append(self[coordinates])
+        for dx, dy in self._kernel:
+            neighbor_x, neighbor_y = x + dx, y + dy
+            if wrap_rows:
+                neighbor_x %= n_rows
+            elif not 0 <= neighbor_x < n_rows:
+                continue
+            if wrap_cols:
+                neighbor_y %= n_cols
+            elif not 0 <= neighbor_y < n_cols:
+                continue
+            neighbor = neighbor_x * n_cols + neighbor_y
+            if neighbor != cell and neighbor not in neighbors:
+                neighbors.append(neighbor)
         return neighbors
 
     def _is_valid_coordinates(self, coordinates):
@@ -99,19 +839,47 @@ class EarthMatrix(object):
                 0 <= coordinates[1] <= self._n_cols - 1)
 
     def _get_border_matrix(self):
-        return [[1 if point.is_border else 0 for point in row]
-                for row in self._points]
+        if self._borders is None:
+            return [[0] * self._n_cols for _ in range(self._n_rows)]
+        return [self._borders[x * self._n_cols:(x + 1) * self._n_cols].tolist()
+                for x in range(self._n_rows)]
+
+    def iter_border_rows(self):
+        """
+        Detect the borders of the matrix if needed and iterate over them row
+        by row, so that they can be written out without building the whole
+        border matrix.
+        :return: iterator of bytes objects with one 0 or 1 byte per point of
+        the row.
+        """
+        self._detect()
+        n_cols = self._n_cols
+        return (self._borders[x * n_cols:(x + 1) * n_cols].tobytes()
+                for x in range(self._n_rows))
+
+    def iter_lines(self):
+        """
+        Iterate over the rows of str(matrix), one string per row.
+        """
+        for x in range(self._n_rows):
+            yield '|'.join([str(self[x, y]) for y in range(self._n_cols)])
 
     def __str__(self):
-        return '\n'.join(
-            ['|'.join([str(element) for element in row])
-             for row in self._points])
+        return '\n'.join(self.iter_lines())
 
     def __repr__(self):
         return str(self)
 
     def __getitem__(self, index):
-        return self._points[index[0]][index[1]]
+        if not self._is_valid_coordinates(index):
+            raise IndexError('earth point index out of range')
+        cell = index[0] * self._n_cols + index[1]
+        stratum = (NO_STRATUM if self._strata_ids is None
+                   else self._strata_ids[cell])
+        return EarthPoint(
+            index[0], index[1], self._get_altitude(cell),
+            None if stratum == NO_STRATUM else stratum,
+            self._borders is not None and bool(self._borders[cell]))
 
 
 class EarthPoint(object):
@@ -120,6 +888,8 @@ class EarthPoint(object):
     altitude and stratum (id of the set of matrix points with same altitude to
     which it belongs).
     """
+    __slots__ = ('x', 'y', 'altitude', 'stratum', 'is_border')
+
     def __init__(self, x, y, altitude, stratum=None, is_border=False):
         self.x = x
         self.y = y
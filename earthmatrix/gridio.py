@@ -0,0 +1,275 @@
+"""
+Binary storage of photographs and border masks.
+
+Altitude grids are stored either as NumPy .npy files or in the grid format
+below, and are opened through mmap so no altitude is read until it is used
+and no per-point Python object is created:
+
+    magic 'EMGRID', byte order '<' or '>', array typecode of the altitudes
+    ('q' and 'Q' rather than the platform-sized 'l' and 'L'), rows and
+    columns as unsigned 64 bit integers, 8 padding bytes, and then the
+    altitudes in row-major order.
+
+Border masks are stored packed, one bit per point:
+
+    magic 'EMMASK', 2 padding bytes, rows and columns as unsigned 64 bit
+    integers, and then the points in row-major order, 8 per byte, the first
+    point in the most significant bit as numpy.packbits does.
+"""
+import ast
+import mmap
+import struct
+import sys
+from array import array
+
+from earthmatrix import EarthMatrix, EarthMatrixException, NUMERIC_FORMATS
+from masks import from_flags, to_flags
+
+GRID_MAGIC = b'EMGRID'
+MASK_MAGIC = b'EMMASK'
+NPY_MAGIC = b'\x93NUMPY'
+_GRID_HEADER = struct.Struct('<6scc2Q8x')
+_MASK_HEADER = struct.Struct('<6s2x2Q')
+_BYTE_ORDERS = {'little': b'<', 'big': b'>'}
+_FIXED_TYPECODES = {
+    ('l', 4): 'i', ('L', 4): 'I', ('l', 8): 'q', ('L', 8): 'Q'}
+_NPY_FORMATS = {
+    'i1': 'b', 'u1': 'B', 'i2': 'h', 'u2': 'H', 'i4': 'i', 'u4': 'I',
+    'i8': 'q', 'u8': 'Q', 'f4': 'f', 'f8': 'd'}
+
+
+def save_grid(path, points):
+    """
+    Write a photograph in the grid format.
+    :param points: list of lists of altitudes or a 2-dimensional object
+    supporting the buffer protocol, e.g. a NumPy array, written in the byte
+    order of the machine whatever its own.
+    """
+    header, altitudes = _codify_grid(points)
+    with open(path, 'wb') as output:
+        output.write(header)
+        output.write(altitudes)
+
+
+def dumps_grid(points):
+    """
+    Return a photograph codified in the grid format, see save_grid.
+    """
+    header, altitudes = _codify_grid(points)
+    return header + bytes(altitudes)
+
+
+def _codify_grid(points):
+    if isinstance(points, list):
+        altitudes = EarthMatrix._parse_points(points)
+        n_rows, n_cols = len(points), len(points[0])
+        typecode = altitudes.typecode
+    else:
+        altitudes = memoryview(points)
+        if altitudes.ndim != 2:
+            raise EarthMatrixException(
+                "'points' must be a 2-dimensional array")
+        n_rows, n_cols = altitudes.shape
+        typecode = altitudes.format[-1]
+        if typecode not in NUMERIC_FORMATS:
+            raise EarthMatrixException("'points' altitudes must be numbers")
+        typecode = _FIXED_TYPECODES.get(
+            (typecode, altitudes.itemsize), typecode)
+        byte_order = altitudes.format[0].replace('!', '>').encode('ascii')
+        if byte_order in b'<>' and byte_order != _BYTE_ORDERS[sys.byteorder]:
+            altitudes = array(typecode, altitudes.tobytes())
+            altitudes.byteswap()
+    header = _GRID_HEADER.pack(
+        GRID_MAGIC, _BYTE_ORDERS[sys.byteorder], typecode.encode('ascii'),
+        n_rows, n_cols)
+    return header, altitudes
+
+
+def open_grid(path):
+    """
+    Map a photograph stored in the grid or .npy formats.
+    :return: tuple (altitudes, n_rows, n_cols) where altitudes is a flat
+    memoryview over the mapped file.
+    """
+    with open(path, 'rb') as source:
+        buffer = mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ)
+    return read_grid(buffer, path)
+
+
+def read_grid(buffer, name='grid'):
+    """
+    Read a photograph in the grid or .npy formats from a buffer, e.g. the
+    body of a request, without copying it.
+    :param name: name of the buffer in error messages.
+    :return: tuple (altitudes, n_rows, n_cols) where altitudes is a flat
+    memoryview over the buffer, or over a copy with the bytes swapped if it
+    is not in the byte order of the machine.
+    """
+    if buffer[:len(NPY_MAGIC)] == NPY_MAGIC:
+        offset, typecode, swapped, shape = _read_npy_header(buffer)
+    else:
+        offset, typecode, swapped, shape = _read_grid_header(buffer)
+    n_rows, n_cols = shape
+    size = n_rows * n_cols * struct.calcsize(typecode)
+    if len(buffer) < offset + size:
+        raise EarthMatrixException("'{0}' is truncated".format(name))
+    altitudes = memoryview(buffer)[offset:offset + size].cast(typecode)
+    if swapped:
+        copy = array(typecode, altitudes)
+        copy.byteswap()
+        altitudes = memoryview(copy)
+    return altitudes, n_rows, n_cols
+
+
+def load_matrix(path, **options):
+    """
+    Build an EarthMatrix over a photograph stored in the grid or .npy
+    formats without copying its altitudes.
+    :param options: profiler, connectivity and wrap of the matrix.
+    """
+    return EarthMatrix.from_buffer(*open_grid(path), **options)
+
+
+def load_array(path):
+    """
+    Return a read-only NumPy array over a photograph stored in the grid or
+    .npy formats without copying its altitudes. Requires NumPy.
+    """
+    import numpy as np
+    altitudes, n_rows, n_cols = open_grid(path)
+    return np.frombuffer(altitudes, dtype=altitudes.format).reshape(
+        n_rows, n_cols)
+
+
+def detect_grid_borders(altitudes, n_rows, n_cols):
+    """
+    Determine the borders of a photograph as returned by open_grid, with
+    NumPy if it is installed.
+    :param altitudes: flat buffer of the altitudes in row-major order.
+    :return: list of lists or NumPy uint8 array of borders.
+    """
+    try:
+        import numpy as np
+        from ndmatrix import NdEarthMatrix
+    except ImportError:
+        return EarthMatrix.from_buffer(
+            altitudes, n_rows, n_cols).detect_borders()
+    return NdEarthMatrix(np.asarray(altitudes).reshape(
+        n_rows, n_cols)).detect_borders(as_array=True)
+
+
+def save_borders(path, borders):
+    """
+    Write a border mask packed with one bit per point.
+    :param borders: list of lists of 0s and 1s as returned by detect_borders,
+    or a 2-dimensional NumPy array.
+    """
+    with open(path, 'wb') as output:
+        output.write(dumps_borders(borders))
+
+
+def load_borders(path):
+    """
+    Read a border mask written by save_borders.
+    :return: list of lists of 0s and 1s.
+    """
+    with open(path, 'rb') as source:
+        return loads_borders(source.read(), path)
+
+
+def dumps_borders(borders):
+    """
+    Return a border mask codified as in save_borders.
+    """
+    n_rows, n_cols, packed = pack_borders(borders)
+    return mask_header(n_rows, n_cols) + packed
+
+
+def mask_header(n_rows, n_cols):
+    """
+    Return the header of a packed border mask, e.g. to write the mask after
+    it in chunks.
+    """
+    return _MASK_HEADER.pack(MASK_MAGIC, n_rows, n_cols)
+
+
+def loads_borders(data, name='border mask'):
+    """
+    Read a border mask codified by dumps_borders.
+    :param name: name of the data in error messages.
+    :return: list of lists of 0s and 1s.
+    """
+    if data[:len(MASK_MAGIC)] != MASK_MAGIC:
+        raise EarthMatrixException(
+            "'{0}' is not a border mask file".format(name))
+    _, n_rows, n_cols = _MASK_HEADER.unpack_from(data)
+    return unpack_borders(data[_MASK_HEADER.size:], n_rows, n_cols)
+
+
+def pack_borders(borders):
+    """
+    Pack a border mask with one bit per point.
+    :return: tuple (n_rows, n_cols, packed bytes).
+    """
+    if hasattr(borders, 'ndim'):
+        import numpy as np
+        n_rows, n_cols = borders.shape
+        return n_rows, n_cols, np.packbits(borders != 0, axis=None).tobytes()
+    n_rows, n_cols = len(borders), len(borders[0]) if borders else 0
+    flags = to_flags(borders, 'matrix', n_rows, n_cols)
+    return n_rows, n_cols, from_flags(flags, 'bitset', n_rows, n_cols)
+
+
+def unpack_borders(packed, n_rows, n_cols):
+    """
+    Unpack a border mask packed by pack_borders.
+    :return: list of lists of 0s and 1s.
+    """
+    flags = to_flags(packed, 'bitset', n_rows, n_cols)
+    return from_flags(flags, 'matrix', n_rows, n_cols)
+
+
+def _read_grid_header(buffer):
+    if len(buffer) < _GRID_HEADER.size or buffer[:6] != GRID_MAGIC:
+        raise EarthMatrixException('not a grid file')
+    _, byte_order, typecode, n_rows, n_cols = _GRID_HEADER.unpack_from(buffer)
+    typecode = typecode.decode('ascii')
+    if typecode not in NUMERIC_FORMATS:
+        raise EarthMatrixException("'points' altitudes must be numbers")
+    swapped = byte_order != _BYTE_ORDERS[sys.byteorder]
+    return _GRID_HEADER.size, typecode, swapped, (n_rows, n_cols)
+
+
+def _read_npy_header(buffer):
+    if len(buffer) < 10 or buffer[:len(NPY_MAGIC)] != NPY_MAGIC:
+        raise EarthMatrixException('not a .npy file')
+    major = buffer[6]
+    if major == 1:
+        length, = struct.unpack_from('<H', buffer, 8)
+        offset = 10 + length
+    elif major in (2, 3) and len(buffer) >= 12:
+        length, = struct.unpack_from('<I', buffer, 8)
+        offset = 12 + length
+    else:
+        raise EarthMatrixException('unsupported .npy header')
+    if len(buffer) < offset:
+        raise EarthMatrixException('.npy header is truncated')
+    try:
+        header = ast.literal_eval(
+            bytes(buffer[offset - length:offset]).decode('latin1'))
+        descr = header['descr']
+        fortran_order = header['fortran_order']
+        shape = tuple(int(size) for size in header['shape'])
+    except (ValueError, TypeError, SyntaxError, KeyError, MemoryError,
+            RecursionError):
+        raise EarthMatrixException('.npy header is malformed')
+    if any(size < 0 for size in shape):
+        raise EarthMatrixException('.npy header is malformed')
+    if fortran_order or len(shape) != 2:
+        raise EarthMatrixException(
+            "'points' must be a 2-dimensional C-ordered array")
+    if not isinstance(descr, str) or descr[1:] not in _NPY_FORMATS:
+        raise EarthMatrixException("'points' altitudes must be numbers")
+    swapped = descr[0] in '<>' and descr[0] != _BYTE_ORDERS[
+        sys.byteorder].decode('ascii') and descr[1:] not in ('i1', 'u1')
+    return offset, _NPY_FORMATS[descr[1:]], swapped, shape
@@ -1,21 +1,257 @@
+"""
+Command line tool detecting the borders of a photograph:
+
+    python main.py [photograph] [--engine python] [--output matrix]
+
+The photograph is read from a file, or from stdin if it is '-' or not given,
+either as text, one row per line with the altitudes separated by spaces or
+commas (a JSON list of lists works too), or in the grid or .npy binary
+formats of gridio, which are detected by their magic bytes.
+
+Borders are written to stdout row by row as they are produced, so no output
+string holding the whole matrix is ever built:
+
+    matrix: a line per row with a 0 or 1 per point separated by spaces.
+    runs: a line per row with a y:length pair per run of border points.
+    coordinates: a line with x and y per border point.
+    bitset: the packed binary border mask of gridio.dumps_borders.
+    annotated: str(EarthMatrix), a line per row with the altitude, stratum
+    and border mark of every point. Requires the python engine.
+
+With --profile the seconds spent reading, detecting and writing, and in the
+stages of the python engine (see profiling), are printed to stderr. The
+tiled engine detects the borders band by band while they are written, so
+its detection time is part of the writing time.
+"""
+import argparse
+import json
+import re
 import sys
-from earthmatrix import EarthMatrix
-
-
-def main():
-    photograph = [
-        [9, 2, 2, 2, 3, 5],
-        [9, 8, 3, 2, 4, 5],
-        [9, 7, 2, 2, 4, 3],
-        [9, 9, 2, 4, 4, 3],
-        [9, 2, 3, 4, 3, 5]]
-    matrix = EarthMatrix(photograph)
-    assert(matrix.detect_borders() == [
-        [0, 1, 1, 1, 0, 0],
-        [0, 0, 0, 1, 0, 0],
-        [0, 0, 1, 1, 0, 1],
-        [0, 0, 1, 0, 0, 1],
-        [0, 1, 0, 0, 1, 0]])
+import time
+
+from earthmatrix import EarthMatrix, EarthMatrixException
+from gridio import GRID_MAGIC, NPY_MAGIC, mask_header, open_grid, read_grid
+from masks import from_flags
+from profiling import StageProfiler
+
+ENGINES = ('python', 'numpy', 'tiled', 'parallel')
+OUTPUTS = ('matrix', 'runs', 'coordinates', 'bitset', 'annotated')
+_SEPARATOR = re.compile(r'[\s,]+')
+_FLAGS_TO_DIGITS = bytes.maketrans(b'\x00\x01', b'01')
+
+
+def read_photograph(source):
+    """
+    Read a photograph from a file or stdin.
+    :param source: path of the file, or '-' for stdin.
+    :return: tuple (points, n_rows, n_cols) where points is a list of lists
+    for text photographs and a flat memoryview of altitudes for binary ones.
+    """
+    if source == '-':
+        data = sys.stdin.buffer.read()
+        if _is_binary(data):
+            return read_grid(data, '<stdin>')
+    else:
+        with open(source, 'rb') as photograph:
+            binary = _is_binary(photograph.read(len(GRID_MAGIC)))
+        if binary:
+            return open_grid(source)
+        with open(source, 'rb') as photograph:
+            data = photograph.read()
+    points = EarthMatrix._validate_points(parse_text(data.decode('utf-8')))
+    return points, len(points), len(points[0])
+
+
+def parse_text(text):
+    """
+    Parse a text photograph, a row per line or a JSON list of lists.
+    :return: list of lists of altitudes.
+    """
+    if text.lstrip().startswith('['):
+        try:
+            return json.loads(text)
+        except ValueError:
+            raise EarthMatrixException('photograph is not valid JSON')
+    return [[_parse_number(altitude) for altitude in _SEPARATOR.split(line)]
+            for line in (line.strip(' \t,') for line in text.splitlines())
+            if line]
+
+
+def _parse_number(altitude):
+    try:
+        return int(altitude)
+    except ValueError:
+        pass
+    try:
+        return float(altitude)
+    except ValueError:
+        raise EarthMatrixException("'points' altitudes must be numbers")
+
+
+def _is_binary(data):
+    return (data[:len(GRID_MAGIC)] == GRID_MAGIC or
+            data[:len(NPY_MAGIC)] == NPY_MAGIC)
+
+
+def iter_border_rows(points, n_rows, n_cols, engine='python', workers=None,
+                     band_rows=None, profiler=None, **options):
+    """
+    Detect the borders of a photograph read by read_photograph.
+    :param engine: one of ENGINES.
+    :param workers: worker processes of the parallel engine.
+    :param band_rows: rows read at once by the tiled engine.
+    :param options: connectivity and wrap, python engine only.
+    :return: tuple (matrix, rows) where rows iterates over bytes objects
+    with one 0 or 1 byte per point of each row, and matrix is the
+    EarthMatrix of the python engine or None.
+    """
+    if engine not in ENGINES:
+        raise EarthMatrixException(
+            "'engine' must be one of {0}".format(', '.join(ENGINES)))
+    if engine == 'python':
+        if isinstance(points, list):
+            matrix = EarthMatrix(points, profiler=profiler, **options)
+        else:
+            matrix = EarthMatrix.from_buffer(
+                points, n_rows, n_cols, profiler=profiler, **options)
+        return matrix, matrix.iter_border_rows()
+    if any(value not in (None, 4, False) for value in options.values()):
+        raise EarthMatrixException(
+            "'connectivity' and 'wrap' require the python engine")
+    import numpy as np
+    if isinstance(points, list):
+        from ndmatrix import NdEarthMatrix
+        grid = NdEarthMatrix._parse_points(points)
+    else:
+        grid = np.frombuffer(points, dtype=points.format).reshape(
+            n_rows, n_cols)
+    if engine == 'numpy':
+        from ndmatrix import NdEarthMatrix
+        borders = NdEarthMatrix(grid).detect_borders(as_array=True)
+    elif engine == 'parallel':
+        from parallel import detect_borders_parallel
+        borders = detect_borders_parallel(grid, workers, as_array=True)
+    else:
+        from tiled import DEFAULT_BAND_ROWS, iter_border_bands
+        bands = iter_border_bands(grid, band_rows or DEFAULT_BAND_ROWS)
+        return None, (row.tobytes() for _, band in bands for row in band)
+    return None, (row.tobytes() for row in borders)
+
+
+def write_borders(rows, output, form, n_rows, n_cols, matrix=None):
+    """
+    Write border rows as they come.
+    :param rows: iterator of bytes objects as returned by iter_border_rows.
+    :param output: binary file, e.g. sys.stdout.buffer.
+    :param form: one of OUTPUTS.
+    :param matrix: EarthMatrix whose borders are written, required by the
+    annotated form.
+    """
+    if form == 'matrix':
+        line = bytearray(b' ' * (2 * n_cols))
+        line[-1:] = b'\n'
+        for row in rows:
+            line[0::2] = row.translate(_FLAGS_TO_DIGITS)
+            output.write(line)
+    elif form == 'runs':
+        for row in rows:
+            output.write(' '.join(
+                '{0}:{1}'.format(*run)
+                for run in from_flags(row, 'runs', 1, n_cols)[0])
+                .encode('ascii') + b'\n')
+    elif form == 'coordinates':
+        for x, row in enumerate(rows):
+            output.write(b''.join(
+                '{0} {1}\n'.format(x, y).encode('ascii')
+                for _, y in from_flags(row, 'coordinates', 1, n_cols)))
+    elif form == 'bitset':
+        output.write(mask_header(n_rows, n_cols))
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) == 8:
+                output.write(from_flags(b''.join(chunk), 'bitset', 8, n_cols))
+                chunk = []
+        if chunk:
+            output.write(from_flags(
+                b''.join(chunk), 'bitset', len(chunk), n_cols))
+    elif form == 'annotated':
+        if matrix is None:
+            raise EarthMatrixException(
+                "'annotated' output requires the python engine")
+        for line in matrix.iter_lines():
+            output.write(line.encode('utf-8') + b'\n')
+    else:
+        raise EarthMatrixException(
+            "'output' must be one of {0}".format(', '.join(OUTPUTS)))
+
+
+def _parse_args(argv):
+    parser = argparse.ArgumentParser(
+        description='Detect the borders of a photograph.')
+    parser.add_argument(
+        'photograph', nargs='?', default='-',
+        help='text, grid or .npy file, stdin if not given or -')
+    parser.add_argument('--engine', choices=ENGINES, default='python')
+    parser.add_argument(
+        '--workers', type=int, help='processes of the parallel engine')
+    parser.add_argument(
+        '--band-rows', type=int, help='rows read at once by the tiled engine')
+    parser.add_argument(
+        '--connectivity', type=int, choices=(4, 8), default=4,
+        help='python engine only')
+    parser.add_argument(
+        '--wrap', choices=('rows', 'cols', 'both'),
+        help='join opposite edges, python engine only')
+    parser.add_argument('--output', choices=OUTPUTS, default='matrix')
+    parser.add_argument(
+        '--profile', action='store_true',
+        help='print the seconds spent in each stage to stderr')
+    return parser.parse_args(argv)
+
+
+def _print_profile(profiler, stream):
+    totals = profiler.totals()
+    stages = []
+    for record in profiler.records:
+        if record['stage'] not in stages:
+            stages.append(record['stage'])
+    for stage in stages:
+        stream.write('{0:<20} {1:10.6f}s\n'.format(stage, totals[stage]))
+
+
+def main(argv=None):
+    args = _parse_args(sys.argv[1:] if argv is None else argv)
+    if args.output == 'annotated' and args.engine != 'python':
+        sys.stderr.write("error: 'annotated' output requires the python "
+                         "engine\n")
+        return 2
+    profiler = StageProfiler() if args.profile else None
+    wrap = {None: False, 'both': True}.get(args.wrap, args.wrap)
+    try:
+        start = time.perf_counter()
+        points, n_rows, n_cols = read_photograph(args.photograph)
+        if profiler is not None:
+            profiler.record('read', time.perf_counter() - start,
+                            cells=n_rows * n_cols)
+        start = time.perf_counter()
+        matrix, rows = iter_border_rows(
+            points, n_rows, n_cols, args.engine, args.workers,
+            args.band_rows, profiler, connectivity=args.connectivity,
+            wrap=wrap)
+        if profiler is not None:
+            profiler.record('detect', time.perf_counter() - start)
+        start = time.perf_counter()
+        write_borders(rows, sys.stdout.buffer, args.output, n_rows, n_cols,
+                      matrix)
+        sys.stdout.buffer.flush()
+        if profiler is not None:
+            profiler.record('write', time.perf_counter() - start)
+    except (EarthMatrixException, OSError) as error:
+        sys.stderr.write('error: {0}\n'.format(error))
+        return 1
+    if profiler is not None:
+        _print_profile(profiler, sys.stderr)
     return 0
 
 if __name__ == '__main__':
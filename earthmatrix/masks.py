@@ -0,0 +1,92 @@
+"""
+Border mask forms. detect_borders returns a dense matrix by default, which
+takes a Python int per point; on real terrain borders are a small fraction of
+the points, so these forms are usually much cheaper:
+
+    'matrix': list of lists of 0s and 1s, one list per row.
+    'runs': list with, for every row, a list of (y, length) tuples, one per
+    run of consecutive border points.
+    'coordinates': list of the (x, y) tuples of the border points in
+    row-major order.
+    'bitset': bytes with one bit per point in row-major order, the first
+    point in the most significant bit, as numpy.packbits does.
+
+All of them are produced from flags, a bytes-like object with one byte per
+point, 1 for border points and 0 otherwise, in row-major order, which is how
+the matrices store their borders, so the dense matrix is never built unless
+asked for. convert_borders turns any form into any other.
+"""
+import re
+
+from earthmatrix import EarthMatrixException
+
+FORMS = ('matrix', 'runs', 'coordinates', 'bitset')
+_RUN = re.compile(b'\x01+')
+_FLAGS_TO_BITS = bytes.maketrans(b'\x00\x01', b'01')
+_BITS_TO_FLAGS = bytes.maketrans(b'01', b'\x00\x01')
+
+
+def from_flags(flags, form, n_rows, n_cols):
+    """
+    Codify border flags in one of FORMS.
+    :param flags: bytes-like object with one 0 or 1 byte per point.
+    """
+    flags = bytes(flags)
+    if form == 'matrix':
+        return [list(flags[x * n_cols:(x + 1) * n_cols])
+                for x in range(n_rows)]
+    if form == 'runs':
+        return [[(run.start() - x * n_cols, run.end() - run.start())
+                 for run in _RUN.finditer(flags, x * n_cols,
+                                          (x + 1) * n_cols)]
+                for x in range(n_rows)]
+    if form == 'coordinates':
+        return [divmod(y, n_cols)
+                for run in _RUN.finditer(flags)
+                for y in range(run.start(), run.end())]
+    if form == 'bitset':
+        n_bytes = (len(flags) + 7) // 8
+        if not n_bytes:
+            return b''
+        bits = flags.translate(_FLAGS_TO_BITS).ljust(n_bytes * 8, b'0')
+        return int(bits, 2).to_bytes(n_bytes, 'big')
+    raise EarthMatrixException(
+        "'form' must be one of {0}".format(', '.join(FORMS)))
+
+
+def to_flags(borders, form, n_rows, n_cols):
+    """
+    Decode borders codified in one of FORMS.
+    :return: bytearray with one 0 or 1 byte per point.
+    """
+    if form == 'matrix':
+        return bytearray(b''.join(bytes(bytearray(row)) for row in borders))
+    flags = bytearray(n_rows * n_cols)
+    if form == 'runs':
+        for x, runs in enumerate(borders):
+            for y, length in runs:
+                start = x * n_cols + y
+                flags[start:start + length] = b'\x01' * length
+    elif form == 'coordinates':
+        for x, y in borders:
+            flags[x * n_cols + y] = 1
+    elif form == 'bitset':
+        if len(borders) < (len(flags) + 7) // 8:
+            raise EarthMatrixException('border mask is truncated')
+        bits = bin(int.from_bytes(b'\x01' + bytes(borders), 'big'))[3:]
+        flags[:] = bits[:len(flags)].encode('ascii').translate(
+            _BITS_TO_FLAGS)
+    else:
+        raise EarthMatrixException(
+            "'form' must be one of {0}".format(', '.join(FORMS)))
+    return flags
+
+
+def convert_borders(borders, source, target, n_rows, n_cols):
+    """
+    Convert borders from the form source to the form target.
+    """
+    if source == target:
+        return borders
+    return from_flags(to_flags(borders, source, n_rows, n_cols), target,
+                      n_rows, n_cols)
@@ -0,0 +1,213 @@
+"""
+Defines NdEarthMatrix, a NumPy backed counterpart of EarthMatrix that keeps
+the altitudes in a contiguous array and detects borders with vectorized
+operations instead of visiting earth points one at a time.
+
+The array functions minimum_mask, label_strata and border_mask work on any
+array whose last two axes are the rows and columns of a photograph.
+"""
+import numpy as np
+
+from earthmatrix import EarthMatrix, EarthMatrixException, EarthPoint
+from masks import from_flags
+from strata import StrataTable
+
+
+class NdEarthMatrix(object):
+    """
+    Represents an earth area whose altitudes are stored in a NumPy array.
+    detect_borders returns the same matrix as EarthMatrix.detect_borders.
+    """
+    def __init__(self, points):
+        """
+        :param points: matrix codified as a list of lists containing integers
+        that represent an earth point's altitude, or a 2-dimensional NumPy
+        array of altitudes.
+        """
+        self._altitudes = NdEarthMatrix._parse_points(points)
+        self._n_rows, self._n_cols = self._altitudes.shape
+        self._strata = None
+        self._borders = None
+
+    @staticmethod
+    def _parse_points(points):
+        if isinstance(points, np.ndarray):
+            if points.ndim != 2:
+                raise EarthMatrixException(
+                    "'points' must be a 2-dimensional array")
+            if not points.shape[0]:
+                raise EarthMatrixException("'points' must be a non empty list")
+        else:
+            points = np.asarray(EarthMatrix._validate_points(points))
+        if points.dtype.kind not in 'biuf':
+            raise EarthMatrixException("'points' altitudes must be numbers")
+        return np.ascontiguousarray(points)
+
+    def detect_borders(self, as_array=False, form='matrix'):
+        """
+        Determine whether an earth point in the matrix is a border, i. e., its
+        altitude is less than the altitude of the strata it is surrounded by.
+        :param as_array: return a NumPy uint8 array instead of a list of lists.
+        :param form: 'matrix', 'runs', 'coordinates' or 'bitset' (see masks)
+        if as_array is not set.
+        :return: matrix containing 1 if the point is a border and 0 otherwise.
+        """
+        self._strata, n_strata = label_strata(self._altitudes)
+        self._borders = border_mask(
+            self._strata, n_strata, minimum_mask(self._altitudes))
+        borders = self._borders.view(np.uint8)
+        if as_array:
+            return borders
+        if form == 'matrix':
+            return borders.tolist()
+        if form == 'bitset':
+            return np.packbits(borders, axis=None).tobytes()
+        return from_flags(borders.tobytes(), form, self._n_rows, self._n_cols)
+
+    def get_strata(self):
+        """
+        Summarize the strata of the matrix, detecting its borders first if
+        needed.
+        :return: strata.StrataTable, see EarthMatrix.get_strata.
+        """
+        if self._strata is None:
+            self.detect_borders(as_array=True)
+        return strata_table(self._strata, self._altitudes, self._borders)
+
+    def stratum_at(self, x, y):
+        """
+        Return the id of the stratum the point (x, y) belongs to, detecting
+        the borders of the matrix first if needed.
+        """
+        if not (0 <= x < self._n_rows and 0 <= y < self._n_cols):
+            raise IndexError('earth point index out of range')
+        if self._strata is None:
+            self.detect_borders(as_array=True)
+        return int(self._strata[x, y])
+
+    def __str__(self):
+        return '\n'.join(
+            ['|'.join([str(self[x, y]) for y in range(self._n_cols)])
+             for x in range(self._n_rows)])
+
+    def __repr__(self):
+        return str(self)
+
+    def __getitem__(self, index):
+        x, y = index
+        return EarthPoint(
+            x, y, self._altitudes[x, y].item(),
+            None if self._strata is None else int(self._strata[x, y]),
+            False if self._borders is None else bool(self._borders[x, y]))
+
+
+def minimum_mask(altitudes):
+    """
+    Return a boolean array that is True for the points that have no lower
+    neighbor, comparing each point with its 4 neighbors via shifted views.
+    """
+    mask = np.ones(altitudes.shape, dtype=bool)
+    for axis in (-2, -1):
+        head = _shifted(altitudes.ndim, axis, slice(None, -1))
+        tail = _shifted(altitudes.ndim, axis, slice(1, None))
+        mask[tail] &= altitudes[tail] <= altitudes[head]
+        mask[head] &= altitudes[head] <= altitudes[tail]
+    return mask
+
+
+def label_strata(altitudes):
+    """
+    Label the groups of connected points with same altitude.
+    :return: tuple (labels, n_strata) where labels is an array of stratum ids
+    shaped like altitudes. Strata are numbered in row-major order of their
+    first point, as EarthMatrix does.
+    """
+    index = np.arange(altitudes.size).reshape(altitudes.shape)
+    first, second = [], []
+    for axis in (-2, -1):
+        head = _shifted(altitudes.ndim, axis, slice(None, -1))
+        tail = _shifted(altitudes.ndim, axis, slice(1, None))
+        equal = altitudes[head] == altitudes[tail]
+        first.append(index[head][equal])
+        second.append(index[tail][equal])
+    parents = union_pairs(
+        altitudes.size, np.concatenate(first), np.concatenate(second))
+    roots = parents == np.arange(altitudes.size)
+    ids = np.cumsum(roots) - 1
+    return ids[parents].reshape(altitudes.shape), int(roots.sum())
+
+
+def union_pairs(size, first, second):
+    """
+    Join the sets of each pair (first[i], second[i]) of the elements
+    0..size - 1. Trees are hooked from the greater root onto the smaller one
+    and then flattened, so every element ends up pointing straight at the
+    smallest element of its set.
+    :return: array with the root of each element.
+    """
+    parents = np.arange(size)
+    while first.size:
+        first_roots = parents[first]
+        second_roots = parents[second]
+        apart = first_roots != second_roots
+        first, second = first[apart], second[apart]
+        first_roots, second_roots = first_roots[apart], second_roots[apart]
+        np.minimum.at(
+            parents, np.maximum(first_roots, second_roots),
+            np.minimum(first_roots, second_roots))
+        parents = _flatten(parents)
+    return parents
+
+
+def border_mask(labels, n_strata, minimum):
+    """
+    Return a boolean array that is True for the points of the strata whose
+    points are all minimum.
+    """
+    not_minimum = np.bincount(labels[~minimum], minlength=n_strata)
+    return (not_minimum == 0)[labels]
+
+
+def _flatten(parents):
+    while True:
+        grandparents = parents[parents]
+        if np.array_equal(grandparents, parents):
+            return parents
+        parents = grandparents
+
+
+def _shifted(ndim, axis, window):
+    index = [slice(None)] * ndim
+    index[axis] = window
+    return tuple(index)
+
+
+def strata_table(labels, altitudes, borders):
+    """
+    Summarize the strata of a photograph.
+    :param labels: 2-dimensional stratum ids as returned by label_strata.
+    :param borders: boolean array as returned by border_mask.
+    :return: strata.StrataTable.
+    """
+    n_rows, n_cols = labels.shape
+    flat = labels.ravel()
+    n_strata = int(flat.max()) + 1 if flat.size else 0
+    counts = np.bincount(flat, minlength=n_strata)
+    seeds = np.unique(flat, return_index=True)[1]
+    rows, cols = np.divmod(np.arange(flat.size), max(n_cols, 1))
+    max_x = np.zeros(n_strata, dtype=np.int64)
+    min_y = np.full(n_strata, n_cols, dtype=np.int64)
+    max_y = np.zeros(n_strata, dtype=np.int64)
+    np.maximum.at(max_x, flat, rows)
+    np.minimum.at(min_y, flat, cols)
+    np.maximum.at(max_y, flat, cols)
+    shared = np.zeros(n_strata, dtype=np.int64)
+    for axis in (-2, -1):
+        head = _shifted(2, axis, slice(None, -1))
+        tail = _shifted(2, axis, slice(1, None))
+        same = labels[head] == labels[tail]
+        shared += np.bincount(labels[head][same], minlength=n_strata)
+    return StrataTable(
+        flat.copy(), n_rows, n_cols, altitudes.ravel()[seeds], counts,
+        rows[seeds], min_y, max_x, max_y, borders.ravel()[seeds],
+        4 * counts - 2 * shared)
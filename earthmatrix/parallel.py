@@ -0,0 +1,117 @@
+"""
+Parallel border detection. The photograph is copied once into shared memory
+and split in bands of rows, one per worker process. Workers label the strata
+of their band in place (see tiled.Band); the seams between bands are then
+merged in the main process, which unifies the strata labels crossing them
+and combines their "all points minimum" flags, and the workers finally write
+the border mask of their band into shared memory too.
+"""
+import os
+
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+from earthmatrix import EarthMatrixException
+from ndmatrix import NdEarthMatrix
+from tiled import Band, SeamMerger
+
+
+def detect_borders_parallel(points, workers=None, as_array=False):
+    """
+    Determine the borders of a photograph using several processes. The
+    result is the same as NdEarthMatrix(points).detect_borders(as_array).
+    :param points: list of lists or 2-dimensional NumPy array of altitudes.
+    :param workers: number of worker processes, the number of CPUs if None.
+    :param as_array: return a NumPy uint8 array instead of a list of lists.
+    """
+    altitudes = NdEarthMatrix._parse_points(points)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers < 1:
+        raise EarthMatrixException("'workers' must be a positive number")
+    n_rows = len(altitudes)
+    band_rows = -(-n_rows // workers)
+    starts = list(range(0, n_rows, band_rows))
+    stops = [min(start + band_rows, n_rows) for start in starts]
+    label_dtype = (np.int32 if band_rows * altitudes.shape[1] < 2 ** 31
+                   else np.int64)
+    with SharedArray(altitudes.shape, altitudes.dtype) as shared_altitudes, \
+            SharedArray(altitudes.shape, label_dtype) as labels, \
+            SharedArray(altitudes.shape, np.uint8) as borders, \
+            ProcessPoolExecutor(max_workers=len(starts)) as executor:
+        shared_altitudes.array[...] = altitudes
+        n_bands = len(starts)
+        bands = list(executor.map(
+            _label_band, [shared_altitudes.spec] * n_bands,
+            [labels.spec] * n_bands, starts, stops))
+        seams = SeamMerger()
+        for band in bands:
+            seams.add_band(band)
+        flags = seams.resolve()
+        offset = 0
+        for band in bands:
+            band.flags[band.seam_labels] = flags[
+                offset:offset + len(band.seam_labels)]
+            offset += len(band.seam_labels)
+        list(executor.map(
+            _write_band, [labels.spec] * n_bands, [borders.spec] * n_bands,
+            starts, stops, [band.flags for band in bands]))
+        result = borders.array.copy()
+    return result if as_array else result.tolist()
+
+
+class SharedArray(object):
+    """
+    NumPy array in a shared memory block that worker processes can attach
+    to through its spec. The block is released when the context exits.
+    """
+    def __init__(self, shape, dtype):
+        dtype = np.dtype(dtype)
+        size = max(int(np.prod(shape)) * dtype.itemsize, 1)
+        self._memory = shared_memory.SharedMemory(create=True, size=size)
+        self.array = np.ndarray(shape, dtype=dtype, buffer=self._memory.buf)
+        self.spec = (self._memory.name, shape, dtype.str)
+
+    @staticmethod
+    def attach(spec):
+        """
+        Attach to the shared array described by spec from a worker process.
+        :return: tuple (shared memory block, array).
+        """
+        name, shape, dtype = spec
+        memory = shared_memory.SharedMemory(name=name)
+        return memory, np.ndarray(shape, dtype=dtype, buffer=memory.buf)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        del self.array
+        self._memory.close()
+        self._memory.unlink()
+
+
+def _label_band(altitudes_spec, labels_spec, start, stop):
+    altitudes_memory, altitudes = SharedArray.attach(altitudes_spec)
+    labels_memory, labels = SharedArray.attach(labels_spec)
+    try:
+        band = Band.read(altitudes, start, stop)
+        labels[start:stop] = band.labels
+    finally:
+        del altitudes, labels
+        altitudes_memory.close()
+        labels_memory.close()
+    band.labels = band.labels[[0, -1]]
+    return band
+
+
+def _write_band(labels_spec, borders_spec, start, stop, is_border):
+    labels_memory, labels = SharedArray.attach(labels_spec)
+    borders_memory, borders = SharedArray.attach(borders_spec)
+    try:
+        borders[start:stop] = is_border[labels[start:stop]]
+    finally:
+        del labels, borders
+        labels_memory.close()
+        borders_memory.close()
@@ -0,0 +1,246 @@
+"""
+Border detection over many photograph files, as a pipeline of three stages
+running at the same time so that reading and writing files hide behind the
+detection instead of adding up with it:
+
+    read: a pool of threads maps the grid or .npy files (see gridio) and
+    copies their altitudes, ahead of the detection.
+    detect: a pool of processes determines the borders of each photograph.
+    write: a thread writes each border mask as soon as it is ready, packed
+    as in gridio.save_borders.
+
+Stages are joined by bounded queues, so a slow stage makes the ones before
+it wait instead of piling up photographs in memory. Files are handed from
+one stage to the next in input order.
+
+detect_borders_files reports, for every stage, how many files went through
+it, the seconds it was busy with them and the files and points per second
+it managed; the stage with the lowest rate is the bottleneck.
+"""
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from earthmatrix import EarthMatrixException
+from gridio import detect_grid_borders, dumps_borders, open_grid
+
+DEFAULT_READERS = 4
+DEFAULT_MAX_QUEUED = 16
+MASK_SUFFIX = '.mask'
+STAGES = ('read', 'detect', 'write')
+_DONE = object()
+
+
+def detect_borders_files(paths, destination, readers=DEFAULT_READERS,
+                         workers=None, executor=None,
+                         max_queued=DEFAULT_MAX_QUEUED, profiler=None):
+    """
+    Determine the borders of photograph files and write them out.
+    :param paths: iterable of paths of grid or .npy files. It is consumed
+    as the pipeline goes, so it can be a generator over a huge directory.
+    :param destination: directory the border mask of each file is written
+    to, named after the file with the MASK_SUFFIX extension, or function
+    called with the path of each file and its packed border mask. Files
+    whose mask would have the name of an earlier one fail.
+    :param readers: number of threads reading files.
+    :param workers: number of detection processes, the number of CPUs if
+    None. With an executor, number of files it detects at a time, by which
+    the detection rates are multiplied; it is then required.
+    :param executor: concurrent.futures executor to use instead of creating
+    one with workers processes.
+    :param max_queued: number of files each stage may get ahead of the next
+    one.
+    :param profiler: object whose record(stage, seconds, **metrics) method
+    is called for every file and stage, e.g. a profiling.StageProfiler.
+    :return: dict with the number of files written, the errors of the files
+    that failed by path, the wall time in seconds and, by stage, the files,
+    busy seconds, files_per_second and cells_per_second of the stage.
+    """
+    if readers < 1 or max_queued < 1:
+        raise EarthMatrixException(
+            "'readers' and 'max_queued' must be positive numbers")
+    if executor is not None and workers is None:
+        raise EarthMatrixException(
+            "'workers' is required with an 'executor'")
+    write = destination
+    if not callable(destination):
+        write = _DirectoryWriter(destination)
+    report = _Report(profiler)
+    start = time.perf_counter()
+    owns_executor = executor is None
+    if owns_executor:
+        workers = workers or os.cpu_count() or 1
+        executor = ProcessPoolExecutor(max_workers=workers)
+    decoded = queue.Queue(max_queued)
+    detected = queue.Queue(max_queued)
+    stop = threading.Event()
+    with ThreadPoolExecutor(readers) as reader_pool:
+        feeder = threading.Thread(
+            target=_feed, args=(paths, reader_pool, decoded, stop, report))
+        writer = threading.Thread(
+            target=_write_all, args=(detected, write, report))
+        feeder.daemon = writer.daemon = True
+        feeder.start()
+        writer.start()
+        try:
+            _dispatch(decoded, detected, executor, report)
+        finally:
+            stop.set()
+            _put(detected, _DONE)
+            writer.join()
+            feeder.join()
+            if owns_executor:
+                executor.shutdown()
+    return report.summarize(
+        time.perf_counter() - start,
+        {'read': readers, 'detect': workers, 'write': 1})
+
+
+class _DirectoryWriter(object):
+    """
+    Writes the masks to a directory, refusing to overwrite the mask of
+    another file of the run with the same name.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        self._written = {}
+
+    def __call__(self, path, mask):
+        name = os.path.splitext(os.path.basename(path))[0] + MASK_SUFFIX
+        if name in self._written:
+            raise EarthMatrixException(
+                "'{0}' is already the mask of '{1}'".format(
+                    name, self._written[name]))
+        self._written[name] = path
+        with open(os.path.join(self.directory, name), 'wb') as output:
+            output.write(mask)
+
+
+class _Report(object):
+    """
+    Counters of the stages, updated from their threads.
+    """
+    def __init__(self, profiler):
+        self.profiler = profiler
+        self.errors = {}
+        self._stages = dict((stage, [0, 0.0, 0]) for stage in STAGES)
+        self._lock = threading.Lock()
+
+    def record(self, stage, seconds, cells):
+        with self._lock:
+            counters = self._stages[stage]
+            counters[0] += 1
+            counters[1] += seconds
+            counters[2] += cells
+        if self.profiler is not None:
+            self.profiler.record(stage, seconds, cells=cells)
+
+    def fail(self, path, error):
+        with self._lock:
+            self.errors[path] = str(error)
+
+    def summarize(self, seconds, concurrency):
+        """
+        :param concurrency: number of files each stage works on at a time,
+        by which the rate of a busy stage is multiplied.
+        """
+        stages = {}
+        for stage, (files, busy, cells) in self._stages.items():
+            rate = concurrency[stage] / busy if busy else 0.0
+            stages[stage] = {
+                'files': files, 'seconds': busy,
+                'files_per_second': files * rate,
+                'cells_per_second': cells * rate}
+        return {'files': self._stages['write'][0], 'errors': self.errors,
+                'seconds': seconds, 'stages': stages}
+
+
+def _feed(paths, reader_pool, decoded, stop, report):
+    """
+    Submit the files to the readers, at most decoded's size ahead of the
+    detection.
+    """
+    try:
+        for path in paths:
+            if not _put(decoded, (path, reader_pool.submit(
+                    _read, path, report)), stop):
+                return
+    except Exception as error:
+        report.fail('<paths>', error)
+    _put(decoded, _DONE, stop)
+
+
+def _read(path, report):
+    start = time.perf_counter()
+    altitudes, n_rows, n_cols = open_grid(path)
+    data = altitudes.tobytes()
+    report.record('read', time.perf_counter() - start, n_rows * n_cols)
+    return data, altitudes.format, n_rows, n_cols
+
+
+def _dispatch(decoded, detected, executor, report):
+    """
+    Hand the files read, in order, to the detection processes, at most
+    detected's size ahead of the writer.
+    """
+    while True:
+        item = decoded.get()
+        if item is _DONE:
+            return
+        path, reading = item
+        try:
+            read = reading.result()
+        except Exception as error:
+            report.fail(path, error)
+            continue
+        detected.put((path, read[2] * read[3],
+                      executor.submit(_detect_file, *read)))
+
+
+def _detect_file(data, typecode, n_rows, n_cols):
+    """
+    Determine the borders of a file read by _read in a worker process.
+    :return: tuple (packed border mask, seconds spent).
+    """
+    start = time.perf_counter()
+    borders = detect_grid_borders(
+        memoryview(data).cast(typecode), n_rows, n_cols)
+    mask = dumps_borders(borders)
+    return mask, time.perf_counter() - start
+
+
+def _write_all(detected, write, report):
+    while True:
+        item = detected.get()
+        if item is _DONE:
+            return
+        path, cells, detection = item
+        try:
+            mask, seconds = detection.result()
+        except Exception as error:
+            report.fail(path, error)
+            continue
+        report.record('detect', seconds, cells)
+        start = time.perf_counter()
+        try:
+            write(path, mask)
+        except Exception as error:
+            report.fail(path, error)
+            continue
+        report.record('write', time.perf_counter() - start, cells)
+
+
+def _put(items, item, stop=None):
+    """
+    Put item in a bounded queue, giving up if stop is set while waiting.
+    :return: whether the item was put.
+    """
+    while stop is None or not stop.is_set():
+        try:
+            items.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
@@ -0,0 +1,75 @@
+"""
+Collects the stage timings and metrics reported by an EarthMatrix built with
+a profiler:
+
+    profiler = StageProfiler()
+    EarthMatrix(points, profiler=profiler).detect_borders()
+    print(profiler.to_json())
+
+Every record holds the stage name, its wall time in seconds and the number
+of cells of the matrix, plus the metrics known at the end of the stage:
+
+    validate_points: checking the shape and altitudes of the points.
+    parse_points: packing the altitudes in a flat array.
+    compute_strata: grouping the points of same altitude, with strata,
+    largest_stratum and neighbor_comparisons.
+    minimality: flagging the strata whose points are all minimum, with
+    strata and border_strata.
+    border_matrix: building the result of detect_borders, border_runs,
+    border_coordinates or border_bitset for its other forms.
+    border_window: detect_borders given a window, with queried_cells.
+    strata_table: building the table returned by get_strata.
+    basins: detect_basins, with filled_cells.
+"""
+import json
+import threading
+
+
+class StageProfiler(object):
+    """
+    Keeps the records reported by the matrices it is given to, and optionally
+    forwards each of them to a callback, e.g. to push it to a metrics system.
+    """
+    def __init__(self, callback=None):
+        """
+        :param callback: function called with each record dict as it is
+        reported.
+        """
+        self.callback = callback
+        self.records = []
+        self._lock = threading.Lock()
+
+    def record(self, stage, seconds, **metrics):
+        """
+        Report that stage took seconds of wall time.
+        :param metrics: counts describing the matrix at the end of the stage.
+        """
+        record = {'stage': stage, 'seconds': seconds}
+        record.update(metrics)
+        with self._lock:
+            self.records.append(record)
+        if self.callback is not None:
+            self.callback(record)
+
+    def totals(self):
+        """
+        :return: dict of the seconds spent in each stage over all records.
+        """
+        totals = {}
+        with self._lock:
+            for record in self.records:
+                totals[record['stage']] = (
+                    totals.get(record['stage'], 0.0) + record['seconds'])
+        return totals
+
+    def to_json(self):
+        """
+        :return: the records as JSON lines, one object per record.
+        """
+        with self._lock:
+            return '\n'.join(json.dumps(record, sort_keys=True)
+                             for record in self.records)
+
+    def clear(self):
+        with self._lock:
+            del self.records[:]
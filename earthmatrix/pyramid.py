@@ -0,0 +1,164 @@
+"""
+Multi-resolution border previews. A BorderPyramid keeps downsampled levels of
+a photograph, each point of level n being the minimum altitude of a
+factor ** n x factor ** n block of the photograph (min-pooling keeps the
+basins a coarse preview should show), and detects borders at any level.
+
+Previews are approximate by nature. Windows of the full resolution
+photograph, e.g. the region a user zooms into, are refined exactly: the
+strata of the window are labeled over a region grown until none of them
+crosses its edge, so the result is the same as detecting the borders of
+the whole photograph, without reading more than those strata need.
+
+Levels, level borders and refined windows are cached, so panning and
+zooming do not compute anything twice.
+"""
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from earthmatrix import EarthMatrixException
+from ndmatrix import NdEarthMatrix, border_mask, label_strata, minimum_mask
+from tiled import DEFAULT_BAND_ROWS, detect_borders_tiled
+
+
+class BorderPyramid(object):
+    """
+    Downsampled levels of a photograph and their borders. Level 0 is the
+    photograph itself.
+    """
+    def __init__(self, grid, factor=2, max_windows=64,
+                 band_rows=DEFAULT_BAND_ROWS):
+        """
+        :param grid: 2-D array-like of altitudes supporting row slicing,
+        e.g. a NumPy memmap.
+        :param factor: side of the blocks pooled into a point of the next
+        level.
+        :param max_windows: number of refined windows kept.
+        :param band_rows: number of rows read at once when pooling or
+        detecting borders of a level.
+        """
+        if factor < 2:
+            raise EarthMatrixException("'factor' must be at least 2")
+        if isinstance(grid, list):
+            grid = NdEarthMatrix._parse_points(grid)
+        if grid.ndim != 2 or not grid.size:
+            raise EarthMatrixException(
+                "'points' must be a non empty 2-dimensional array")
+        self.factor = factor
+        self.max_windows = max_windows
+        self.band_rows = band_rows
+        self._levels = [grid]
+        self._borders = {}
+        self._windows = OrderedDict()
+        self._lock = threading.RLock()
+        n_rows, n_cols = grid.shape
+        self.n_levels = 1
+        while n_rows > 1 or n_cols > 1:
+            n_rows, n_cols = -(-n_rows // factor), -(-n_cols // factor)
+            self.n_levels += 1
+
+    def get_level(self, level):
+        """
+        Return the altitudes of a level, pooling it on first use.
+        """
+        self._check_level(level)
+        with self._lock:
+            while len(self._levels) <= level:
+                self._levels.append(
+                    _min_pool(self._levels[-1], self.factor, self.band_rows))
+            return self._levels[level]
+
+    def detect_borders(self, level):
+        """
+        Determine the borders of a level.
+        :return: uint8 array with the shape of the level containing 1 for
+        borders.
+        """
+        self._check_level(level)
+        with self._lock:
+            if level not in self._borders:
+                self._borders[level] = detect_borders_tiled(
+                    self.get_level(level), band_rows=self.band_rows)
+            return self._borders[level]
+
+    def refine(self, x0, y0, x1, y1):
+        """
+        Determine the exact borders of the full resolution points with x in
+        [x0, x1) and y in [y0, y1).
+        :return: uint8 array of shape (x1 - x0, y1 - y0).
+        """
+        n_rows, n_cols = self._levels[0].shape
+        if not (0 <= x0 < x1 <= n_rows and 0 <= y0 < y1 <= n_cols):
+            raise EarthMatrixException(
+                "'window' must be a non empty region of the grid")
+        key = (x0, y0, x1, y1)
+        with self._lock:
+            if key in self._windows:
+                self._windows.move_to_end(key)
+                return self._windows[key]
+        borders = _refine(self._levels[0], x0, y0, x1, y1)
+        with self._lock:
+            self._windows[key] = borders
+            while len(self._windows) > self.max_windows:
+                self._windows.popitem(last=False)
+        return borders
+
+    def to_level(self, x, y, level):
+        """
+        Return the coordinates in a level of the full resolution point
+        (x, y).
+        """
+        scale = self.factor ** level
+        return x // scale, y // scale
+
+    def _check_level(self, level):
+        if not 0 <= level < self.n_levels:
+            raise EarthMatrixException(
+                "'level' must be between 0 and {0}".format(self.n_levels - 1))
+
+
+def _min_pool(grid, factor, band_rows):
+    """
+    Return the minimum of every factor x factor block of grid, reading it by
+    bands of rows. Blocks on the last row and column may be smaller.
+    """
+    n_rows, n_cols = grid.shape
+    band_rows = max(band_rows // factor, 1) * factor
+    pooled = []
+    for start in range(0, n_rows, band_rows):
+        band = np.asarray(grid[start:start + band_rows])
+        band = np.minimum.reduceat(
+            band, np.arange(0, len(band), factor), axis=0)
+        pooled.append(np.minimum.reduceat(
+            band, np.arange(0, n_cols, factor), axis=1))
+    return np.concatenate(pooled)
+
+
+def _refine(grid, x0, y0, x1, y1):
+    n_rows, n_cols = grid.shape
+    margin = 1
+    while True:
+        top, left = max(x0 - margin, 0), max(y0 - margin, 0)
+        bottom, right = min(x1 + margin, n_rows), min(y1 + margin, n_cols)
+        altitudes = np.asarray(grid[top:bottom, left:right])
+        labels, n_strata = label_strata(altitudes)
+        window = labels[x0 - top:x1 - top, y0 - left:y1 - left]
+        edges = []
+        if top > 0:
+            edges.append(labels[0])
+        if bottom < n_rows:
+            edges.append(labels[-1])
+        if left > 0:
+            edges.append(labels[:, 0])
+        if right < n_cols:
+            edges.append(labels[:, -1])
+        crossing = np.zeros(n_strata, dtype=bool)
+        for edge in edges:
+            crossing[edge] = True
+        if not crossing[window].any():
+            break
+        margin *= 2
+    borders = border_mask(labels, n_strata, minimum_mask(altitudes))
+    return borders[x0 - top:x1 - top, y0 - left:y1 - left].view(np.uint8)
@@ -0,0 +1,389 @@
+"""
+Asyncio front-end for border detection. The detection itself runs in a
+bounded pool of worker processes so that large photographs never block the
+event loop:
+
+    borders = await detect_borders_async(points)
+
+BorderService also backs a minimal HTTP server, run as a script:
+
+    python service.py [--host 127.0.0.1] [--port 8000] [--workers 4]
+
+which answers POST /borders requests whose body is either a JSON photograph,
+a list of lists or {"points": [[...]]}, answered with {"borders": [[...]]},
+or a photograph in the grid or .npy formats of gridio (application/
+octet-stream), answered with a packed border mask (see gridio.dumps_borders).
+
+Photographs are parsed, hashed and unpacked in threads and only awaited on
+the event loop. Identical requests in flight at the same time, recognized
+by the hash of their altitudes, are computed once and all of them get the
+result. At most max_pending requests are computed at a time,
+the following ones wait for a free slot, and requests arriving while
+max_queued are already waiting are rejected with ServiceBusyException
+(HTTP 503) so that clients back off.
+"""
+import argparse
+import asyncio
+import functools
+import hashlib
+import json
+import multiprocessing
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from cache import content_key
+from earthmatrix import EarthMatrix, EarthMatrixException
+from gridio import (
+    detect_grid_borders, dumps_borders, pack_borders, read_grid,
+    unpack_borders)
+
+DEFAULT_MAX_PENDING = 8
+DEFAULT_MAX_QUEUED = 256
+DEFAULT_MAX_BODY = 1 << 30
+JSON_TYPE = 'application/json'
+BINARY_TYPE = 'application/octet-stream'
+_REASONS = {
+    200: 'OK', 400: 'Bad Request', 404: 'Not Found',
+    405: 'Method Not Allowed', 411: 'Length Required',
+    413: 'Payload Too Large', 415: 'Unsupported Media Type',
+    500: 'Internal Server Error', 503: 'Service Unavailable'}
+
+
+class BorderService(object):
+    """
+    Computes border matrices in worker processes on behalf of coroutines,
+    coalescing identical requests and bounding the work in progress.
+    Keeps submitted (computations started) and coalesced (requests answered
+    by a computation already in progress) counters.
+    """
+    def __init__(self, workers=None, executor=None,
+                 max_pending=DEFAULT_MAX_PENDING,
+                 max_queued=DEFAULT_MAX_QUEUED):
+        """
+        :param workers: number of worker processes, the number of CPUs if
+        None.
+        :param executor: concurrent.futures executor to use instead of
+        creating a process pool with workers processes.
+        :param max_pending: number of requests computed at a time.
+        :param max_queued: number of requests waiting for a computation slot
+        above which new requests are rejected.
+        """
+        self.workers = workers
+        self.max_pending = max_pending
+        self.max_queued = max_queued
+        self.submitted = 0
+        self.coalesced = 0
+        self._executor = executor
+        self._owns_executor = executor is None
+        self._inflight = {}
+        self._slots = None
+        self._queued = 0
+        self._running = 0
+
+    async def detect_borders(self, points):
+        """
+        Determine the borders of a photograph.
+        :param points: list of lists of altitudes or 2-dimensional object
+        supporting the buffer protocol, e.g. a NumPy array.
+        :return: list of lists containing 1 for borders and 0 otherwise.
+        """
+        key, arguments = await asyncio.to_thread(_prepare_points, points)
+        n_rows, n_cols, packed = await self._submit(
+            key, _detect_packed, *arguments)
+        return await asyncio.to_thread(unpack_borders, packed, n_rows, n_cols)
+
+    async def handle(self, body, content_type):
+        """
+        Answer the body of a request.
+        :param content_type: JSON_TYPE or BINARY_TYPE.
+        :return: tuple (content type, body) of the response.
+        """
+        if content_type == JSON_TYPE:
+            function = _detect_json
+        elif content_type == BINARY_TYPE:
+            function = _detect_grid
+        else:
+            raise UnsupportedMediaException(
+                "'{0}' requests are not supported".format(content_type))
+        key = await asyncio.to_thread(_body_key, content_type, body)
+        return content_type, await self._submit(key, function, body)
+
+    def stats(self):
+        """
+        :return: dict with the counters and the requests in progress.
+        """
+        return {'submitted': self.submitted, 'coalesced': self.coalesced,
+                'inflight': len(self._inflight), 'queued': self._queued}
+
+    def close(self):
+        """
+        Shut down the worker processes if they were created by the service.
+        """
+        if self._owns_executor and self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+    async def _submit(self, key, function, *args):
+        """
+        Run function(*args) in the executor unless a computation with the
+        same key is already in progress, in which case wait for its result.
+        The computation runs in its own task, cancelled only once every
+        request waiting for it is cancelled.
+        """
+        shared = self._inflight.get(key)
+        if shared is not None:
+            self.coalesced += 1
+        else:
+            free = self.max_pending - self._running
+            if self._queued - free >= self.max_queued:
+                raise ServiceBusyException('too many requests in progress')
+            shared = self._inflight[key] = _SharedComputation()
+            self._queued += 1
+            shared.task = asyncio.ensure_future(
+                self._compute(shared, function, *args))
+            shared.task.add_done_callback(
+                functools.partial(self._forget, key, shared))
+        shared.waiters += 1
+        try:
+            return await asyncio.shield(shared.task)
+        except asyncio.CancelledError:
+            shared.waiters -= 1
+            if not shared.waiters:
+                shared.task.cancel()
+                self._forget(key, shared)
+            raise
+
+    async def _compute(self, shared, function, *args):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_pending)
+        try:
+            await self._slots.acquire()
+        finally:
+            self._dequeue(shared)
+        self._running += 1
+        try:
+            self.submitted += 1
+            return await asyncio.get_running_loop().run_in_executor(
+                self._get_executor(), function, *args)
+        finally:
+            self._running -= 1
+            self._slots.release()
+
+    def _dequeue(self, shared):
+        if shared.queued:
+            shared.queued = False
+            self._queued -= 1
+
+    def _forget(self, key, shared, task=None):
+        """
+        Stop coalescing requests with a computation that is over or
+        cancelled.
+        """
+        if self._inflight.get(key) is shared:
+            del self._inflight[key]
+        self._dequeue(shared)
+        if task is not None and not task.cancelled():
+            task.exception()
+
+    def _get_executor(self):
+        """
+        Create the worker processes on first use, from a fork server where
+        there is one: forked straight from the server they would inherit
+        its sockets and keep connections open after it closes them.
+        """
+        if self._executor is None:
+            context = None
+            if 'forkserver' in multiprocessing.get_all_start_methods():
+                context = multiprocessing.get_context('forkserver')
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=context)
+        return self._executor
+
+
+class _SharedComputation(object):
+    """
+    Task computing the result of a request, number of requests waiting for
+    it and whether it still waits for a computation slot.
+    """
+    def __init__(self):
+        self.task = None
+        self.waiters = 0
+        self.queued = True
+
+
+class ServiceBusyException(EarthMatrixException):
+    pass
+
+
+class UnsupportedMediaException(EarthMatrixException):
+    pass
+
+
+async def detect_borders_async(points, service=None):
+    """
+    Determine the borders of a photograph without blocking the event loop.
+    :param service: BorderService computing the borders. A service shared
+    by the calls without one is created on first use.
+    :return: list of lists containing 1 for borders and 0 otherwise.
+    """
+    global _default_service
+    if service is None:
+        if _default_service is None:
+            _default_service = BorderService()
+        service = _default_service
+    return await service.detect_borders(points)
+
+_default_service = None
+
+
+async def serve(service, host='127.0.0.1', port=8000,
+                max_body=DEFAULT_MAX_BODY):
+    """
+    Start serving POST /borders requests with a BorderService.
+    :param max_body: size in bytes above which request bodies are rejected.
+    :return: the asyncio.Server, e.g. to read its sockets or close it.
+    """
+    return await asyncio.start_server(
+        functools.partial(_handle_connection, service, max_body), host, port)
+
+
+async def _handle_connection(service, max_body, reader, writer):
+    try:
+        status, content_type, body = await _answer(service, max_body, reader)
+    except (asyncio.IncompleteReadError, asyncio.LimitOverrunError,
+            ConnectionError):
+        writer.close()
+        return
+    writer.write('HTTP/1.1 {0} {1}\r\nContent-Type: {2}\r\n'
+                 'Content-Length: {3}\r\nConnection: close\r\n\r\n'.format(
+                     status, _REASONS[status], content_type,
+                     len(body)).encode('ascii'))
+    writer.write(body)
+    try:
+        await writer.drain()
+    except ConnectionError:
+        pass
+    writer.close()
+
+
+async def _answer(service, max_body, reader):
+    """
+    Read a request and compute its response.
+    :return: tuple (status, content type, body).
+    """
+    head = (await reader.readuntil(b'\r\n\r\n')).decode('latin1')
+    lines = head.split('\r\n')
+    method, path = (lines[0].split(' ') + [''])[:2]
+    headers = {}
+    for line in lines[1:]:
+        name, _, value = line.partition(':')
+        headers[name.strip().lower()] = value.strip()
+    if path != '/borders':
+        return _error(404, "'{0}' not found".format(path))
+    if method != 'POST':
+        return _error(405, 'only POST requests are supported')
+    if not headers.get('content-length', '').isdigit():
+        return _error(411, 'Content-Length is required')
+    length = int(headers['content-length'])
+    if length > max_body:
+        return _error(413, 'body is larger than {0} bytes'.format(max_body))
+    body = await reader.readexactly(length)
+    content_type = headers.get('content-type', JSON_TYPE).split(';')[0]
+    try:
+        content_type, body = await service.handle(body, content_type)
+    except UnsupportedMediaException as error:
+        return _error(415, str(error))
+    except ServiceBusyException as error:
+        return _error(503, str(error))
+    except EarthMatrixException as error:
+        return _error(400, str(error))
+    except Exception:
+        return _error(500, 'border detection failed')
+    return 200, content_type, body
+
+
+def _error(status, message):
+    return status, JSON_TYPE, json.dumps({'error': message}).encode('utf-8')
+
+
+def _prepare_points(points):
+    """
+    Validate and hash a photograph, in a thread so that large ones do not
+    block the event loop.
+    :return: tuple (content key, arguments of _detect_packed).
+    """
+    matrix = EarthMatrix(points)
+    altitudes = memoryview(matrix._altitudes)
+    return content_key(matrix), (altitudes.tobytes(), altitudes.format,
+                                 matrix._n_rows, matrix._n_cols)
+
+
+def _body_key(content_type, body):
+    return hashlib.blake2b(content_type.encode('ascii') + b':' + body,
+                           digest_size=20).hexdigest()
+
+
+def _detect_packed(data, typecode, n_rows, n_cols):
+    return pack_borders(detect_grid_borders(
+        memoryview(data).cast(typecode), n_rows, n_cols))
+
+
+def _detect_json(body):
+    try:
+        points = json.loads(body.decode('utf-8'))
+    except ValueError:
+        raise EarthMatrixException('request body is not valid JSON')
+    if isinstance(points, dict):
+        points = points.get('points')
+    altitudes = EarthMatrix._parse_points(points)
+    borders = detect_grid_borders(altitudes, len(points), len(points[0]))
+    if not isinstance(borders, list):
+        borders = borders.tolist()
+    return json.dumps({'borders': borders}).encode('utf-8')
+
+
+def _detect_grid(body):
+    return dumps_borders(
+        detect_grid_borders(*read_grid(body, 'request body')))
+
+
+def _parse_args(argv):
+    parser = argparse.ArgumentParser(
+        description='Serve border detection over HTTP.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument(
+        '--workers', type=int, help='worker processes, one per CPU if unset')
+    parser.add_argument(
+        '--max-pending', type=int, default=DEFAULT_MAX_PENDING,
+        help='requests computed at a time')
+    parser.add_argument(
+        '--max-queued', type=int, default=DEFAULT_MAX_QUEUED,
+        help='waiting requests above which new ones get a 503')
+    return parser.parse_args(argv)
+
+
+async def _serve_forever(args):
+    async with BorderService(args.workers, max_pending=args.max_pending,
+                             max_queued=args.max_queued) as service:
+        server = await serve(service, args.host, args.port)
+        async with server:
+            await server.serve_forever()
+
+
+def main(argv=None):
+    args = _parse_args(sys.argv[1:] if argv is None else argv)
+    try:
+        asyncio.run(_serve_forever(args))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,108 @@
+"""
+Per-stratum summaries of a matrix whose borders were detected, as returned
+by EarthMatrix.get_strata and NdEarthMatrix.get_strata. The table stores one
+array per field, indexed by stratum id, together with the stratum label of
+every point, so both "which stratum is (x, y) in" and "which strata match"
+questions are answered without scanning the border mask again.
+"""
+
+
+class StrataTable(object):
+    """
+    Summary of the strata of a matrix. Columns are arrays indexed by stratum
+    id: altitudes, counts, min_x, min_y, max_x, max_y, is_border and
+    perimeters. Ids freed by EarthMatrix.set_altitudes have a count of 0 and
+    are skipped when iterating.
+
+    The perimeter of a stratum is the number of sides of its points that are
+    not shared with another point of the stratum, matrix edges included.
+    """
+    def __init__(self, labels, n_rows, n_cols, altitudes, counts, min_x,
+                 min_y, max_x, max_y, is_border, perimeters):
+        """
+        :param labels: flat row-major array with the stratum id of every
+        point.
+        """
+        self.labels = labels
+        self.n_rows = n_rows
+        self.n_cols = n_cols
+        self.altitudes = altitudes
+        self.counts = counts
+        self.min_x = min_x
+        self.min_y = min_y
+        self.max_x = max_x
+        self.max_y = max_y
+        self.is_border = is_border
+        self.perimeters = perimeters
+
+    def stratum_at(self, x, y):
+        """
+        Return the id of the stratum the point (x, y) belongs to.
+        """
+        if not (0 <= x < self.n_rows and 0 <= y < self.n_cols):
+            raise IndexError('earth point index out of range')
+        return int(self.labels[x * self.n_cols + y])
+
+    def select(self, is_border=None, min_count=None, max_count=None):
+        """
+        Return the ids of the strata matching all the given conditions, e.g.
+        select(is_border=True, min_count=100) for the border strata of at
+        least 100 points.
+        """
+        selected = []
+        for stratum, count in enumerate(self.counts):
+            if (count and
+                    (is_border is None or
+                     bool(self.is_border[stratum]) == is_border) and
+                    (min_count is None or count >= min_count) and
+                    (max_count is None or count <= max_count)):
+                selected.append(stratum)
+        return selected
+
+    def __len__(self):
+        return len(self.counts)
+
+    def __getitem__(self, stratum):
+        if not 0 <= stratum < len(self.counts) or not self.counts[stratum]:
+            raise IndexError('stratum out of range')
+        return StratumSummary(
+            stratum, _item(self.altitudes[stratum]),
+            int(self.counts[stratum]),
+            (int(self.min_x[stratum]), int(self.min_y[stratum]),
+             int(self.max_x[stratum]), int(self.max_y[stratum])),
+            bool(self.is_border[stratum]), int(self.perimeters[stratum]))
+
+    def __iter__(self):
+        for stratum, count in enumerate(self.counts):
+            if count:
+                yield self[stratum]
+
+
+class StratumSummary(object):
+    """
+    Summary of a stratum: its id, altitude, number of points, bounding box
+    as a tuple (min_x, min_y, max_x, max_y), border flag and perimeter.
+    """
+    __slots__ = ('stratum', 'altitude', 'count', 'bbox', 'is_border',
+                 'perimeter')
+
+    def __init__(self, stratum, altitude, count, bbox, is_border, perimeter):
+        self.stratum = stratum
+        self.altitude = altitude
+        self.count = count
+        self.bbox = bbox
+        self.is_border = is_border
+        self.perimeter = perimeter
+
+    def __eq__(self, other):
+        return all(getattr(self, name) == getattr(other, name)
+                   for name in self.__slots__)
+
+    def __repr__(self):
+        return 'StratumSummary({0})'.format(', '.join(
+            '{0}={1!r}'.format(name, getattr(self, name))
+            for name in self.__slots__))
+
+
+def _item(value):
+    return value.item() if hasattr(value, 'item') else value
@@ -0,0 +1,151 @@
+import random
+import unittest
+from array import array
+
+from basins import BasinMap, _BucketQueue, _HeapQueue, _make_queue
+from earthmatrix import EarthMatrix, EarthMatrixException
+from profiling import StageProfiler
+
+NESTED = [
+    [5, 5, 5, 5, 5],
+    [5, 1, 3, 2, 5],
+    [5, 5, 5, 5, 5],
+    [5, 4, 4, 4, 0]]
+
+
+def _spill_elevations(photograph, **neighborhood):
+    """
+    Reference spill elevations: the lowest, over all paths from a point to
+    the edge, of the highest altitude along the path, found by relaxing
+    until nothing changes.
+    """
+    pmap = EarthMatrix(photograph, **neighborhood)
+    altitudes = pmap._altitudes
+    levels = [float('inf')] * len(altitudes)
+    for cell in pmap._get_outlets():
+        levels[cell] = altitudes[cell]
+    changed = True
+    while changed:
+        changed = False
+        for cell, altitude in enumerate(altitudes):
+            for neighbor in pmap._get_neighbors(cell):
+                level = max(altitude, levels[neighbor])
+                if level < levels[cell]:
+                    levels[cell] = level
+                    changed = True
+    n_cols = len(photograph[0])
+    return [levels[x * n_cols:(x + 1) * n_cols]
+            for x in range(len(photograph))]
+
+
+class TestDetectBasins(unittest.TestCase):
+    def test_detect_basins_should_fill_nested_depressions(self):
+        basins = EarthMatrix(NESTED).detect_basins()
+        self.assertEqual([
+            [5, 5, 5, 5, 5],
+            [5, 5, 5, 5, 5],
+            [5, 5, 5, 5, 5],
+            [5, 4, 4, 4, 0]], basins.to_matrix('spill_elevations'))
+        self.assertEqual([
+            [0, 0, 0, 0, 0],
+            [0, 4, 2, 3, 0],
+            [0, 0, 0, 0, 0],
+            [0, 0, 0, 0, 0]], basins.to_matrix('fill_depths'))
+
+    def test_detect_basins_should_label_points_with_outlet_stratum(self):
+        pmap = EarthMatrix(NESTED)
+        basins = pmap.detect_basins()
+        self.assertEqual(pmap.stratum_at(3, 4), basins.basin_at(3, 4))
+        self.assertEqual(pmap.stratum_at(3, 1), basins.basin_at(1, 2))
+        self.assertEqual(pmap.stratum_at(0, 0), basins.basin_at(0, 2))
+
+    def test_detect_basins_should_match_reference_spill_elevations(self):
+        generator = random.Random(7)
+        for _ in range(60):
+            n_rows = generator.randint(1, 7)
+            n_cols = generator.randint(1, 7)
+            photograph = [[generator.randint(0, 9) for _ in range(n_cols)]
+                          for _ in range(n_rows)]
+            neighborhood = generator.choice(
+                [{}, {'connectivity': 8}, {'wrap': 'cols'}, {'wrap': True}])
+            basins = EarthMatrix(photograph, **neighborhood).detect_basins()
+            expected = _spill_elevations(photograph, **neighborhood)
+            self.assertEqual(expected, basins.to_matrix('spill_elevations'))
+            self.assertEqual(
+                [[level - altitude for level, altitude in zip(*rows)]
+                 for rows in zip(expected, photograph)],
+                basins.to_matrix('fill_depths'))
+
+    def test_detect_basins_should_give_same_elevations_with_heap(self):
+        photograph = [[float(altitude) + 0.5 for altitude in row]
+                      for row in NESTED]
+        basins = EarthMatrix(photograph).detect_basins()
+        self.assertEqual(
+            [[altitude + 0.5 for altitude in row] for row in
+             EarthMatrix(NESTED).detect_basins().to_matrix(
+                 'spill_elevations')],
+            basins.to_matrix('spill_elevations'))
+
+    def test_detect_basins_should_hold_depths_wider_than_altitudes(self):
+        for low, high in ((-100, 100), (-2 ** 62, 2 ** 62)):
+            pit = [[high] * 3, [high, low, high], [high] * 3]
+            basins = EarthMatrix(pit).detect_basins()
+            self.assertEqual(high - low, basins.fill_depth_at(1, 1))
+            self.assertEqual(high, basins.spill_elevation_at(1, 1))
+        basins = EarthMatrix([[1.0, 1.0, 1.0], [1.0, -1.0, 1.0]] * 2,
+                             resolution=0.01).detect_basins()
+        self.assertAlmostEqual(2.0, basins.fill_depth_at(1, 1))
+
+    def test_detect_basins_should_drain_wrapped_matrix_to_lowest_point(self):
+        basins = EarthMatrix([[3, 1], [2, 3]], wrap=True).detect_basins()
+        self.assertEqual([[3, 1], [3, 3]],
+                         basins.to_matrix('spill_elevations'))
+
+    def test_detect_basins_should_scale_by_resolution(self):
+        photograph = [[altitude / 10.0 for altitude in row]
+                      for row in NESTED]
+        basins = EarthMatrix(photograph, resolution=0.1).detect_basins()
+        self.assertAlmostEqual(0.4, basins.fill_depth_at(1, 1))
+        self.assertAlmostEqual(0.5, basins.spill_elevation_at(1, 1))
+
+    def test_detect_basins_should_be_recomputed_after_set_altitudes(self):
+        pmap = EarthMatrix(NESTED)
+        self.assertIs(pmap.detect_basins(), pmap.detect_basins())
+        pmap.set_altitudes({(1, 4): 0})
+        self.assertEqual(2, pmap.detect_basins().fill_depth_at(1, 1))
+
+    def test_detect_basins_should_report_filled_cells(self):
+        profiler = StageProfiler()
+        EarthMatrix(NESTED, profiler=profiler).detect_basins()
+        record = profiler.records[-1]
+        self.assertEqual('basins', record['stage'])
+        self.assertEqual(3, record['filled_cells'])
+
+
+class TestBasinMap(unittest.TestCase):
+    def test_accessors_should_raise_if_coordinates_out_of_range(self):
+        basins = BasinMap(1, 1, array('i', [0]), array('q', [1]),
+                          array('q', [0]))
+        with self.assertRaises(IndexError):
+            basins.basin_at(0, 1)
+        with self.assertRaises(EarthMatrixException):
+            basins.to_matrix('altitudes')
+
+
+class TestQueues(unittest.TestCase):
+    def test_make_queue_should_use_buckets_for_narrow_integer_ranges(self):
+        self.assertIsInstance(_make_queue(array('B', [0, 3, 1, 2])),
+                              _BucketQueue)
+        self.assertIsInstance(_make_queue(array('q', [0, 100])), _HeapQueue)
+        self.assertIsInstance(_make_queue(array('d', [0, 1])), _HeapQueue)
+
+    def test_bucket_queue_should_pop_lowest_altitude_first(self):
+        queue = _BucketQueue(2, 6)
+        for altitude, cell in ((5, 0), (2, 1), (6, 2), (2, 3)):
+            queue.push(altitude, cell)
+        popped = [queue.pop() for _ in range(len(queue))]
+        self.assertEqual([3, 1, 0, 2], popped)
+
+
+if __name__ == '__main__':
+    unittest.main()
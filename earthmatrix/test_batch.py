@@ -0,0 +1,53 @@
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from earthmatrix import EarthMatrix, EarthMatrixException
+from batch import detect_borders_batch, detect_borders_stack
+
+
+class TestDetectBordersBatch(unittest.TestCase):
+    def setUp(self):
+        generator = np.random.RandomState(11)
+        self.photographs = [
+            generator.randint(0, 3, size=generator.randint(1, 6, size=2))
+            .tolist() for _ in range(30)]
+        self.expected = [EarthMatrix(photograph).detect_borders()
+                         for photograph in self.photographs]
+
+    def test_detect_borders_batch_should_return_borders_in_input_order(self):
+        self.assertEqual(
+            self.expected, detect_borders_batch(self.photographs))
+
+    def test_detect_borders_batch_should_spread_shapes_over_workers(self):
+        self.assertEqual(
+            self.expected, detect_borders_batch(self.photographs, workers=2))
+
+    def test_detect_borders_batch_should_use_given_executor(self):
+        with ThreadPoolExecutor(2) as executor:
+            self.assertEqual(
+                self.expected,
+                detect_borders_batch(self.photographs, executor=executor))
+
+    def test_detect_borders_batch_should_return_arrays_if_requested(self):
+        borders = detect_borders_batch(
+            [np.array([[5, 9]]), np.array([[5, 5]])], as_array=True)
+        np.testing.assert_array_equal([[1, 0]], borders[0])
+        np.testing.assert_array_equal([[1, 1]], borders[1])
+
+    def test_detect_borders_batch_should_return_empty_list_for_no_photographs(self):
+        self.assertEqual([], detect_borders_batch([]))
+
+    def test_detect_borders_batch_should_raise_if_any_photograph_is_invalid(self):
+        with self.assertRaises(EarthMatrixException):
+            detect_borders_batch([[[1, 2]], [[1, 2], [3]]])
+
+    def test_detect_borders_stack_should_not_join_strata_across_photographs(self):
+        np.testing.assert_array_equal(
+            [[[1, 1]], [[0, 1]]],
+            detect_borders_stack(np.array([[[1, 1]], [[2, 1]]])))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from benchmark import PATTERNS, main, run_suite, square_shape
+from ndmatrix import label_strata
+
+
+class TestPatterns(unittest.TestCase):
+    def test_patterns_should_return_grids_of_requested_shape(self):
+        for pattern in PATTERNS.values():
+            self.assertEqual((3, 5), pattern(3, 5).shape)
+
+    def test_checkerboard_should_make_every_point_a_stratum(self):
+        self.assertEqual(20, label_strata(PATTERNS['checkerboard'](4, 5))[1])
+
+    def test_flat_should_make_a_single_stratum(self):
+        self.assertEqual(1, label_strata(PATTERNS['flat'](4, 5))[1])
+
+    def test_noise_should_be_reproducible(self):
+        np.testing.assert_array_equal(
+            PATTERNS['noise'](4, 5, seed=3), PATTERNS['noise'](4, 5, seed=3))
+
+
+class TestSuite(unittest.TestCase):
+    def test_square_shape_should_return_closest_square(self):
+        self.assertEqual((10, 10), square_shape(100))
+        self.assertEqual((32, 32), square_shape(1000))
+
+    def test_run_suite_should_time_every_stage(self):
+        results = run_suite([16], ['flat'], ['numpy', 'python'])
+        self.assertEqual(['numpy', 'python'],
+                         [result['engine'] for result in results])
+        for result in results:
+            for stage in ('init', 'compute_strata', 'detect_borders'):
+                self.assertGreaterEqual(result[stage], 0)
+            self.assertGreater(result['peak_bytes'], 0)
+
+    def test_run_suite_should_skip_python_engine_for_large_grids(self):
+        results = run_suite([16], ['flat'], ['numpy', 'python'],
+                            max_python_cells=8, memory=False)
+        self.assertEqual(['numpy'], [result['engine'] for result in results])
+        self.assertIsNone(results[0]['peak_bytes'])
+
+    def test_main_should_write_json_results(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'results.json')
+            self.assertEqual(0, main([
+                'suite', '--sizes', '4', '--patterns', 'noise',
+                '--output', path]))
+            with open(path) as results:
+                report = json.load(results)
+            self.assertEqual(2, len(report['results']))
+            self.assertIn('python', report['environment'])
+        finally:
+            shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    unittest.main()
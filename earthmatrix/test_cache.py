@@ -0,0 +1,88 @@
+import shutil
+import tempfile
+import unittest
+
+import mock
+import numpy as np
+
+from cache import BorderCache, content_key
+from earthmatrix import EarthMatrix
+from ndmatrix import NdEarthMatrix
+
+
+class TestBorderCache(unittest.TestCase):
+    def test_detect_borders_should_compute_each_content_once(self):
+        cache = BorderCache()
+        self.assertEqual([[1, 0]], cache.detect_borders(EarthMatrix([[1, 2]])))
+        with mock.patch('earthmatrix.EarthMatrix.detect_borders') as detect:
+            self.assertEqual(
+                [[1, 0]], cache.detect_borders(EarthMatrix([[1, 2]])))
+        self.assertFalse(detect.called)
+        self.assertEqual(
+            {'hits': 1, 'misses': 1, 'evictions': 0, 'size': 1},
+            cache.stats())
+
+    def test_detect_borders_should_evict_least_recently_used_results(self):
+        cache = BorderCache(maxsize=2)
+        first, second, third = (
+            EarthMatrix([[1, 2]]), EarthMatrix([[2, 1]]), EarthMatrix([[1]]))
+        cache.detect_borders(first)
+        cache.detect_borders(second)
+        cache.detect_borders(first)
+        cache.detect_borders(third)
+        self.assertIn(first, cache)
+        self.assertNotIn(second, cache)
+        self.assertEqual(1, cache.evictions)
+
+    def test_detect_borders_should_read_results_from_disk_store(self):
+        directory = tempfile.mkdtemp()
+        try:
+            BorderCache(directory=directory).detect_borders(
+                EarthMatrix([[1, 2], [3, 1]]))
+            cache = BorderCache(directory=directory)
+            with mock.patch('earthmatrix.EarthMatrix.detect_borders') as detect:
+                self.assertEqual(
+                    [[1, 0], [0, 1]],
+                    cache.detect_borders(EarthMatrix([[1, 2], [3, 1]])))
+            self.assertFalse(detect.called)
+            self.assertEqual(1, cache.hits)
+        finally:
+            shutil.rmtree(directory)
+
+    def test_detect_borders_should_miss_after_altitudes_change(self):
+        cache = BorderCache()
+        matrix = EarthMatrix([[1, 2]])
+        cache.detect_borders(matrix)
+        matrix.set_altitudes({(0, 1): 0})
+        self.assertEqual([[0, 1]], cache.detect_borders(matrix))
+        self.assertEqual(2, cache.misses)
+
+    def test_clear_should_forget_results_in_memory(self):
+        cache = BorderCache()
+        cache.detect_borders(EarthMatrix([[1, 2]]))
+        cache.clear()
+        self.assertEqual(0, len(cache))
+
+
+class TestContentKey(unittest.TestCase):
+    def test_content_key_should_be_equal_for_equal_altitudes(self):
+        self.assertEqual(content_key(EarthMatrix([[1, 2], [3, 4]])),
+                         content_key(EarthMatrix([[1, 2], [3, 4]])))
+        self.assertEqual(
+            content_key(NdEarthMatrix(np.array([[1, 2]], dtype=np.int8))),
+            content_key(NdEarthMatrix(np.array([[1, 2]], dtype=np.int8))))
+
+    def test_content_key_should_depend_on_dimensions(self):
+        self.assertNotEqual(content_key(EarthMatrix([[1, 2], [3, 4]])),
+                            content_key(EarthMatrix([[1, 2, 3, 4]])))
+
+    def test_content_key_should_depend_on_neighborhood(self):
+        key = content_key(EarthMatrix([[1, 2], [3, 4]]))
+        self.assertNotEqual(
+            key, content_key(EarthMatrix([[1, 2], [3, 4]], connectivity=8)))
+        self.assertNotEqual(
+            key, content_key(EarthMatrix([[1, 2], [3, 4]], wrap=True)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,34 +1,64 @@
+import random
 import unittest
+from array import array
+
 import mock
 
 from earthmatrix import EarthPoint, EarthMatrix, EarthMatrixException
 
 
 class TestEarthMatrix(unittest.TestCase):
-    def test_parse_points_should_codify_altitudes_using_points(self):
+    def test_parse_points_should_codify_altitudes_in_row_major_array(self):
         points = EarthMatrix._parse_points([
             [5, 4, 3],
             [1, 2, 6],
             [7, 9, 0],
         ])
-        self.assertEqual(3, len(points))
-        self.assertEqual(3, len(points[0]))
-        self.assertEqual(3, len(points[1]))
-        self.assertEqual(3, len(points[2]))
-        self.assertEqual(EarthPoint(0, 0, 5), points[0][0])
-        self.assertEqual(EarthPoint(0, 1, 4), points[0][1])
-        self.assertEqual(EarthPoint(0, 2, 3), points[0][2])
-        self.assertEqual(EarthPoint(1, 0, 1), points[1][0])
-        self.assertEqual(EarthPoint(1, 1, 2), points[1][1])
-        self.assertEqual(EarthPoint(1, 2, 6), points[1][2])
-        self.assertEqual(EarthPoint(2, 0, 7), points[2][0])
-        self.assertEqual(EarthPoint(2, 1, 9), points[2][1])
-        self.assertEqual(EarthPoint(2, 2, 0), points[2][2])
-
-    def test_parse_points_should_return_empty_matrix_if_points_are_empty(self):
+        self.assertEqual(array('q', [5, 4, 3, 1, 2, 6, 7, 9, 0]), points)
+
+    def test_parse_points_should_use_doubles_if_any_altitude_is_float(self):
+        points = EarthMatrix._parse_points([
+            [5, 4.5],
+            [1, 2]])
+        self.assertEqual(array('d', [5, 4.5, 1, 2]), points)
+
+    def test_parse_points_should_use_smallest_typecode_fitting_altitudes(self):
+        for typecode, altitudes in [('B', [0, 255]), ('b', [-1, 127]),
+                                    ('H', [0, 256]), ('h', [-1, 256]),
+                                    ('I', [0, 1 << 16]), ('i', [-1, 1 << 16]),
+                                    ('q', [0, 1 << 32])]:
+            points = EarthMatrix._parse_points([altitudes])
+            self.assertEqual(typecode, points.typecode)
+            self.assertEqual(altitudes, points.tolist())
+
+    def test_parse_points_should_use_floats_if_no_precision_is_lost(self):
+        self.assertEqual(
+            'f', EarthMatrix._parse_points([[0.5, 1.25]]).typecode)
+        self.assertEqual(
+            'd', EarthMatrix._parse_points([[0.1, 1.25]]).typecode)
+        self.assertEqual(
+            'd', EarthMatrix._parse_points([[1e300, 1]]).typecode)
+
+    def test_parse_points_should_quantize_altitudes_to_resolution(self):
+        points = EarthMatrix._parse_points([[0.1, 0.3], [2.5, -0.2]], 0.1)
+        self.assertEqual(array('b', [1, 3, 25, -2]), points)
+        self.assertEqual('b', points.typecode)
+
+    def test_parse_points_should_keep_buffers(self):
+        buffer = array('q', [1, 2])
+        points = EarthMatrix._parse_points(memoryview(buffer).cast('B').cast(
+            'q', [1, 2]))
+        self.assertEqual('q', points.format)
+
+    def test_parse_points_should_return_empty_array_if_points_are_empty(self):
         points = EarthMatrix._parse_points([[]])
-        self.assertEqual(1, len(points))
-        self.assertEqual(0, len(points[0]))
+        self.assertEqual(0, len(points))
+
+    def test_parse_points_should_raise_if_altitudes_are_not_numbers(self):
+        with self.assertRaises(EarthMatrixException) as context:
+            EarthMatrix._parse_points([[1, 'a']])
+        self.assertEqual(
+            "'points' altitudes must be numbers", str(context.exception))
 
     @mock.patch(
         'earthmatrix.EarthMatrix._validate_points',
@@ -74,6 +104,43 @@ class TestEarthMatrix(unittest.TestCase):
             [4, 5, 6]]
         self.assertEqual(points, EarthMatrix._validate_points(points))
 
+    def test_validate_points_should_accept_buffer_rows(self):
+        points = [array('d', [1, 2.5]), [3, 4], memoryview(b'\x05\x06')]
+        self.assertIs(points, EarthMatrix._validate_points(points))
+        self.assertEqual(
+            array('d', [1, 2.5, 3, 4, 5, 6]), EarthMatrix._parse_points(points))
+
+    def test_validate_points_should_raise_if_buffer_is_not_2_dimensional(self):
+        for points in (array('q', [1, 2]),
+                       [memoryview(b'\x01\x02').cast('B', [1, 2])]):
+            with self.assertRaises(EarthMatrixException):
+                EarthMatrix._validate_points(points)
+        with self.assertRaises(EarthMatrixException) as context:
+            EarthMatrix._validate_points(b'12')
+        self.assertEqual(
+            "'points' must be a list of lists", str(context.exception))
+
+    def test_validate_points_should_raise_if_buffer_items_are_not_numbers(self):
+        with self.assertRaises(EarthMatrixException) as context:
+            EarthMatrix._validate_points(memoryview(b'ab').cast('c', [1, 2]))
+        self.assertEqual(
+            "'points' altitudes must be numbers", str(context.exception))
+
+    def test_init_should_keep_view_of_contiguous_2_dimensional_buffer(self):
+        altitudes = array('q', [1, 2, 2, 1])
+        pmap = EarthMatrix(memoryview(altitudes).cast('B').cast('q', [2, 2]))
+        altitudes[0] = 3
+        self.assertEqual(3, pmap[0, 0].altitude)
+        self.assertEqual([[0, 0], [0, 1]], pmap.detect_borders())
+
+    def test_init_should_copy_non_contiguous_2_dimensional_buffer(self):
+        altitudes = array('q', [1, 2, 7, 7, 2, 1])
+        pmap = EarthMatrix(
+            memoryview(altitudes).cast('B').cast('q', [3, 2])[::2])
+        altitudes[0] = 3
+        self.assertEqual(1, pmap[0, 0].altitude)
+        self.assertEqual([[1, 0], [0, 1]], pmap.detect_borders())
+
     def test_detect_borders_should_set_true_for_strata_with_all_minimum_points(self):
         pmap = EarthMatrix([
             [9, 2, 2, 2, 3, 5],
@@ -133,6 +200,323 @@ class TestEarthMatrix(unittest.TestCase):
             [1, 0, 0, 0, 0, 1],
             [1, 1, 1, 1, 1, 1]], pmap.detect_borders())
 
+    def test_detect_borders_should_not_compute_strata_again_if_called_twice(self):
+        pmap = EarthMatrix([
+            [1, 2],
+            [2, 2]])
+        first = pmap.detect_borders()
+        with mock.patch('earthmatrix.EarthMatrix._compute_strata') as compute:
+            self.assertEqual(first, pmap.detect_borders())
+        self.assertFalse(compute.called)
+        self.assertEqual(array('i', [0, 1]), pmap._strata)
+
+    def test_detect_borders_should_report_stages_to_profiler(self):
+        profiler = mock.Mock()
+        pmap = EarthMatrix([
+            [1, 2],
+            [2, 2]], profiler=profiler)
+        pmap.detect_borders()
+        stages = [call[0][0] for call in profiler.record.call_args_list]
+        self.assertEqual(
+            ['validate_points', 'parse_points', 'compute_strata',
+             'minimality', 'border_matrix'], stages)
+        metrics = dict((call[0][0], call[1])
+                       for call in profiler.record.call_args_list)
+        self.assertEqual(
+            {'cells': 4, 'strata': 2, 'largest_stratum': 3,
+             'neighbor_comparisons': 8}, metrics['compute_strata'])
+        self.assertEqual(
+            {'cells': 4, 'strata': 2, 'border_strata': 1},
+            metrics['minimality'])
+
+    def test_detect_borders_should_return_requested_form(self):
+        pmap = EarthMatrix([
+            [1, 1, 2],
+            [3, 1, 2],
+            [3, 3, 0]])
+        self.assertEqual(
+            [[(0, 2)], [(1, 1)], [(2, 1)]], pmap.detect_borders('runs'))
+        self.assertEqual(
+            [(0, 0), (0, 1), (1, 1), (2, 2)],
+            pmap.detect_borders('coordinates'))
+        self.assertEqual(b'\xc8\x80', pmap.detect_borders('bitset'))
+        with self.assertRaises(EarthMatrixException):
+            pmap.detect_borders('dense')
+
+    def test_get_strata_should_summarize_strata_after_detection(self):
+        pmap = EarthMatrix([
+            [1, 1, 2],
+            [3, 1, 2]])
+        table = pmap.get_strata()
+        self.assertIsNotNone(pmap._borders)
+        self.assertEqual([1, 2, 3], list(table.altitudes))
+        self.assertEqual([3, 2, 1], list(table.counts))
+        self.assertEqual([8, 6, 4], list(table.perimeters))
+        self.assertIs(table, pmap.get_strata())
+
+    def test_get_strata_should_be_rebuilt_after_set_altitudes(self):
+        pmap = EarthMatrix([
+            [1, 1, 2],
+            [3, 1, 2]])
+        pmap.get_strata()
+        pmap.set_altitudes({(0, 2): 1})
+        table = pmap.get_strata()
+        summary = table[pmap.stratum_at(0, 2)]
+        self.assertEqual(4, summary.count)
+        self.assertEqual((0, 0, 1, 2), summary.bbox)
+        self.assertEqual(3, len(table.select()))
+
+    def test_stratum_at_should_return_stratum_id_of_point(self):
+        pmap = EarthMatrix([
+            [1, 1, 2],
+            [3, 1, 2]])
+        self.assertEqual(2, pmap.stratum_at(1, 0))
+        with self.assertRaises(IndexError):
+            pmap.stratum_at(0, 3)
+
+    def test_set_altitudes_should_match_detection_from_scratch(self):
+        generator = random.Random(13)
+        for _ in range(100):
+            n_rows = generator.randint(1, 7)
+            n_cols = generator.randint(1, 7)
+            photograph = [[generator.randint(0, 2) for _ in range(n_cols)]
+                          for _ in range(n_rows)]
+            neighborhood = generator.choice(
+                [{}, {'connectivity': 8}, {'wrap': True}])
+            pmap = EarthMatrix(photograph, **neighborhood)
+            before = pmap.detect_borders()
+            updates = {}
+            for _ in range(generator.randint(1, 3)):
+                x = generator.randrange(n_rows)
+                y = generator.randrange(n_cols)
+                updates[x, y] = photograph[x][y] = generator.randint(0, 2)
+            changed = pmap.set_altitudes(updates)
+            after = EarthMatrix(photograph, **neighborhood).detect_borders()
+            self.assertEqual(after, pmap._get_border_matrix())
+            self.assertEqual(
+                sorted((x, y) for x in range(n_rows) for y in range(n_cols)
+                       if before[x][y] != after[x][y]),
+                sorted(changed))
+
+    def test_is_border_should_match_detection_of_whole_matrix(self):
+        generator = random.Random(17)
+        for _ in range(100):
+            n_rows = generator.randint(1, 7)
+            n_cols = generator.randint(1, 7)
+            photograph = [[generator.randint(0, 2) for _ in range(n_cols)]
+                          for _ in range(n_rows)]
+            neighborhood = generator.choice(
+                [{}, {'connectivity': 8}, {'wrap': True}, {'wrap': 'cols'}])
+            expected = EarthMatrix(photograph, **neighborhood).detect_borders()
+            pmap = EarthMatrix(photograph, **neighborhood)
+            x0, x1 = sorted(generator.sample(range(n_rows + 1), 2))
+            y0, y1 = sorted(generator.sample(range(n_cols + 1), 2))
+            self.assertEqual(
+                [row[y0:y1] for row in expected[x0:x1]],
+                pmap.detect_borders(window=(x0, y0, x1, y1)))
+            self.assertEqual(
+                expected, [[int(pmap.is_border(x, y)) for y in range(n_cols)]
+                           for x in range(n_rows)])
+
+    def test_is_border_should_only_flood_stratum_of_point(self):
+        pmap = EarthMatrix([
+            [1, 1, 5, 7],
+            [1, 4, 5, 7],
+            [6, 6, 5, 7]])
+        self.assertTrue(pmap.is_border(0, 1))
+        self.assertEqual({0: 1, 1: 1, 4: 1}, pmap._queried_borders)
+        self.assertFalse(pmap.is_border(2, 2))
+        self.assertEqual(6, len(pmap._queried_borders))
+        self.assertIsNone(pmap._neighbor_offsets)
+        self.assertIsNone(pmap._borders)
+
+    def test_is_border_should_forget_queries_if_altitudes_change(self):
+        pmap = EarthMatrix([[1, 2]])
+        self.assertFalse(pmap.is_border(0, 1))
+        pmap.set_altitudes({(0, 1): 0})
+        self.assertTrue(pmap.is_border(0, 1))
+        self.assertFalse(pmap.is_border(0, 0))
+
+    def test_is_border_should_read_detected_borders(self):
+        pmap = EarthMatrix([[1, 2]])
+        pmap.detect_borders()
+        self.assertEqual([True, False],
+                         [pmap.is_border(0, 0), pmap.is_border(0, 1)])
+        self.assertEqual({}, pmap._queried_borders)
+
+    def test_is_border_should_raise_if_coordinates_out_of_range(self):
+        with self.assertRaises(IndexError):
+            EarthMatrix([[1, 2]]).is_border(1, 0)
+
+    def test_detect_borders_should_return_window_in_requested_form(self):
+        pmap = EarthMatrix([
+            [1, 1, 5],
+            [1, 4, 5],
+            [6, 6, 5]])
+        self.assertEqual([[(0, 1)], []],
+                         pmap.detect_borders('runs', window=(0, 1, 2, 3)))
+        self.assertEqual([[1, 1, 0], [1, 0, 0], [0, 0, 0]],
+                         pmap.detect_borders())
+        self.assertEqual([[0], [0]],
+                         pmap.detect_borders(window=(1, 2, 3, 3)))
+
+    def test_iter_border_rows_should_yield_border_flags_per_row(self):
+        pmap = EarthMatrix([[1, 2], [3, 0]])
+        self.assertEqual([b'\x01\x00', b'\x00\x01'],
+                         list(pmap.iter_border_rows()))
+
+    def test_iter_lines_should_yield_rows_of_str(self):
+        pmap = EarthMatrix([[1, 2], [3, 0]])
+        pmap.detect_borders()
+        self.assertEqual(str(pmap).split('\n'), list(pmap.iter_lines()))
+
+    def test_detect_borders_should_raise_if_window_is_invalid(self):
+        pmap = EarthMatrix([[1, 2]])
+        for window in [(0, 0, 0, 2), (0, 0, 2, 2), (0, 1, 1, 0), (0, 0), 3]:
+            with self.assertRaises(EarthMatrixException) as context:
+                pmap.detect_borders(window=window)
+            self.assertEqual(
+                "'window' must be a non empty region of the matrix",
+                str(context.exception))
+
+    def test_detect_borders_should_join_diagonal_points_if_8_connected(self):
+        pmap = EarthMatrix([
+            [1, 2, 1],
+            [2, 1, 2]], connectivity=8)
+        self.assertEqual([
+            [1, 0, 1],
+            [0, 1, 0]], pmap.detect_borders())
+        self.assertEqual(2, len(pmap._strata))
+
+    def test_detect_borders_should_join_opposite_edges_if_wrapping(self):
+        points = [
+            [0, 3, 1],
+            [3, 3, 3]]
+        self.assertEqual([
+            [1, 0, 1],
+            [0, 0, 0]], EarthMatrix(points).detect_borders())
+        self.assertEqual([
+            [1, 0, 0],
+            [0, 0, 0]], EarthMatrix(points, wrap='cols').detect_borders())
+        self.assertEqual(
+            [[1, 0, 0, 1]],
+            EarthMatrix([[2, 3, 5, 2]], wrap=True).detect_borders())
+
+    def test_detect_borders_should_use_custom_kernel(self):
+        pmap = EarthMatrix([[1, 2, 3]], connectivity=[(0, 2), (0, -2)])
+        self.assertEqual([[1, 1, 0]], pmap.detect_borders())
+
+    def test_detect_borders_should_match_kernel_path_for_4_and_8_connected(self):
+        generator = random.Random(7)
+        points = [[generator.randint(0, 2) for _ in range(9)]
+                  for _ in range(7)]
+        for connectivity in (4, 8):
+            kernel = [tuple(offset) for offset in
+                      EarthMatrix(points, connectivity=connectivity)._kernel]
+            self.assertEqual(
+                EarthMatrix(points, connectivity=connectivity)
+                .detect_borders(),
+                EarthMatrix(points, connectivity=kernel[::-1])
+                .detect_borders())
+
+    def test_from_buffer_should_accept_neighborhood(self):
+        pmap = EarthMatrix.from_buffer(
+            bytes(bytearray([1, 2, 2, 1])), 2, 2, connectivity=8)
+        self.assertEqual([[1, 0], [0, 1]], pmap.detect_borders())
+        self.assertEqual(0, pmap[1, 1].stratum)
+
+    def test_init_should_raise_if_connectivity_is_not_valid(self):
+        for connectivity in (6, [(0, 1)], [(0, 0)], [], [(0, 1, 2)],
+                             [(0, 'a'), (0, -1)], [(0.5, 0), (-0.5, 0)]):
+            with self.assertRaises(EarthMatrixException):
+                EarthMatrix([[1, 2]], connectivity=connectivity)
+
+    def test_init_should_raise_if_wrap_is_not_valid(self):
+        for wrap in ('x', 1, [True]):
+            with self.assertRaises(EarthMatrixException):
+                EarthMatrix([[1, 2]], wrap=wrap)
+
+    def test_set_altitudes_should_merge_and_split_strata(self):
+        pmap = EarthMatrix([
+            [1, 5, 1],
+            [9, 9, 9]])
+        pmap.detect_borders()
+        self.assertEqual([(0, 1)], sorted(pmap.set_altitudes({(0, 1): 1})))
+        self.assertEqual(pmap[0, 0].stratum, pmap[0, 2].stratum)
+        self.assertEqual([(0, 0), (0, 2)],
+                         sorted(pmap.set_altitudes({(0, 1): 0})))
+        self.assertNotEqual(pmap[0, 0].stratum, pmap[0, 2].stratum)
+        self.assertEqual([[0, 1, 0], [0, 0, 0]], pmap._get_border_matrix())
+
+    def test_set_altitudes_should_only_store_altitudes_before_detection(self):
+        pmap = EarthMatrix([[1, 2]])
+        self.assertEqual([], pmap.set_altitudes({(0, 1): 0}))
+        self.assertEqual([[0, 1]], pmap.detect_borders())
+
+    def test_set_altitudes_should_widen_altitudes_to_fit_new_values(self):
+        pmap = EarthMatrix.from_buffer(bytes(bytearray([1, 2])), 1, 2)
+        pmap.detect_borders()
+        pmap.set_altitudes({(0, 0): 2.5})
+        self.assertEqual(EarthPoint(0, 0, 2.5, pmap[0, 0].stratum, False),
+                         pmap[0, 0])
+        self.assertEqual([[0, 1]], pmap._get_border_matrix())
+
+    def test_set_altitudes_should_widen_compact_altitudes(self):
+        pmap = EarthMatrix([[1, 2]])
+        pmap.detect_borders()
+        pmap.set_altitudes({(0, 1): -300})
+        self.assertEqual('h', pmap._altitudes.typecode)
+        self.assertEqual(array('h', [1, -300]), pmap._altitudes)
+        self.assertEqual([[0, 1]], pmap._get_border_matrix())
+
+    def test_set_altitudes_should_widen_floats_that_would_be_rounded(self):
+        pmap = EarthMatrix([[0.5, 2.0], [2.0, 2.0]])
+        self.assertEqual('f', pmap._altitudes.typecode)
+        pmap.detect_borders()
+        pmap.set_altitudes({(0, 1): 0.5000000001})
+        self.assertEqual('d', pmap._altitudes.typecode)
+        self.assertEqual(
+            EarthMatrix([[0.5, 0.5000000001], [2.0, 2.0]]).detect_borders(),
+            pmap._get_border_matrix())
+        self.assertEqual([[1, 0], [0, 0]], pmap._get_border_matrix())
+
+    def test_resolution_should_scale_quantized_altitudes_back(self):
+        pmap = EarthMatrix([[0.1, 0.2], [0.3, 0.1]], resolution=0.1)
+        self.assertEqual('B', pmap._altitudes.typecode)
+        self.assertEqual([[1, 0], [0, 1]], pmap.detect_borders())
+        self.assertAlmostEqual(0.2, pmap[0, 1].altitude)
+        pmap.set_altitudes({(0, 1): 0.04})
+        self.assertEqual(0, pmap[0, 1].altitude)
+        self.assertEqual([[0, 1], [0, 0]], pmap._get_border_matrix())
+        self.assertAlmostEqual(0.3, pmap.get_strata()[pmap[1, 0].stratum]
+                               .altitude)
+
+    def test_resolution_should_raise_if_not_positive(self):
+        for resolution in [0, -1, 'a']:
+            with self.assertRaises(EarthMatrixException) as context:
+                EarthMatrix([[1]], resolution=resolution)
+            self.assertEqual("'resolution' must be a positive number",
+                             str(context.exception))
+
+    def test_set_altitudes_should_not_write_into_caller_buffer(self):
+        points = array('q', [1, 2, 3, 4])
+        pmap = EarthMatrix(memoryview(points).cast('B').cast('q', [2, 2]))
+        pmap.detect_borders()
+        pmap.set_altitudes({(0, 0): 9})
+        self.assertEqual(array('q', [1, 2, 3, 4]), points)
+        self.assertEqual(9, pmap[0, 0].altitude)
+        self.assertEqual([[0, 1], [1, 0]], pmap._get_border_matrix())
+
+    def test_set_altitudes_should_raise_if_coordinates_out_of_range(self):
+        pmap = EarthMatrix([[1, 2]])
+        with self.assertRaises(IndexError):
+            pmap.set_altitudes({(1, 0): 3})
+
+    def test_set_altitudes_should_raise_if_altitudes_are_not_numbers(self):
+        pmap = EarthMatrix([[1, 2]])
+        with self.assertRaises(EarthMatrixException):
+            pmap.set_altitudes({(0, 0): 'a'})
+
     def test_compute_strata_should_set_same_stratum_to_neighbors_with_same_altitude(self):
         pmap = EarthMatrix([
             [1, 1, 1, 3],
@@ -145,117 +529,125 @@ class TestEarthMatrix(unittest.TestCase):
         strata_2 = [pmap[1, 0], pmap[1, 1]]
         for point in strata_0:
             self.assertEqual(0, point.stratum)
-        self.assertEqual(sorted(strata_0), sorted(pmap._strata[0]))
         for point in strata_1:
             self.assertEqual(1, point.stratum)
-        self.assertEqual(sorted(strata_1), sorted(pmap._strata[1]))
         for point in strata_2:
             self.assertEqual(2, point.stratum)
+        self.assertEqual(array('i', [0, 3, 4]), pmap._strata)
 
-    def test_init_stratum_should_assign_next_free_strata_group(self):
-        pmap = EarthMatrix([[]])
-        pmap._strata = [['strata_group_0'], ['strata_group_1']]
-        point = EarthPoint(1, 5, 15)
-        pmap._init_stratum(point)
-        self.assertEqual(2, point.stratum)
+    def test_compute_strata_should_not_recurse_on_plateaus_larger_than_recursion_limit(self):
+        size = 150
+        pmap = EarthMatrix([[7] * size for _ in range(size)])
+        pmap._compute_strata()
+        self.assertEqual(1, len(pmap._strata))
+        self.assertEqual(0, pmap[size - 1, size - 1].stratum)
 
-    def test_init_stratum_should_append_point_to_strata_group(self):
-        pmap = EarthMatrix([[]])
-        pmap._strata = [['strata_group_0'], ['strata_group_1']]
-        point = EarthPoint(1, 5, 15)
-        pmap._init_stratum(point)
-        self.assertEqual([point], pmap._strata[2])
+    def test_compute_strata_should_not_duplicate_strata_if_called_twice(self):
+        pmap = EarthMatrix([
+            [1, 2],
+            [2, 2]])
+        pmap._compute_strata()
+        pmap._compute_strata()
+        self.assertEqual(array('i', [0, 1]), pmap._strata)
+
+    def test_init_stratum_should_assign_next_free_strata_group(self):
+        pmap = EarthMatrix([[1, 2, 3]])
+        pmap._strata_ids = array('i', [-1] * 3)
+        pmap._strata = array('i', [0, 1])
+        pmap._init_stratum(2)
+        self.assertEqual(2, pmap[0, 2].stratum)
+
+    def test_init_stratum_should_append_cell_to_strata(self):
+        pmap = EarthMatrix([[1, 2, 3]])
+        pmap._strata_ids = array('i', [-1] * 3)
+        pmap._strata = array('i', [0, 1])
+        pmap._init_stratum(2)
+        self.assertEqual(array('i', [0, 1, 2]), pmap._strata)
 
     def test_transmit_stratum_to_neighbors_should_only_transmit_if_same_altitude(self):
-        neighbor_1 = EarthPoint(0, 0, 5)
-        neighbor_2 = EarthPoint(0, 2, 6)
-        neighbor_3 = EarthPoint(1, 1, 7)
-        with mock.patch(
-                'earthmatrix.EarthMatrix._get_neighbors',
-                side_effect=([neighbor_1, neighbor_2, neighbor_3], [], [], [])):
-            pmap = EarthMatrix([[]])
-            pmap._strata.extend([[], [], []])
-            pmap._transmit_stratum_to_neighbors(EarthPoint(0, 1, 6, stratum=2))
-        self.assertEqual(neighbor_1.stratum, None)
-        self.assertEqual(neighbor_2.stratum, 2)
-        self.assertEqual(neighbor_3.stratum, None)
-        self.assertEqual([neighbor_2], pmap._strata[2])
+        pmap = EarthMatrix([
+            [5, 6, 6],
+            [7, 7, 7]])
+        pmap._strata_ids = array('i', [-1] * 6)
+        pmap._strata_ids[1] = 2
+        pmap._transmit_stratum_to_neighbors(1)
+        self.assertEqual(None, pmap[0, 0].stratum)
+        self.assertEqual(2, pmap[0, 2].stratum)
+        self.assertEqual(None, pmap[1, 1].stratum)
 
     def test_transmit_stratum_to_neighbors_should_only_transmit_if_no_stratum(self):
-        neighbor_1 = EarthPoint(0, 0, 5)
-        neighbor_2 = EarthPoint(0, 2, 6, stratum=5)
-        neighbor_3 = EarthPoint(1, 1, 7)
-        with mock.patch(
-                'earthmatrix.EarthMatrix._get_neighbors',
-                side_effect=([neighbor_1, neighbor_2, neighbor_3], [], [], [])):
-            pmap = EarthMatrix([[]])
-            pmap._strata.extend([[], [], []])
-            pmap._transmit_stratum_to_neighbors(EarthPoint(0, 1, 6, stratum=2))
-        self.assertEqual(neighbor_1.stratum, None)
-        self.assertEqual(neighbor_2.stratum, 5)
-        self.assertEqual(neighbor_3.stratum, None)
-        self.assertEqual([], pmap._strata[2])
+        pmap = EarthMatrix([
+            [5, 6, 6],
+            [7, 7, 7]])
+        pmap._strata_ids = array('i', [-1] * 6)
+        pmap._strata_ids[1] = 2
+        pmap._strata_ids[2] = 5
+        pmap._transmit_stratum_to_neighbors(1)
+        self.assertEqual(None, pmap[0, 0].stratum)
+        self.assertEqual(5, pmap[0, 2].stratum)
+        self.assertEqual(None, pmap[1, 1].stratum)
+
+    def test_transmit_stratum_to_neighbors_should_return_whether_all_points_are_minimum(self):
+        pmap = EarthMatrix([
+            [1, 1, 0],
+            [2, 1, 3]])
+        pmap._strata_ids = array('i', [-1] * 6)
+        pmap._strata_ids[0] = 0
+        self.assertEqual(0, pmap._transmit_stratum_to_neighbors(0))
+        pmap._strata_ids[2] = 1
+        self.assertEqual(1, pmap._transmit_stratum_to_neighbors(2))
+
+    def test_get_neighbor_index_should_list_neighbors_of_each_cell(self):
+        pmap = EarthMatrix([
+            [5, 4],
+            [1, 2]])
+        offsets, neighbors = pmap._get_neighbor_index()
+        self.assertEqual(array('i', [0, 2, 4, 6, 8]), offsets)
+        self.assertEqual(array('i', [1, 2, 0, 3, 0, 3, 2, 1]), neighbors)
+        self.assertIs(offsets, pmap._get_neighbor_index()[0])
 
     def test_is_minimum_should_return_true_if_altitude_is_lessthan_neighborss(self):
         with mock.patch(
                 'earthmatrix.EarthMatrix._get_neighbors',
-                side_effect=([EarthPoint(0, 0, 2), EarthPoint(0, 1, 3), EarthPoint(0, 2, 4)],)):
-            pmap = EarthMatrix([[]])
-            self.assertTrue(pmap._is_minimum(EarthPoint(0, 0, 1)))
+                side_effect=([1, 2, 3],)):
+            pmap = EarthMatrix([[1, 2, 3, 4]])
+            self.assertTrue(pmap._is_minimum(0))
 
     def test_is_minimum_should_return_true_if_altitude_is_equal_to_neighborss(self):
         with mock.patch(
                 'earthmatrix.EarthMatrix._get_neighbors',
-                side_effect=([EarthPoint(0, 0, 1), EarthPoint(0, 1, 1), EarthPoint(0, 2, 1)],)):
-            pmap = EarthMatrix([[]])
-            self.assertTrue(pmap._is_minimum(EarthPoint(0, 0, 1)))
+                side_effect=([1, 2, 3],)):
+            pmap = EarthMatrix([[1, 1, 1, 1]])
+            self.assertTrue(pmap._is_minimum(0))
 
     def test_is_minimum_should_return_true_if_altitude_is_lessequal_to_neighborss(self):
         with mock.patch(
                 'earthmatrix.EarthMatrix._get_neighbors',
-                side_effect=([EarthPoint(0, 0, 1), EarthPoint(0, 1, 2), EarthPoint(0, 2, 3)],)):
-            pmap = EarthMatrix([[]])
-            self.assertTrue(pmap._is_minimum(EarthPoint(0, 0, 1)))
+                side_effect=([1, 2, 3],)):
+            pmap = EarthMatrix([[1, 1, 2, 3]])
+            self.assertTrue(pmap._is_minimum(0))
 
     def test_is_minimum_should_return_false_if_altitude_is_greaterthan_any_neighbors(self):
         with mock.patch(
                 'earthmatrix.EarthMatrix._get_neighbors',
-                side_effect=([EarthPoint(0, 0, 1), EarthPoint(0, 1, 0), EarthPoint(0, 2, 1)],)):
-            pmap = EarthMatrix([[]])
-            self.assertFalse(pmap._is_minimum(EarthPoint(0, 0, 1)))
+                side_effect=([1, 2, 3],)):
+            pmap = EarthMatrix([[1, 1, 0, 1]])
+            self.assertFalse(pmap._is_minimum(0))
 
     def test_get_neighbors_should_return_only_points_with_valid_coordinates(self):
         pmap = EarthMatrix([
             [5, 4, 3],
             [1, 2, 6],
             [7, 9, 0]])
-        self.assertEqual(
-            [EarthPoint(0, 1, 4), EarthPoint(1, 0, 1)],
-            pmap._get_neighbors(pmap[0, 0]))
-        self.assertEqual(
-            [EarthPoint(0, 0, 5), EarthPoint(0, 2, 3), EarthPoint(1, 1, 2)],
-            pmap._get_neighbors(pmap[0, 1]))
-        self.assertEqual(
-            [EarthPoint(0, 1, 4), EarthPoint(1, 2, 6)],
-            pmap._get_neighbors(pmap[0, 2]))
-        self.assertEqual(
-            [EarthPoint(0, 0, 5), EarthPoint(1, 1, 2), EarthPoint(2, 0, 7)],
-            pmap._get_neighbors(pmap[1, 0]))
-        self.assertEqual(
-            [EarthPoint(1, 0, 1), EarthPoint(0, 1, 4), EarthPoint(1, 2, 6), EarthPoint(2, 1, 9)],
-            pmap._get_neighbors(pmap[1, 1]))
-        self.assertEqual(
-            [EarthPoint(1, 1, 2), EarthPoint(0, 2, 3), EarthPoint(2, 2, 0)],
-            pmap._get_neighbors(pmap[1, 2]))
-        self.assertEqual(
-            [EarthPoint(1, 0, 1), EarthPoint(2, 1, 9)],
-            pmap._get_neighbors(pmap[2, 0]))
-        self.assertEqual(
-            [EarthPoint(2, 0, 7), EarthPoint(1, 1, 2), EarthPoint(2, 2, 0)],
-            pmap._get_neighbors(pmap[2, 1]))
-        self.assertEqual(
-            [EarthPoint(2, 1, 9), EarthPoint(1, 2, 6)],
-            pmap._get_neighbors(pmap[2, 2]))
+        self.assertEqual([1, 3], pmap._get_neighbors(0))
+        self.assertEqual([0, 2, 4], pmap._get_neighbors(1))
+        self.assertEqual([1, 5], pmap._get_neighbors(2))
+        self.assertEqual([0, 4, 6], pmap._get_neighbors(3))
+        self.assertEqual([3, 1, 5, 7], pmap._get_neighbors(4))
+        self.assertEqual([4, 2, 8], pmap._get_neighbors(5))
+        self.assertEqual([3, 7], pmap._get_neighbors(6))
+        self.assertEqual([6, 4, 8], pmap._get_neighbors(7))
+        self.assertEqual([7, 5], pmap._get_neighbors(8))
 
     def test_is_valid_coordinates_should_return_false_if_x_lessthan_0(self):
         pmap = EarthMatrix([[]])
@@ -312,15 +704,7 @@ class TestEarthMatrix(unittest.TestCase):
             [1, 2, 3],
             [4, 5, 6],
             [7, 8, 9]])
-        pmap._points[0][0].is_border = True
-        pmap._points[0][1].is_border = False
-        pmap._points[0][2].is_border = True
-        pmap._points[1][0].is_border = False
-        pmap._points[1][1].is_border = True
-        pmap._points[1][2].is_border = False
-        pmap._points[2][0].is_border = True
-        pmap._points[2][1].is_border = False
-        pmap._points[2][2].is_border = True
+        pmap._borders = array('b', [1, 0, 1, 0, 1, 0, 1, 0, 1])
         self.assertEqual([
             [1, 0, 1],
             [0, 1, 0],
@@ -341,6 +725,23 @@ class TestEarthMatrix(unittest.TestCase):
         self.assertEqual(EarthPoint(2, 1, 9), pmap[2, 1])
         self.assertEqual(EarthPoint(2, 2, 0), pmap[2, 2])
 
+    def test_getitem_should_return_points_with_stratum_and_border(self):
+        pmap = EarthMatrix([
+            [5, 4],
+            [4, 4]])
+        pmap.detect_borders()
+        self.assertEqual(EarthPoint(0, 0, 5, 0, False), pmap[0, 0])
+        self.assertEqual(EarthPoint(1, 1, 4, 1, True), pmap[1, 1])
+
+    def test_getitem_should_raise_if_index_out_of_range(self):
+        pmap = EarthMatrix([
+            [5, 4, 3],
+            [1, 2, 6]])
+        with self.assertRaises(IndexError):
+            pmap[0, 3]
+        with self.assertRaises(IndexError):
+            pmap[-1, 0]
+
     def test_str_should_return_pipe_between_cols_and_newlines_between_rows(self):
         pmap = EarthMatrix([
             [5, 4, 3],
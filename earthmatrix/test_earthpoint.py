@@ -69,6 +69,10 @@ class TestEarthEarthPoint(unittest.TestCase):
         point_b = EarthPoint(x=1, y=5, altitude=102, stratum=5, is_border=True)
         self.assertNotEqual(point_a, point_b)
 
+    def test_point_should_not_have_instance_dict(self):
+        point = EarthPoint(x=1, y=2, altitude=5)
+        self.assertFalse(hasattr(point, '__dict__'))
+
     def test_str_should_return_altitude_space_par_stratum_star_if_border(self):
         point_a = EarthPoint(x=1, y=5, altitude=102, stratum=5, is_border=False)
         point_b = EarthPoint(x=1, y=5, altitude=2, stratum=10, is_border=True)
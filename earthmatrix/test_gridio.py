@@ -0,0 +1,160 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from earthmatrix import EarthMatrixException
+from gridio import (
+    detect_grid_borders, dumps_grid, load_array, load_borders, load_matrix,
+    open_grid, pack_borders, read_grid, save_borders, save_grid,
+    unpack_borders)
+
+PHOTOGRAPH = [
+    [9, 2, 2, 2, 3, 5],
+    [9, 8, 3, 2, 4, 5],
+    [9, 7, 2, 2, 4, 3],
+    [9, 9, 2, 4, 4, 3],
+    [9, 2, 3, 4, 3, 5]]
+BORDERS = [
+    [0, 1, 1, 1, 0, 0],
+    [0, 0, 0, 1, 0, 0],
+    [0, 0, 1, 1, 0, 1],
+    [0, 0, 1, 0, 0, 1],
+    [0, 1, 0, 0, 1, 0]]
+
+
+class TestGridIO(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def test_load_matrix_should_read_saved_lists(self):
+        save_grid(self.path('grid.emg'), PHOTOGRAPH)
+        matrix = load_matrix(self.path('grid.emg'))
+        self.assertEqual(BORDERS, matrix.detect_borders())
+
+    def test_load_matrix_should_read_saved_arrays(self):
+        save_grid(self.path('grid.emg'), np.array(PHOTOGRAPH, dtype=np.uint8))
+        altitudes, n_rows, n_cols = open_grid(self.path('grid.emg'))
+        self.assertEqual(('B', 5, 6), (altitudes.format, n_rows, n_cols))
+        self.assertEqual(
+            BORDERS, load_matrix(self.path('grid.emg')).detect_borders())
+
+    def test_load_matrix_should_read_npy_files(self):
+        np.save(self.path('grid.npy'), np.array(PHOTOGRAPH, dtype=np.int16))
+        self.assertEqual(
+            BORDERS, load_matrix(self.path('grid.npy')).detect_borders())
+
+    def test_load_matrix_should_map_file_without_copying(self):
+        save_grid(self.path('grid.emg'), PHOTOGRAPH)
+        matrix = load_matrix(self.path('grid.emg'))
+        self.assertIsInstance(matrix._altitudes, memoryview)
+
+    def test_load_array_should_return_array_over_file(self):
+        np.save(self.path('grid.npy'), np.array(PHOTOGRAPH))
+        np.testing.assert_array_equal(
+            PHOTOGRAPH, load_array(self.path('grid.npy')))
+
+    def test_load_array_should_swap_bytes_of_other_byte_order(self):
+        np.save(self.path('grid.npy'), np.array(PHOTOGRAPH, dtype='>i4'))
+        np.save(self.path('other.npy'), np.array(PHOTOGRAPH, dtype='<i4'))
+        for name in ('grid.npy', 'other.npy'):
+            np.testing.assert_array_equal(
+                PHOTOGRAPH, load_array(self.path(name)))
+            self.assertEqual(
+                BORDERS, load_matrix(self.path(name)).detect_borders())
+
+    def test_detect_grid_borders_should_match_earthmatrix(self):
+        save_grid(self.path('grid.emg'), PHOTOGRAPH)
+        borders = detect_grid_borders(*open_grid(self.path('grid.emg')))
+        self.assertEqual(BORDERS, borders.tolist())
+
+    def test_open_grid_should_raise_if_file_is_not_a_grid(self):
+        with open(self.path('grid.emg'), 'wb') as output:
+            output.write(b'something else entirely')
+        with self.assertRaises(EarthMatrixException):
+            open_grid(self.path('grid.emg'))
+
+    def test_open_grid_should_raise_if_file_is_truncated(self):
+        save_grid(self.path('grid.emg'), PHOTOGRAPH)
+        with open(self.path('grid.emg'), 'r+b') as output:
+            output.truncate(40)
+        with self.assertRaises(EarthMatrixException):
+            open_grid(self.path('grid.emg'))
+
+    def test_read_grid_should_raise_if_npy_header_is_truncated(self):
+        np.save(self.path('grid.npy'), np.array(PHOTOGRAPH))
+        with open(self.path('grid.npy'), 'rb') as source:
+            data = source.read()
+        for size in (7, 9, 11, 40):
+            with self.assertRaises(EarthMatrixException):
+                read_grid(data[:size])
+
+    def test_read_grid_should_raise_if_npy_header_is_garbled(self):
+        for header in (b"{'descr': '<i8', 'shape': (5, 6)", b'[1, 2]',
+                       b"{'descr': '<i8', 'fortran_order': False}",
+                       b"{'descr': 8, 'fortran_order': False, "
+                       b"'shape': (5, 6)}",
+                       b"{'descr': '<i8', 'fortran_order': False, "
+                       b"'shape': 'ab'}",
+                       b"{'descr': '<i8', 'fortran_order': False, "
+                       b"'shape': (-2, -2)}"):
+            data = (b'\x93NUMPY\x01\x00' +
+                    len(header).to_bytes(2, 'little') + header + bytes(64))
+            with self.assertRaises(EarthMatrixException):
+                read_grid(data)
+        with self.assertRaises(EarthMatrixException):
+            read_grid(b'\x93NUMPY\x09\x00\x00\x00')
+
+    def test_dumps_grid_should_store_other_byte_orders_natively(self):
+        for dtype in ('>i4', '<i4', '>f8', '>u2', 'i8', 'u8'):
+            points = np.array(PHOTOGRAPH, dtype=dtype)
+            altitudes, n_rows, n_cols = read_grid(dumps_grid(points))
+            self.assertEqual((5, 6), (n_rows, n_cols))
+            self.assertEqual(sum(PHOTOGRAPH, []), altitudes.tolist())
+
+    def test_dumps_grid_should_write_fixed_size_typecodes(self):
+        for dtype, typecode in (('i8', b'q'), ('u8', b'Q'), ('i4', b'i')):
+            data = dumps_grid(np.array(PHOTOGRAPH, dtype=dtype))
+            self.assertEqual(typecode, data[7:8])
+
+    def test_load_borders_should_read_saved_borders(self):
+        save_borders(self.path('borders.emm'), BORDERS)
+        self.assertEqual(BORDERS, load_borders(self.path('borders.emm')))
+
+    def test_save_borders_should_use_one_bit_per_point(self):
+        borders = np.ones((100, 80), dtype=np.uint8)
+        save_borders(self.path('borders.emm'), borders)
+        self.assertEqual(
+            24 + 100 * 80 // 8, os.path.getsize(self.path('borders.emm')))
+
+
+class TestPackBorders(unittest.TestCase):
+    def test_pack_borders_should_put_first_point_in_most_significant_bit(self):
+        self.assertEqual(
+            (2, 5, b'\x8d\x00'),
+            pack_borders([[1, 0, 0, 0, 1], [1, 0, 1, 0, 0]]))
+
+    def test_pack_borders_should_match_numpy_packbits(self):
+        borders = np.random.RandomState(1).randint(0, 2, size=(7, 9))
+        self.assertEqual(
+            pack_borders(borders), pack_borders(borders.tolist()))
+
+    def test_unpack_borders_should_restore_packed_borders(self):
+        borders = [[1, 0, 0, 0, 1], [1, 0, 1, 0, 0]]
+        self.assertEqual(
+            borders, unpack_borders(pack_borders(borders)[2], 2, 5))
+
+    def test_unpack_borders_should_handle_empty_rows(self):
+        self.assertEqual([[]], unpack_borders(b'', 1, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,144 @@
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+import numpy as np
+
+from earthmatrix import EarthMatrix, EarthMatrixException
+from gridio import dumps_borders, save_grid
+from main import (
+    ENGINES, iter_border_rows, main, parse_text, read_photograph,
+    write_borders)
+
+PHOTOGRAPH = [
+    [9, 2, 2, 2, 3, 5],
+    [9, 8, 3, 2, 4, 5],
+    [9, 7, 2, 2, 4, 3],
+    [9, 9, 2, 4, 4, 3],
+    [9, 2, 3, 4, 3, 5]]
+BORDERS = [
+    [0, 1, 1, 1, 0, 0],
+    [0, 0, 0, 1, 0, 0],
+    [0, 0, 1, 1, 0, 1],
+    [0, 0, 1, 0, 0, 1],
+    [0, 1, 0, 0, 1, 0]]
+TEXT = '\n'.join(' '.join(str(altitude) for altitude in row)
+                 for row in PHOTOGRAPH) + '\n'
+
+
+def _write(rows, form, matrix=None):
+    output = io.BytesIO()
+    write_borders(iter(rows), output, form, len(BORDERS), len(BORDERS[0]),
+                  matrix)
+    return output.getvalue()
+
+
+class TestMain(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_parse_text_should_accept_spaces_commas_and_json(self):
+        self.assertEqual([[1, 2.5], [3, 4]], parse_text('1 2.5\n\n3, 4,\n'))
+        self.assertEqual([[1, 2]], parse_text(' [[1, 2]]'))
+
+    def test_parse_text_should_raise_if_altitudes_are_not_numbers(self):
+        with self.assertRaises(EarthMatrixException) as context:
+            parse_text('1 a')
+        self.assertEqual(
+            "'points' altitudes must be numbers", str(context.exception))
+
+    def test_read_photograph_should_read_text_and_binary_files(self):
+        text = os.path.join(self.directory, 'photograph.txt')
+        with open(text, 'w') as output:
+            output.write(TEXT)
+        self.assertEqual((PHOTOGRAPH, 5, 6), read_photograph(text))
+        for name, points in (('photograph.grid', PHOTOGRAPH),
+                             ('photograph.npy', np.array(PHOTOGRAPH))):
+            path = os.path.join(self.directory, name)
+            if name.endswith('.npy'):
+                np.save(path, points)
+            else:
+                save_grid(path, points)
+            altitudes, n_rows, n_cols = read_photograph(path)
+            self.assertEqual((5, 6), (n_rows, n_cols))
+            self.assertEqual(sum(PHOTOGRAPH, []), altitudes.tolist())
+
+    def test_read_photograph_should_raise_if_json_is_not_list_of_lists(self):
+        path = os.path.join(self.directory, 'photograph.txt')
+        for text in ('[1, 2]', '[]', '[[1], 2]'):
+            with open(path, 'w') as output:
+                output.write(text)
+            with self.assertRaises(EarthMatrixException):
+                read_photograph(path)
+
+    def test_iter_border_rows_should_match_for_every_engine(self):
+        for engine in ENGINES:
+            _, rows = iter_border_rows(PHOTOGRAPH, 5, 6, engine, workers=2,
+                                       band_rows=2)
+            self.assertEqual(BORDERS, [list(row) for row in rows])
+
+    def test_iter_border_rows_should_raise_if_options_need_python(self):
+        with self.assertRaises(EarthMatrixException):
+            iter_border_rows(PHOTOGRAPH, 5, 6, 'numpy', connectivity=8)
+
+    def test_write_borders_should_write_every_form(self):
+        rows = [bytes(row) for row in BORDERS]
+        self.assertEqual(
+            ''.join(' '.join(str(flag) for flag in row) + '\n'
+                    for row in BORDERS).encode('ascii'),
+            _write(rows, 'matrix'))
+        self.assertEqual(b'1:3\n3:1\n2:2 5:1\n2:1 5:1\n1:1 4:1\n',
+                         _write(rows, 'runs'))
+        self.assertEqual(
+            b'0 1\n0 2\n0 3\n1 3\n2 2\n2 3\n2 5\n3 2\n3 5\n4 1\n4 4\n',
+            _write(rows, 'coordinates'))
+        self.assertEqual(dumps_borders(BORDERS), _write(rows, 'bitset'))
+
+    def test_write_borders_should_write_bitset_in_chunks_of_rows(self):
+        borders = [[x % 3 == y % 2 for y in range(5)] for x in range(19)]
+        output = io.BytesIO()
+        write_borders((bytes(row) for row in borders), output, 'bitset', 19,
+                      5)
+        self.assertEqual(dumps_borders(np.array(borders, dtype=np.uint8)),
+                         output.getvalue())
+
+    def test_write_borders_should_write_annotated_matrix(self):
+        matrix = EarthMatrix(PHOTOGRAPH)
+        output = _write(matrix.iter_border_rows(), 'annotated', matrix)
+        self.assertEqual((str(matrix) + '\n').encode('utf-8'), output)
+        self.assertIn(b' 2 ( 1)*|', output)
+
+    def test_main_should_stream_borders_and_print_profile(self):
+        path = os.path.join(self.directory, 'photograph.txt')
+        with open(path, 'w') as output:
+            output.write(TEXT)
+        stdout = io.TextIOWrapper(io.BytesIO())
+        stderr = io.StringIO()
+        with mock.patch('sys.stdout', stdout), \
+                mock.patch('sys.stderr', stderr):
+            self.assertEqual(0, main([path, '--output', 'runs',
+                                      '--profile']))
+        self.assertEqual(b'1:3\n3:1\n2:2 5:1\n2:1 5:1\n1:1 4:1\n',
+                         stdout.buffer.getvalue())
+        stages = [line.split()[0] for line in stderr.getvalue().splitlines()]
+        self.assertEqual(['read', 'validate_points', 'parse_points',
+                          'compute_strata', 'minimality', 'detect', 'write'],
+                         stages)
+
+    def test_main_should_report_errors(self):
+        stderr = io.StringIO()
+        with mock.patch('sys.stderr', stderr):
+            self.assertEqual(1, main([os.path.join(self.directory, 'none')]))
+            self.assertEqual(2, main(['-', '--engine', 'numpy',
+                                      '--output', 'annotated']))
+        self.assertTrue(stderr.getvalue().startswith('error: '))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import random
+import unittest
+
+from earthmatrix import EarthMatrixException
+from masks import FORMS, convert_borders, from_flags, to_flags
+
+BORDERS = [
+    [1, 1, 0, 0, 1],
+    [0, 0, 0, 0, 0],
+    [1, 0, 1, 1, 1]]
+RUNS = [[(0, 2), (4, 1)], [], [(0, 1), (2, 3)]]
+COORDINATES = [(0, 0), (0, 1), (0, 4), (2, 0), (2, 2), (2, 3), (2, 4)]
+BITSET = b'\xc8\x2e'
+
+
+class TestMasks(unittest.TestCase):
+    def test_from_flags_should_codify_every_form(self):
+        flags = bytes(sum(BORDERS, []))
+        self.assertEqual(BORDERS, from_flags(flags, 'matrix', 3, 5))
+        self.assertEqual(RUNS, from_flags(flags, 'runs', 3, 5))
+        self.assertEqual(COORDINATES, from_flags(flags, 'coordinates', 3, 5))
+        self.assertEqual(BITSET, from_flags(flags, 'bitset', 3, 5))
+
+    def test_to_flags_should_decode_every_form(self):
+        flags = bytearray(sum(BORDERS, []))
+        for form, borders in zip(
+                FORMS, (BORDERS, RUNS, COORDINATES, BITSET)):
+            self.assertEqual(flags, to_flags(borders, form, 3, 5))
+
+    def test_convert_borders_should_round_trip_random_masks(self):
+        generator = random.Random(5)
+        for _ in range(20):
+            n_rows = generator.randint(1, 6)
+            n_cols = generator.randint(0, 11)
+            borders = [[generator.randint(0, 1) for _ in range(n_cols)]
+                       for _ in range(n_rows)]
+            for form in FORMS:
+                converted = convert_borders(
+                    borders, 'matrix', form, n_rows, n_cols)
+                self.assertEqual(borders, convert_borders(
+                    converted, form, 'matrix', n_rows, n_cols))
+
+    def test_from_flags_should_raise_if_form_is_unknown(self):
+        with self.assertRaises(EarthMatrixException):
+            from_flags(b'\x01', 'dense', 1, 1)
+        with self.assertRaises(EarthMatrixException):
+            to_flags([[1]], 'dense', 1, 1)
+
+    def test_to_flags_should_raise_if_bitset_is_truncated(self):
+        with self.assertRaises(EarthMatrixException):
+            to_flags(b'\xff', 'bitset', 3, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,154 @@
+import random
+import unittest
+
+import numpy as np
+
+from earthmatrix import EarthMatrix, EarthMatrixException, EarthPoint
+from ndmatrix import (
+    NdEarthMatrix, border_mask, label_strata, minimum_mask, union_pairs)
+
+
+class TestNdEarthMatrix(unittest.TestCase):
+    def test_detect_borders_should_match_earthmatrix(self):
+        photograph = [
+            [9, 2, 2, 2, 3, 5],
+            [9, 8, 3, 2, 4, 5],
+            [9, 7, 2, 2, 4, 3],
+            [9, 9, 2, 4, 4, 3],
+            [9, 2, 3, 4, 3, 5]]
+        self.assertEqual(
+            EarthMatrix(photograph).detect_borders(),
+            NdEarthMatrix(photograph).detect_borders())
+
+    def test_detect_borders_should_match_earthmatrix_for_random_maps(self):
+        generator = random.Random(7)
+        for _ in range(50):
+            n_rows = generator.randint(1, 12)
+            n_cols = generator.randint(1, 12)
+            photograph = [[generator.randint(0, 3) for _ in range(n_cols)]
+                          for _ in range(n_rows)]
+            self.assertEqual(
+                EarthMatrix(photograph).detect_borders(),
+                NdEarthMatrix(photograph).detect_borders())
+
+    def test_earthmatrix_should_share_numpy_arrays_altitudes(self):
+        altitudes = np.random.RandomState(3).randint(0, 4, size=(9, 11))
+        pmap = EarthMatrix(altitudes)
+        self.assertTrue(np.shares_memory(altitudes, pmap._altitudes))
+        self.assertEqual(
+            NdEarthMatrix(altitudes).detect_borders(), pmap.detect_borders())
+        self.assertEqual(
+            NdEarthMatrix(altitudes.T).detect_borders(),
+            EarthMatrix(altitudes.T).detect_borders())
+
+    def test_earthmatrix_should_raise_if_numpy_array_is_empty(self):
+        with self.assertRaises(EarthMatrixException) as context:
+            EarthMatrix(np.zeros((0, 3)))
+        self.assertEqual(
+            "'points' must be a non empty list", str(context.exception))
+
+    def test_get_strata_should_match_earthmatrix_for_random_maps(self):
+        generator = random.Random(11)
+        for _ in range(30):
+            n_rows = generator.randint(1, 9)
+            n_cols = generator.randint(1, 9)
+            photograph = [[generator.randint(0, 3) for _ in range(n_cols)]
+                          for _ in range(n_rows)]
+            self.assertEqual(
+                list(EarthMatrix(photograph).get_strata()),
+                list(NdEarthMatrix(photograph).get_strata()))
+        self.assertEqual(
+            0, NdEarthMatrix(photograph).stratum_at(0, 0))
+
+    def test_detect_borders_should_match_earthmatrix_in_every_form(self):
+        photograph = np.random.RandomState(2).randint(0, 3, size=(7, 13))
+        for form in ('matrix', 'runs', 'coordinates', 'bitset'):
+            self.assertEqual(
+                EarthMatrix(photograph.tolist()).detect_borders(form),
+                NdEarthMatrix(photograph).detect_borders(form=form))
+
+    def test_detect_borders_should_return_array_if_requested(self):
+        borders = NdEarthMatrix(np.array([
+            [5, 5, 5],
+            [5, 9, 5]])).detect_borders(as_array=True)
+        self.assertEqual(np.uint8, borders.dtype)
+        np.testing.assert_array_equal([[1, 1, 1], [1, 0, 1]], borders)
+
+    def test_detect_borders_should_handle_empty_rows(self):
+        self.assertEqual([[]], NdEarthMatrix([[]]).detect_borders())
+
+    def test_parse_points_should_raise_if_points_are_not_list_of_lists(self):
+        with self.assertRaises(EarthMatrixException) as context:
+            NdEarthMatrix._parse_points([[1, 2], (3, 4)])
+        self.assertEqual("'points' must be a list of lists",
+                         str(context.exception))
+
+    def test_parse_points_should_raise_if_array_is_not_2_dimensional(self):
+        with self.assertRaises(EarthMatrixException) as context:
+            NdEarthMatrix._parse_points(np.zeros((2, 2, 2)))
+        self.assertEqual("'points' must be a 2-dimensional array",
+                         str(context.exception))
+
+    def test_parse_points_should_raise_if_altitudes_are_not_numbers(self):
+        with self.assertRaises(EarthMatrixException) as context:
+            NdEarthMatrix._parse_points([['a', 'b']])
+        self.assertEqual("'points' altitudes must be numbers",
+                         str(context.exception))
+
+    def test_getitem_should_return_points(self):
+        pmap = NdEarthMatrix([
+            [5, 4],
+            [4, 4]])
+        self.assertEqual(EarthPoint(0, 0, 5), pmap[0, 0])
+        pmap.detect_borders()
+        self.assertEqual(EarthPoint(0, 0, 5, 0, False), pmap[0, 0])
+        self.assertEqual(EarthPoint(1, 1, 4, 1, True), pmap[1, 1])
+
+
+class TestArrayFunctions(unittest.TestCase):
+    def test_minimum_mask_should_compare_with_4_neighbors(self):
+        np.testing.assert_array_equal([
+            [False, False, False],
+            [True, False, True],
+            [False, True, True]], minimum_mask(np.array([
+                [5, 4, 5],
+                [1, 2, 1],
+                [7, 1, 1]])))
+
+    def test_label_strata_should_number_strata_in_row_major_order(self):
+        labels, n_strata = label_strata(np.array([
+            [1, 1, 1, 3],
+            [2, 2, 1, 3],
+            [1, 1, 1, 3]]))
+        self.assertEqual(3, n_strata)
+        np.testing.assert_array_equal([
+            [0, 0, 0, 1],
+            [2, 2, 0, 1],
+            [0, 0, 0, 1]], labels)
+
+    def test_label_strata_should_label_spiral_plateau_as_one_stratum(self):
+        altitudes = np.ones((9, 9), dtype=int)
+        altitudes[1, 1:8] = altitudes[1:8, 7] = altitudes[7, 1:8] = 0
+        altitudes[3:7, 1] = altitudes[3, 2:6] = altitudes[4:6, 5] = 0
+        labels, n_strata = label_strata(altitudes)
+        self.assertEqual(len(set(labels[altitudes == 0])), 1)
+
+    def test_label_strata_should_label_stack_of_photographs_independently(self):
+        labels, n_strata = label_strata(np.zeros((3, 2, 2), dtype=int))
+        self.assertEqual(3, n_strata)
+        np.testing.assert_array_equal([0, 1, 2], labels[:, 0, 0])
+
+    def test_union_pairs_should_point_every_element_to_smallest_of_its_set(self):
+        parents = union_pairs(
+            6, np.array([5, 3, 1]), np.array([3, 1, 4]))
+        np.testing.assert_array_equal([0, 1, 2, 1, 1, 1], parents)
+
+    def test_border_mask_should_mark_strata_with_all_minimum_points(self):
+        np.testing.assert_array_equal(
+            [True, True, False, False],
+            border_mask(np.array([0, 0, 1, 1]), 2,
+                        np.array([True, True, True, False])))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+import unittest
+
+import numpy as np
+
+from earthmatrix import EarthMatrix, EarthMatrixException
+from ndmatrix import NdEarthMatrix
+from parallel import SharedArray, detect_borders_parallel
+
+
+class TestDetectBordersParallel(unittest.TestCase):
+    def test_detect_borders_parallel_should_match_serial_detection(self):
+        generator = np.random.RandomState(5)
+        for shape in ((5, 6), (1, 1), (17, 3), (3, 17), (1, 0)):
+            grid = generator.randint(0, 3, size=shape)
+            expected = NdEarthMatrix(grid).detect_borders(as_array=True)
+            for workers in (1, 2, 4):
+                np.testing.assert_array_equal(
+                    expected, detect_borders_parallel(grid, workers, True))
+
+    def test_detect_borders_parallel_should_return_lists_by_default(self):
+        photograph = [
+            [9, 2, 2, 2, 3, 5],
+            [9, 8, 3, 2, 4, 5],
+            [9, 7, 2, 2, 4, 3],
+            [9, 9, 2, 4, 4, 3],
+            [9, 2, 3, 4, 3, 5]]
+        self.assertEqual(
+            EarthMatrix(photograph).detect_borders(),
+            detect_borders_parallel(photograph, workers=3))
+
+    def test_detect_borders_parallel_should_raise_if_workers_not_positive(self):
+        with self.assertRaises(EarthMatrixException) as context:
+            detect_borders_parallel([[1]], workers=0)
+        self.assertEqual("'workers' must be a positive number",
+                         str(context.exception))
+
+
+class TestSharedArray(unittest.TestCase):
+    def test_attach_should_share_array_contents(self):
+        with SharedArray((2, 3), np.int16) as shared:
+            shared.array[...] = 7
+            memory, array = SharedArray.attach(shared.spec)
+            np.testing.assert_array_equal(np.full((2, 3), 7), array)
+            del array
+            memory.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
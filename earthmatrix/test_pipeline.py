@@ -0,0 +1,144 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from earthmatrix import EarthMatrix, EarthMatrixException
+from gridio import load_borders, loads_borders, save_grid
+from pipeline import detect_borders_files
+from profiling import StageProfiler
+
+
+class TestDetectBordersFiles(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        generator = np.random.RandomState(13)
+        self.paths = []
+        self.expected = {}
+        for index in range(12):
+            photograph = generator.randint(
+                0, 3, size=generator.randint(1, 8, size=2))
+            path = os.path.join(self.directory, 'photograph{0}'.format(index))
+            if index % 2:
+                path += '.npy'
+                np.save(path, photograph)
+            else:
+                path += '.grid'
+                save_grid(path, photograph.tolist())
+            self.paths.append(path)
+            self.expected[path] = EarthMatrix(
+                photograph.tolist()).detect_borders()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_detect_borders_files_should_write_masks_to_directory(self):
+        output = os.path.join(self.directory, 'masks')
+        os.mkdir(output)
+        report = detect_borders_files(self.paths, output, workers=1)
+        self.assertEqual(12, report['files'])
+        self.assertEqual({}, report['errors'])
+        for path, borders in self.expected.items():
+            name = os.path.splitext(os.path.basename(path))[0] + '.mask'
+            self.assertEqual(
+                borders, load_borders(os.path.join(output, name)))
+
+    def test_detect_borders_files_should_not_overwrite_masks(self):
+        output = os.path.join(self.directory, 'masks')
+        os.mkdir(output)
+        other = os.path.join(self.directory, 'photograph1.grid')
+        save_grid(other, [[1]])
+        report = detect_borders_files(
+            self.paths[:2] + [other], output, workers=1)
+        self.assertEqual(2, report['files'])
+        self.assertEqual([other], list(report['errors']))
+        self.assertEqual(self.expected[self.paths[1]], load_borders(
+            os.path.join(output, 'photograph1.mask')))
+
+    def test_detect_borders_files_should_report_every_stage(self):
+        profiler = StageProfiler()
+        masks = {}
+        with ThreadPoolExecutor(2) as executor:
+            report = detect_borders_files(
+                iter(self.paths), masks.__setitem__, readers=2, workers=2,
+                executor=executor, max_queued=2, profiler=profiler)
+        self.assertEqual(self.expected, dict(
+            (path, loads_borders(mask)) for path, mask in masks.items()))
+        cells = sum(len(borders) * len(borders[0])
+                    for borders in self.expected.values())
+        for stage in ('read', 'detect', 'write'):
+            self.assertEqual(12, report['stages'][stage]['files'])
+            self.assertGreater(report['stages'][stage]['files_per_second'], 0)
+            self.assertEqual(cells, sum(record['cells']
+                                        for record in profiler.records
+                                        if record['stage'] == stage))
+        self.assertEqual(36, len(profiler.records))
+
+    def test_detect_borders_files_should_read_other_byte_order(self):
+        path = os.path.join(self.directory, 'swapped.npy')
+        np.save(path, np.array([[3, 1], [2, 1]], dtype='>i4'))
+        masks = {}
+        with ThreadPoolExecutor(1) as executor:
+            report = detect_borders_files([path], masks.__setitem__,
+                                          workers=1, executor=executor)
+        self.assertEqual({}, report['errors'])
+        self.assertEqual([[0, 1], [0, 1]], loads_borders(masks[path]))
+
+    def test_detect_borders_files_should_report_failed_files(self):
+        broken = os.path.join(self.directory, 'broken.grid')
+        with open(broken, 'wb') as output:
+            output.write(b'not a grid')
+        masks = {}
+        with ThreadPoolExecutor(1) as executor:
+            report = detect_borders_files(
+                [broken, os.path.join(self.directory, 'missing.grid'),
+                 self.paths[0]], masks.__setitem__, workers=1,
+                executor=executor)
+        self.assertEqual(1, report['files'])
+        self.assertEqual([self.paths[0]], list(masks))
+        self.assertEqual({broken: 'not a grid file'},
+                         dict((path, error) for path, error
+                              in report['errors'].items() if path == broken))
+        self.assertEqual(2, len(report['errors']))
+
+    def test_detect_borders_files_should_not_read_far_ahead_of_writer(self):
+        consumed = []
+        released = threading.Event()
+
+        def paths():
+            for path in self.paths:
+                consumed.append(path)
+                yield path
+
+        def write(path, mask):
+            released.wait()
+
+        with ThreadPoolExecutor(1) as executor:
+            thread = threading.Thread(target=detect_borders_files, args=(
+                paths(), write), kwargs={'workers': 1, 'executor': executor,
+                                         'max_queued': 1})
+            thread.start()
+            time.sleep(0.5)
+            self.assertLessEqual(len(consumed), 5)
+            released.set()
+            thread.join()
+        self.assertEqual(self.paths, consumed)
+
+    def test_detect_borders_files_should_raise_if_sizes_not_positive(self):
+        with self.assertRaises(EarthMatrixException):
+            detect_borders_files(self.paths, self.directory, max_queued=0)
+
+    def test_detect_borders_files_should_raise_if_executor_lacks_workers(self):
+        with ThreadPoolExecutor(1) as executor:
+            with self.assertRaises(EarthMatrixException):
+                detect_borders_files(self.paths, self.directory,
+                                     executor=executor)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import json
+import unittest
+
+from earthmatrix import EarthMatrix
+from profiling import StageProfiler
+
+
+class TestStageProfiler(unittest.TestCase):
+    def test_record_should_keep_stage_seconds_and_metrics(self):
+        profiler = StageProfiler()
+        profiler.record('compute_strata', 0.5, cells=4, strata=2)
+        self.assertEqual(
+            [{'stage': 'compute_strata', 'seconds': 0.5, 'cells': 4,
+              'strata': 2}], profiler.records)
+
+    def test_record_should_forward_records_to_callback(self):
+        records = []
+        profiler = StageProfiler(callback=records.append)
+        profiler.record('minimality', 0.25, cells=1)
+        self.assertEqual(profiler.records, records)
+
+    def test_totals_should_add_seconds_per_stage(self):
+        profiler = StageProfiler()
+        profiler.record('compute_strata', 0.5)
+        profiler.record('compute_strata', 0.25)
+        profiler.record('minimality', 1.0)
+        self.assertEqual(
+            {'compute_strata': 0.75, 'minimality': 1.0}, profiler.totals())
+
+    def test_to_json_should_return_one_object_per_line(self):
+        profiler = StageProfiler()
+        EarthMatrix([[1, 2], [2, 2]], profiler=profiler).detect_borders()
+        records = [json.loads(line)
+                   for line in profiler.to_json().splitlines()]
+        self.assertEqual(profiler.records, records)
+        self.assertEqual(5, len(records))
+
+    def test_clear_should_forget_records(self):
+        profiler = StageProfiler()
+        profiler.record('border_matrix', 0.1)
+        profiler.clear()
+        self.assertEqual([], profiler.records)
+
+    def test_from_buffer_should_accept_profiler(self):
+        profiler = StageProfiler()
+        EarthMatrix.from_buffer(
+            bytes([1, 2, 2, 2]), 2, 2, profiler=profiler).detect_borders()
+        self.assertEqual(
+            ['compute_strata', 'minimality', 'border_matrix'],
+            [record['stage'] for record in profiler.records])
+
+
+if __name__ == '__main__':
+    unittest.main()
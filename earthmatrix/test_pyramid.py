@@ -0,0 +1,69 @@
+import unittest
+
+import numpy as np
+
+from earthmatrix import EarthMatrixException
+from ndmatrix import NdEarthMatrix
+from pyramid import BorderPyramid
+
+
+class TestBorderPyramid(unittest.TestCase):
+    def setUp(self):
+        self.grid = np.random.RandomState(0).randint(0, 4, size=(37, 23))
+        self.borders = NdEarthMatrix(self.grid).detect_borders(as_array=True)
+        self.pyramid = BorderPyramid(self.grid, band_rows=8)
+
+    def test_get_level_should_min_pool_blocks_of_previous_level(self):
+        level = self.pyramid.get_level(1)
+        self.assertEqual((19, 12), level.shape)
+        self.assertEqual(self.grid[:2, :2].min(), level[0, 0])
+        self.assertEqual(self.grid[36:, 22:].min(), level[18, 11])
+        np.testing.assert_array_equal(
+            self.pyramid.get_level(2)[1, 1], level[2:4, 2:4].min())
+
+    def test_n_levels_should_count_levels_down_to_a_single_point(self):
+        self.assertEqual(7, self.pyramid.n_levels)
+        self.assertEqual((1, 1), self.pyramid.get_level(6).shape)
+
+    def test_detect_borders_should_cache_borders_of_each_level(self):
+        borders = self.pyramid.detect_borders(2)
+        np.testing.assert_array_equal(
+            NdEarthMatrix(self.pyramid.get_level(2)).detect_borders(), borders)
+        self.assertIs(borders, self.pyramid.detect_borders(2))
+        np.testing.assert_array_equal(
+            self.borders, self.pyramid.detect_borders(0))
+
+    def test_refine_should_match_full_resolution_borders(self):
+        for window in ((0, 0, 5, 5), (10, 3, 30, 9), (36, 22, 37, 23),
+                       (0, 0, 37, 23)):
+            x0, y0, x1, y1 = window
+            np.testing.assert_array_equal(
+                self.borders[x0:x1, y0:y1], self.pyramid.refine(*window))
+        self.assertIs(
+            self.pyramid.refine(10, 3, 30, 9),
+            self.pyramid.refine(10, 3, 30, 9))
+
+    def test_refine_should_follow_strata_crossing_the_window(self):
+        grid = np.full((40, 40), 5)
+        grid[:, 20] = 1
+        grid[39, 20] = 0
+        pyramid = BorderPyramid(grid)
+        np.testing.assert_array_equal(
+            np.zeros((2, 2)), pyramid.refine(0, 19, 2, 21))
+
+    def test_to_level_should_scale_coordinates(self):
+        self.assertEqual((4, 2), self.pyramid.to_level(17, 9, 2))
+
+    def test_should_raise_if_arguments_are_not_valid(self):
+        with self.assertRaises(EarthMatrixException):
+            BorderPyramid(self.grid, factor=1)
+        with self.assertRaises(EarthMatrixException):
+            self.pyramid.get_level(7)
+        with self.assertRaises(EarthMatrixException):
+            self.pyramid.refine(0, 0, 38, 5)
+        with self.assertRaises(EarthMatrixException):
+            self.pyramid.refine(3, 3, 3, 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
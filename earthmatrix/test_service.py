@@ -0,0 +1,213 @@
+import asyncio
+import json
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+import mock
+
+from earthmatrix import EarthMatrix, EarthMatrixException
+from gridio import dumps_grid, loads_borders
+from service import (
+    BINARY_TYPE, BorderService, ServiceBusyException, detect_borders_async,
+    serve)
+
+PHOTOGRAPH = [
+    [9, 2, 2, 2, 3, 5],
+    [9, 8, 3, 2, 4, 5],
+    [9, 7, 2, 2, 4, 3],
+    [9, 9, 2, 4, 4, 3],
+    [9, 2, 3, 4, 3, 5]]
+BORDERS = EarthMatrix(PHOTOGRAPH).detect_borders()
+
+
+class BlockingExecutor(ThreadPoolExecutor):
+    """
+    Thread pool whose tasks wait until release is set.
+    """
+    def __init__(self):
+        ThreadPoolExecutor.__init__(self, max_workers=4)
+        self.release = threading.Event()
+
+    def submit(self, function, *args):
+        def blocked():
+            self.release.wait(5)
+            return function(*args)
+        return ThreadPoolExecutor.submit(self, blocked)
+
+
+async def request(port, body, content_type='application/json',
+                  method='POST', path='/borders'):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write('{0} {1} HTTP/1.1\r\nContent-Type: {2}\r\n'
+                 'Content-Length: {3}\r\n\r\n'.format(
+                     method, path, content_type, len(body)).encode('ascii'))
+    writer.write(body)
+    response = await reader.read()
+    writer.close()
+    head, _, body = response.partition(b'\r\n\r\n')
+    return int(head.split(b' ')[1]), body
+
+
+class TestBorderService(unittest.TestCase):
+    def test_detect_borders_async_should_match_earthmatrix(self):
+        async def run():
+            async with BorderService(executor=ThreadPoolExecutor()) as service:
+                return await detect_borders_async(PHOTOGRAPH, service)
+        self.assertEqual(BORDERS, asyncio.run(run()))
+
+    def test_detect_borders_should_compute_in_worker_processes(self):
+        async def run():
+            async with BorderService(workers=1) as service:
+                return await service.detect_borders(PHOTOGRAPH)
+        self.assertEqual(BORDERS, asyncio.run(run()))
+
+    def test_detect_borders_should_compute_identical_requests_once(self):
+        executor = BlockingExecutor()
+
+        async def run():
+            service = BorderService(executor=executor)
+            requests = [asyncio.ensure_future(
+                service.detect_borders(PHOTOGRAPH)) for _ in range(5)]
+            await asyncio.sleep(0.01)
+            executor.release.set()
+            return service, await asyncio.gather(*requests)
+        service, results = asyncio.run(run())
+        self.assertEqual([BORDERS] * 5, results)
+        self.assertEqual(1, service.submitted)
+        self.assertEqual(4, service.coalesced)
+        self.assertEqual(0, service.stats()['inflight'])
+
+    def test_detect_borders_should_answer_followers_if_leader_cancelled(self):
+        executor = BlockingExecutor()
+
+        async def run():
+            service = BorderService(executor=executor)
+            leader = asyncio.ensure_future(service.detect_borders(PHOTOGRAPH))
+            await asyncio.sleep(0.01)
+            follower = asyncio.ensure_future(
+                service.detect_borders(PHOTOGRAPH))
+            await asyncio.sleep(0.01)
+            leader.cancel()
+            await asyncio.sleep(0.01)
+            executor.release.set()
+            with self.assertRaises(asyncio.CancelledError):
+                await leader
+            return service, await follower
+        service, result = asyncio.run(run())
+        self.assertEqual(BORDERS, result)
+        self.assertEqual((1, 1), (service.submitted, service.coalesced))
+        self.assertEqual(0, service.stats()['inflight'])
+
+    def test_detect_borders_should_cancel_computation_without_waiters(self):
+        executor = BlockingExecutor()
+
+        async def run():
+            service = BorderService(executor=executor, max_pending=1)
+            requests = [asyncio.ensure_future(
+                service.detect_borders([[altitude]])) for altitude in range(2)]
+            await asyncio.sleep(0.01)
+            for request in requests:
+                request.cancel()
+            await asyncio.sleep(0.01)
+            executor.release.set()
+            return service.stats()
+        self.assertEqual({'submitted': 1, 'coalesced': 0, 'inflight': 0,
+                          'queued': 0}, asyncio.run(run()))
+
+    def test_detect_borders_should_parse_and_hash_outside_event_loop(self):
+        threads = []
+
+        def content_key(matrix):
+            threads.append(threading.get_ident())
+            return 'key'
+
+        async def run():
+            service = BorderService(executor=ThreadPoolExecutor())
+            with mock.patch('service.content_key', content_key):
+                return await service.detect_borders(PHOTOGRAPH)
+        self.assertEqual(BORDERS, asyncio.run(run()))
+        self.assertEqual(1, len(threads))
+        self.assertNotEqual(threading.get_ident(), threads[0])
+
+    def test_detect_borders_should_reject_requests_above_max_queued(self):
+        executor = BlockingExecutor()
+
+        async def run():
+            service = BorderService(
+                executor=executor, max_pending=1, max_queued=1)
+            requests = [asyncio.ensure_future(
+                service.detect_borders([[altitude]])) for altitude in range(3)]
+            await asyncio.sleep(0.01)
+            executor.release.set()
+            return await asyncio.gather(*requests, return_exceptions=True)
+        results = asyncio.run(run())
+        self.assertEqual([[1]], results[0])
+        self.assertEqual([[1]], results[1])
+        self.assertIsInstance(results[2], ServiceBusyException)
+
+    def test_detect_borders_should_raise_if_points_are_not_valid(self):
+        async def run():
+            service = BorderService(executor=ThreadPoolExecutor())
+            await service.detect_borders([[1], [2, 3]])
+        with self.assertRaises(EarthMatrixException):
+            asyncio.run(run())
+
+
+class TestServe(unittest.TestCase):
+    def run_requests(self, *requests):
+        async def run():
+            service = BorderService(executor=ThreadPoolExecutor())
+            server = await serve(service, port=0)
+            port = server.sockets[0].getsockname()[1]
+            try:
+                return [await request(port, *arguments)
+                        for arguments in requests]
+            finally:
+                server.close()
+                await server.wait_closed()
+        return asyncio.run(run())
+
+    def test_serve_should_answer_json_photographs(self):
+        (status, body), = self.run_requests(
+            (json.dumps({'points': PHOTOGRAPH}).encode('utf-8'),))
+        self.assertEqual(200, status)
+        self.assertEqual({'borders': BORDERS}, json.loads(body.decode()))
+
+    def test_serve_should_answer_grid_photographs_with_border_masks(self):
+        (status, body), = self.run_requests(
+            (dumps_grid(PHOTOGRAPH), BINARY_TYPE))
+        self.assertEqual(200, status)
+        self.assertEqual(BORDERS, loads_borders(body))
+
+    def test_serve_should_close_connections_with_worker_processes(self):
+        async def run():
+            async with BorderService(workers=2) as service:
+                server = await serve(service, port=0)
+                port = server.sockets[0].getsockname()[1]
+                try:
+                    return [await asyncio.wait_for(request(
+                        port, dumps_grid(PHOTOGRAPH), BINARY_TYPE), 30)
+                        for _ in range(2)]
+                finally:
+                    server.close()
+                    await server.wait_closed()
+        for status, body in asyncio.run(run()):
+            self.assertEqual(200, status)
+            self.assertEqual(BORDERS, loads_borders(body))
+
+    def test_serve_should_answer_errors(self):
+        responses = self.run_requests(
+            (b'[[1], [2, 3]]',), (b'not json',), (b'[[1]]', 'text/plain'),
+            (b'', 'application/json', 'GET'),
+            (b'[[1]]', 'application/json', 'POST', '/other'))
+        self.assertEqual(
+            [400, 400, 415, 405, 404],
+            [status for status, _ in responses])
+        self.assertEqual(
+            {'error': "'points' lists must have same length"},
+            json.loads(responses[0][1].decode()))
+
+
+if __name__ == '__main__':
+    unittest.main()
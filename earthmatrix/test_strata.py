@@ -0,0 +1,42 @@
+import unittest
+
+from earthmatrix import EarthMatrix
+from strata import StratumSummary
+
+
+class TestStrataTable(unittest.TestCase):
+    def setUp(self):
+        self.table = EarthMatrix([
+            [1, 1, 2],
+            [3, 1, 2],
+            [3, 3, 0]]).get_strata()
+
+    def test_getitem_should_summarize_stratum(self):
+        self.assertEqual(
+            StratumSummary(0, 1, 3, (0, 0, 1, 1), True, 8), self.table[0])
+        self.assertEqual(
+            StratumSummary(3, 0, 1, (2, 2, 2, 2), True, 4), self.table[3])
+
+    def test_getitem_should_raise_if_stratum_does_not_exist(self):
+        with self.assertRaises(IndexError):
+            self.table[4]
+
+    def test_iter_should_return_summaries_in_stratum_order(self):
+        self.assertEqual(
+            [0, 1, 2, 3], [summary.stratum for summary in self.table])
+        self.assertEqual(9, sum(summary.count for summary in self.table))
+
+    def test_stratum_at_should_return_label_of_point(self):
+        self.assertEqual(2, self.table.stratum_at(2, 1))
+        with self.assertRaises(IndexError):
+            self.table.stratum_at(3, 0)
+
+    def test_select_should_return_strata_matching_all_conditions(self):
+        self.assertEqual([0, 3], self.table.select(is_border=True))
+        self.assertEqual([0, 2], self.table.select(min_count=3))
+        self.assertEqual(
+            [1], self.table.select(is_border=False, max_count=2))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,186 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from earthmatrix import EarthMatrixException
+from ndmatrix import NdEarthMatrix
+from tiled import (
+    Band, Checkpoint, SeamMerger, detect_borders_tiled, iter_border_bands)
+
+
+class CrashingGrid(object):
+    """
+    Grid that raises after a number of band reads, as a crashed run would
+    stop.
+    """
+    def __init__(self, grid, reads):
+        self.grid = grid
+        self.reads = reads
+
+    def __len__(self):
+        return len(self.grid)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            if not self.reads:
+                raise RuntimeError('crash')
+            self.reads -= 1
+        return self.grid[index]
+
+
+class TestDetectBordersTiled(unittest.TestCase):
+    def test_detect_borders_tiled_should_match_in_memory_detection(self):
+        generator = np.random.RandomState(3)
+        for _ in range(40):
+            shape = generator.randint(1, 15, size=2)
+            grid = generator.randint(0, 3, size=shape)
+            expected = NdEarthMatrix(grid).detect_borders(as_array=True)
+            for band_rows in (1, 2, 3, 7):
+                np.testing.assert_array_equal(
+                    expected, detect_borders_tiled(grid, band_rows=band_rows))
+
+    def test_detect_borders_tiled_should_join_strata_snaking_across_bands(self):
+        grid = np.array([
+            [1, 1, 1, 9],
+            [9, 9, 1, 9],
+            [1, 1, 1, 9],
+            [1, 9, 9, 9],
+            [1, 1, 1, 0]])
+        np.testing.assert_array_equal(
+            NdEarthMatrix(grid).detect_borders(as_array=True),
+            detect_borders_tiled(grid, band_rows=1))
+
+    def test_detect_borders_tiled_should_write_into_out(self):
+        grid = np.array([
+            [5, 5, 5],
+            [5, 9, 5]])
+        out = np.zeros((2, 3), dtype=np.uint8)
+        self.assertIs(out, detect_borders_tiled(grid, out, band_rows=1))
+        np.testing.assert_array_equal([[1, 1, 1], [1, 0, 1]], out)
+
+    def test_detect_borders_tiled_should_read_lists_of_lists(self):
+        photograph = [
+            [9, 2, 2, 2, 3, 5],
+            [9, 8, 3, 2, 4, 5],
+            [9, 7, 2, 2, 4, 3],
+            [9, 9, 2, 4, 4, 3],
+            [9, 2, 3, 4, 3, 5]]
+        self.assertEqual(
+            NdEarthMatrix(photograph).detect_borders(),
+            detect_borders_tiled(photograph, band_rows=2).tolist())
+
+    def test_iter_border_bands_should_yield_bands_in_order(self):
+        grid = np.zeros((5, 2), dtype=int)
+        starts = [start for start, _ in iter_border_bands(grid, 2)]
+        self.assertEqual([0, 2, 4], starts)
+
+    def test_iter_border_bands_should_raise_if_band_rows_not_positive(self):
+        with self.assertRaises(EarthMatrixException) as context:
+            list(iter_border_bands(np.zeros((2, 2)), 0))
+        self.assertEqual("'band_rows' must be a positive number",
+                         str(context.exception))
+
+
+
+class TestCheckpoint(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'borders.checkpoint')
+        self.grid = np.random.RandomState(5).randint(0, 3, size=(23, 9))
+        self.expected = detect_borders_tiled(self.grid, band_rows=2)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_resume_should_match_uninterrupted_run_after_any_crash(self):
+        for reads in range(1, 24):
+            out = np.zeros(self.grid.shape, dtype=np.uint8)
+            with self.assertRaises(RuntimeError):
+                detect_borders_tiled(CrashingGrid(self.grid, reads), out,
+                                     band_rows=2, checkpoint=self.path)
+            self.assertTrue(os.path.exists(self.path))
+            result = detect_borders_tiled(
+                self.grid, out, band_rows=2, checkpoint=self.path)
+            self.assertEqual(self.expected.tobytes(), result.tobytes())
+            self.assertFalse(os.path.exists(self.path))
+
+    def test_resume_should_skip_bands_already_done(self):
+        out = np.zeros(self.grid.shape, dtype=np.uint8)
+        with self.assertRaises(RuntimeError):
+            detect_borders_tiled(CrashingGrid(self.grid, 16), out,
+                                 band_rows=2, checkpoint=self.path)
+        grid = CrashingGrid(self.grid, 8)
+        detect_borders_tiled(grid, out, band_rows=2, checkpoint=self.path)
+        self.assertEqual(self.expected.tobytes(), out.tobytes())
+        self.assertEqual(0, grid.reads)
+
+    def test_resume_should_write_all_rows_if_out_is_not_given(self):
+        with self.assertRaises(RuntimeError):
+            detect_borders_tiled(CrashingGrid(self.grid, 15), band_rows=2,
+                                 checkpoint=self.path)
+        np.testing.assert_array_equal(self.expected, detect_borders_tiled(
+            self.grid, band_rows=2, checkpoint=self.path))
+
+    def test_load_should_raise_if_checkpoint_is_for_another_grid(self):
+        Checkpoint(self.path, self.grid, 2).save('write', 0)
+        with self.assertRaises(EarthMatrixException):
+            detect_borders_tiled(self.grid, band_rows=3,
+                                 checkpoint=self.path)
+
+    def test_load_should_raise_if_checkpoint_is_for_other_altitudes(self):
+        Checkpoint(self.path, self.grid, 2).save('write', 0)
+        for changed in (self.grid + 1, self.grid.astype(np.float64)):
+            with self.assertRaises(EarthMatrixException):
+                detect_borders_tiled(changed, band_rows=2,
+                                     checkpoint=self.path)
+
+    def test_state_should_rebuild_equivalent_merger(self):
+        bands = [Band(0, np.array([[1, 2]]), np.array([[True, True]])),
+                 Band(1, np.array([[1, 3]]), np.array([[False, True]])),
+                 Band(2, np.array([[3, 3]]), np.array([[True, True]]))]
+        seams = SeamMerger()
+        for band in bands[:2]:
+            seams.add_band(band)
+        seams = SeamMerger.from_state(seams.get_state())
+        seams.add_band(bands[2])
+        np.testing.assert_array_equal(
+            [False, True, False, True, True], seams.resolve())
+
+
+class TestBand(unittest.TestCase):
+    def test_read_should_use_neighbor_rows_to_compute_minimum(self):
+        band = Band.read(np.array([
+            [0, 0],
+            [1, 1],
+            [2, 2]]), 1, 2)
+        np.testing.assert_array_equal([[0, 0]], band.labels)
+        np.testing.assert_array_equal([False], band.flags)
+
+    def test_band_should_record_strata_touching_first_and_last_rows(self):
+        band = Band(0, np.array([
+            [1, 2],
+            [3, 3],
+            [4, 2]]), np.ones((3, 2), dtype=bool))
+        np.testing.assert_array_equal([0, 1, 3, 4], band.seam_labels)
+
+
+class TestSeamMerger(unittest.TestCase):
+    def test_resolve_should_combine_flags_of_joined_strata(self):
+        seams = SeamMerger()
+        seams.add_band(Band(0, np.array([[1, 2]]), np.array([[True, True]])))
+        seams.add_band(Band(1, np.array([[1, 3]]), np.array([[False, True]])))
+        np.testing.assert_array_equal(
+            [False, True, False, True], seams.resolve())
+
+    def test_add_band_should_raise_if_bands_have_different_width(self):
+        seams = SeamMerger()
+        seams.add_band(Band(0, np.array([[1, 2]]), np.ones((1, 2), bool)))
+        with self.assertRaises(EarthMatrixException):
+            seams.add_band(Band(1, np.array([[1]]), np.ones((1, 1), bool)))
+
+
+if __name__ == '__main__':
+    unittest.main()
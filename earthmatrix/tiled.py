@@ -0,0 +1,301 @@
+"""
+Streaming border detection for photographs too large to be held in memory
+at once. The altitudes are read in bands of consecutive rows, so any 2-D
+object that can be sliced by rows works as input, e.g. a NumPy memmap.
+
+Strata are labeled per band. Strata crossing the seam between two bands are
+joined with a union-find over the labels of the rows next to the seam, and
+their "all points minimum" flags are combined across bands. A second sweep
+then labels every band again and writes its border mask, so peak memory is
+bounded by the size of a band plus one label per stratum touching a seam.
+
+That seam state is also all a run needs to be resumed, so detect_borders_tiled
+can save it every few bands to a checkpoint file (see Checkpoint) and pick up
+from the last saved band after a crash, with the same result as a run that
+was never interrupted.
+"""
+import hashlib
+import os
+import tempfile
+
+import numpy as np
+
+from earthmatrix import EarthMatrixException
+from ndmatrix import label_strata, minimum_mask, union_pairs
+
+DEFAULT_BAND_ROWS = 1024
+
+
+def detect_borders_tiled(grid, out=None, band_rows=DEFAULT_BAND_ROWS,
+                         checkpoint=None, checkpoint_bands=1):
+    """
+    Detect the borders of grid band by band.
+    :param grid: 2-D array-like of altitudes supporting row slicing.
+    :param out: 2-D array-like the border mask is written to band by band,
+    e.g. a NumPy memmap. A new uint8 array is allocated if not given.
+    :param band_rows: number of rows read at once.
+    :param checkpoint: path of a file the progress is saved to every
+    checkpoint_bands bands. If the file exists, detection resumes from the
+    progress it holds, and it is removed once the borders are complete.
+    Rows already written are only skipped on resume if out is given, since
+    they are kept there, e.g. in a memmap that is flushed before every save.
+    :return: out.
+    """
+    if checkpoint is not None:
+        return _detect_borders_checkpointed(
+            grid, out, band_rows, Checkpoint(checkpoint, grid, band_rows),
+            checkpoint_bands)
+    for start, borders in iter_border_bands(grid, band_rows):
+        out = _write_band(grid, out, start, borders)
+    return out
+
+
+def iter_border_bands(grid, band_rows=DEFAULT_BAND_ROWS):
+    """
+    Detect the borders of grid band by band.
+    :return: iterator of tuples (first row, uint8 border mask of the band).
+    """
+    _check_grid(grid, band_rows)
+    seams = SeamMerger()
+    for band in _iter_bands(grid, band_rows):
+        seams.add_band(band)
+    flags = seams.resolve()
+    offset = 0
+    for band in _iter_bands(grid, band_rows):
+        is_border = band.flags
+        is_border[band.seam_labels] = flags[
+            offset:offset + len(band.seam_labels)]
+        offset += len(band.seam_labels)
+        yield band.start, is_border[band.labels].view(np.uint8)
+
+
+class Band(object):
+    """
+    Strata of a band of rows of a photograph: stratum labels of its points,
+    whether each stratum has all its points minimum and the labels of the
+    strata touching its first or last row.
+    """
+    def __init__(self, start, altitudes, minimum):
+        self.start = start
+        self.labels, n_strata = label_strata(altitudes)
+        self.flags = np.bincount(
+            self.labels[~minimum], minlength=n_strata) == 0
+        self.first_row = altitudes[0].copy()
+        self.last_row = altitudes[-1].copy()
+        self.seam_labels = np.unique(
+            np.concatenate((self.labels[0], self.labels[-1])))
+
+    @classmethod
+    def read(cls, grid, start, stop):
+        """
+        Read and label rows [start, stop) of grid. The rows next to the band
+        are read as well to tell whether its outer points are minimum.
+        """
+        above = 1 if start > 0 else 0
+        below = 1 if stop < len(grid) else 0
+        altitudes = np.ascontiguousarray(grid[start - above:stop + below])
+        if altitudes.ndim != 2:
+            raise EarthMatrixException("'points' must be a list of lists")
+        if altitudes.dtype.kind not in 'biuf':
+            raise EarthMatrixException("'points' altitudes must be numbers")
+        minimum = minimum_mask(altitudes)[above:len(altitudes) - below]
+        return cls(start, altitudes[above:len(altitudes) - below], minimum)
+
+
+class SeamMerger(object):
+    """
+    Joins the strata that cross the seams between consecutive bands and
+    combines their flags. Bands must be added in order.
+    """
+    def __init__(self):
+        self._flags = []
+        self._first = []
+        self._second = []
+        self._n_ids = 0
+        self._last_row = None
+        self._last_ids = None
+
+    def add_band(self, band):
+        """
+        Give consecutive global ids to the seam strata of band and join them
+        with the strata of the previous band they touch.
+        """
+        first_ids = self._get_ids(band, band.labels[0])
+        last_ids = self._get_ids(band, band.labels[-1])
+        if self._last_row is not None:
+            if len(self._last_row) != len(band.first_row):
+                raise EarthMatrixException(
+                    "'points' lists must have same length")
+            joined = self._last_row == band.first_row
+            self._first.append(self._last_ids[joined])
+            self._second.append(first_ids[joined])
+        self._flags.append(band.flags[band.seam_labels])
+        self._n_ids += len(band.seam_labels)
+        self._last_row, self._last_ids = band.last_row, last_ids
+
+    def resolve(self):
+        """
+        :return: array telling for each global id whether all the points of
+        its (joined) stratum are minimum.
+        """
+        if not self._n_ids:
+            return np.ones(0, dtype=bool)
+        roots = union_pairs(
+            self._n_ids,
+            np.concatenate(self._first or [np.empty(0, dtype=int)]),
+            np.concatenate(self._second or [np.empty(0, dtype=int)]))
+        flags = np.concatenate(self._flags)
+        not_minimum = np.bincount(roots[~flags], minlength=self._n_ids)
+        return (not_minimum == 0)[roots]
+
+    def get_state(self):
+        """
+        :return: dict of arrays from which from_state rebuilds the merger:
+        the flags of the global ids, the union-find parent table of their
+        joins and the last row of the last band added, with its ids.
+        """
+        return {
+            'n_ids': np.array(self._n_ids),
+            'flags': np.concatenate(self._flags or [np.ones(0, dtype=bool)]),
+            'parents': union_pairs(
+                self._n_ids,
+                np.concatenate(self._first or [np.empty(0, dtype=int)]),
+                np.concatenate(self._second or [np.empty(0, dtype=int)])),
+            'last_row': self._last_row, 'last_ids': self._last_ids}
+
+    @classmethod
+    def from_state(cls, state):
+        """
+        Rebuild a merger saved by get_state, to keep adding bands to it.
+        """
+        merger = cls()
+        merger._n_ids = int(state['n_ids'])
+        merger._flags = [state['flags']]
+        joined = np.flatnonzero(
+            state['parents'] != np.arange(merger._n_ids))
+        merger._first = [joined]
+        merger._second = [state['parents'][joined]]
+        merger._last_row = state['last_row']
+        merger._last_ids = state['last_ids']
+        return merger
+
+    def _get_ids(self, band, labels):
+        return self._n_ids + np.searchsorted(band.seam_labels, labels)
+
+
+class Checkpoint(object):
+    """
+    Progress of detect_borders_tiled over a grid, saved as a NumPy .npz file.
+    While bands are labeled it holds the row the next band starts at and the
+    state of the SeamMerger; once all of them are, the resolved flags of the
+    seam strata and the rows of the border mask already written. Files are
+    replaced atomically so a crash while saving keeps the previous save.
+    The grid is recognized by its shape, its dtype and a hash of its first
+    and last rows, which catches most other grids without reading them.
+    """
+    def __init__(self, path, grid, band_rows):
+        self.path = path
+        digest = hashlib.blake2b(digest_size=16)
+        for row in (grid[0], grid[len(grid) - 1]):
+            row = np.ascontiguousarray(row)
+            digest.update(row.dtype.str.encode('ascii'))
+            digest.update(row)
+        self._signature = np.concatenate((
+            [len(grid), len(grid[0]), band_rows],
+            np.frombuffer(digest.digest(), dtype=np.uint8)))
+
+    def load(self):
+        """
+        :return: dict with the saved arrays, or None if nothing was saved.
+        """
+        if not os.path.exists(self.path):
+            return None
+        with np.load(self.path, allow_pickle=False) as saved:
+            state = dict(saved)
+        if not np.array_equal(state.pop('signature'), self._signature):
+            raise EarthMatrixException(
+                "checkpoint '{0}' was saved for another grid or band size"
+                .format(self.path))
+        return state
+
+    def save(self, phase, next_start, **arrays):
+        """
+        :param phase: 'label' or 'write'.
+        :param next_start: first row of the next band of the phase.
+        """
+        descriptor, path = tempfile.mkstemp(
+            dir=os.path.dirname(os.path.abspath(self.path)))
+        with os.fdopen(descriptor, 'wb') as output:
+            np.savez(output, signature=self._signature, phase=phase,
+                     next_start=next_start, **arrays)
+        os.replace(path, self.path)
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def _detect_borders_checkpointed(grid, out, band_rows, checkpoint,
+                                 checkpoint_bands):
+    _check_grid(grid, band_rows)
+    if checkpoint_bands < 1:
+        raise EarthMatrixException(
+            "'checkpoint_bands' must be a positive number")
+    n_rows = len(grid)
+    state = checkpoint.load()
+    if state is None or state['phase'] == 'label':
+        if state is None:
+            seams, first = SeamMerger(), 0
+        else:
+            seams = SeamMerger.from_state(state)
+            first = int(state['next_start'])
+        for index, start in enumerate(range(first, n_rows, band_rows), 1):
+            stop = min(start + band_rows, n_rows)
+            seams.add_band(Band.read(grid, start, stop))
+            if index % checkpoint_bands == 0 and stop < n_rows:
+                checkpoint.save('label', stop, **seams.get_state())
+        flags = seams.resolve()
+        first = offset = 0
+        checkpoint.save('write', 0, offset=0, resolved=flags)
+    else:
+        flags = state['resolved']
+        first, offset = 0, 0
+        if out is not None:
+            first, offset = int(state['next_start']), int(state['offset'])
+    keeps_rows = out is not None
+    for index, start in enumerate(range(first, n_rows, band_rows), 1):
+        stop = min(start + band_rows, n_rows)
+        band = Band.read(grid, start, stop)
+        is_border = band.flags
+        is_border[band.seam_labels] = flags[
+            offset:offset + len(band.seam_labels)]
+        offset += len(band.seam_labels)
+        out = _write_band(
+            grid, out, start, is_border[band.labels].view(np.uint8))
+        if keeps_rows and index % checkpoint_bands == 0 and stop < n_rows:
+            if hasattr(out, 'flush'):
+                out.flush()
+            checkpoint.save('write', stop, offset=offset, resolved=flags)
+    if hasattr(out, 'flush'):
+        out.flush()
+    checkpoint.remove()
+    return out
+
+
+def _check_grid(grid, band_rows):
+    if band_rows < 1:
+        raise EarthMatrixException("'band_rows' must be a positive number")
+    if not len(grid):
+        raise EarthMatrixException("'points' must be a non empty list")
+
+
+def _write_band(grid, out, start, borders):
+    if out is None:
+        out = np.empty((len(grid), borders.shape[1]), dtype=np.uint8)
+    out[start:start + len(borders)] = borders
+    return out
+
+
+def _iter_bands(grid, band_rows):
+    for start in range(0, len(grid), band_rows):
+        yield Band.read(grid, start, min(start + band_rows, len(grid)))